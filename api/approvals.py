@@ -0,0 +1,121 @@
+"""
+Queued approvals for the Blood Bank Management System.
+
+In queued mode (APPROVAL_QUEUE = True, or a request sent with `Prefer: respond-async`) approve_request doesn't
+fulfill the request inside the HTTP worker. It inserts an ApprovalJob and answers 202 Accepted with the job id, a
+write that holds the SQLite write lock for one short insert instead of the whole approval. The approval_job view
+reports the job's outcome once a worker has run it.
+
+1. wants_queued_approval / enqueue_approval: Whether approve_request queues, and queueing the approval of a request.
+2. process_approval_batch: Runs up to batch_size queued jobs, oldest first, in one transaction: it claims them with
+   one UPDATE (which takes the write lock, so two workers never claim the same job), fulfills each one with
+   fulfill_request (each in its own savepoint, so a job that fails rolls back alone) and stores the outcomes. One
+   commit covers the whole batch. If the worker dies halfway, the claim rolls back too and the jobs stay queued.
+3. ApprovalWorker: `manage.py process_approvals`. A pool of threads (or with one thread, the calling thread) each
+   running process_approval_batch until the queue is empty, then polling it every poll_interval seconds. SQLite still
+   commits one batch at a time; the threads overlap the Python side of one batch with another's wait for the lock.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Subquery
+from django.utils import timezone
+
+from .blood_types import blood_type_registry
+from .inventory import InsufficientStock, RequestNotPending, fulfill_request
+from .models import ApprovalJob
+
+logger = logging.getLogger(__name__)
+
+APPROVAL_BATCH_SIZE = 100
+WORKER_POLL_INTERVAL = 0.5
+
+
+def wants_queued_approval(request):
+    return settings.APPROVAL_QUEUE or 'respond-async' in request.headers.get('Prefer', '').lower()
+
+
+def enqueue_approval(blood_request, user):
+    return ApprovalJob.objects.create(blood_request=blood_request, requested_by=user)
+
+
+def _run(job):  # (outcome, message), the same messages approve_request answers with
+    try:
+        fulfill_request(job.blood_request)
+    except RequestNotPending:
+        return ApprovalJob.ALREADY_FULFILLED, "Request is already fulfilled"
+    except InsufficientStock:
+        blood_type_name = blood_type_registry.get_name(job.blood_request.blood_type_id)
+        return ApprovalJob.INSUFFICIENT_STOCK, f"Not enough units of {blood_type_name} in inventory"
+    return ApprovalJob.APPROVED, "Request successfully approved"
+
+
+def process_approval_batch(batch_size=APPROVAL_BATCH_SIZE):  # Returns the number of jobs run
+    with transaction.atomic():
+        queued = ApprovalJob.objects.filter(status=ApprovalJob.QUEUED).order_by('id').values('id')[:batch_size]
+        if not ApprovalJob.objects.filter(id__in=Subquery(queued)).update(status=ApprovalJob.RUNNING):
+            return 0
+
+        jobs = list(ApprovalJob.objects.filter(status=ApprovalJob.RUNNING).select_related('blood_request')
+                    .order_by('id'))
+        finished_at = timezone.now()
+        for job in jobs:
+            job.outcome, job.message = _run(job)
+            job.status = ApprovalJob.DONE
+            job.finished_at = finished_at
+        ApprovalJob.objects.bulk_update(jobs, ['status', 'outcome', 'message', 'finished_at'])
+    return len(jobs)
+
+
+class ApprovalWorker:
+    def __init__(self, threads, batch_size=APPROVAL_BATCH_SIZE, poll_interval=WORKER_POLL_INTERVAL):
+        self.threads = threads
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.processed = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self, until_empty=False):  # Blocks until stop() is called, or with until_empty once the queue is empty
+        if self.threads <= 1:  # In the calling thread, on its connection
+            self._work(until_empty)
+            return self.processed
+
+        workers = [threading.Thread(target=self._thread, args=(until_empty,), name=f'approval-worker-{index}')
+                   for index in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:  # Lets every thread commit or roll back its batch first
+            self.stop()
+            for worker in workers:
+                worker.join()
+        return self.processed
+
+    def stop(self):
+        self._stop.set()
+
+    def _thread(self, until_empty):
+        try:
+            self._work(until_empty)
+        finally:
+            connection.close()  # The thread's own connection
+
+    def _work(self, until_empty):
+        while not self._stop.is_set():
+            try:
+                processed = process_approval_batch(self.batch_size)
+            except DatabaseError:
+                logger.exception("Processing approval jobs failed")
+                processed = 0
+            with self._lock:
+                self.processed += processed
+            if not processed and until_empty:
+                return
+            if processed < self.batch_size:  # Caught up: let jobs pile up into a bigger batch, one commit for all
+                self._stop.wait(self.poll_interval)
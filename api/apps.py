@@ -1,6 +1,25 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401  Registers the signal handlers
+        from .database import apply_sqlite_pragmas
+        from .timing import install_query_timer
+
+        connection_created.connect(apply_sqlite_pragmas)
+        connection_created.connect(install_query_timer)
+        for connection in connections.all(initialized_only=True):  # Opened before the app was ready
+            if connection.connection is not None:
+                apply_sqlite_pragmas(connection)
+            install_query_timer(connection)
+
+        if getattr(settings, 'TOKEN_COMPACTION_INTERVAL', None):
+            from .tokens import TokenCompactor
+            TokenCompactor(settings.TOKEN_COMPACTION_INTERVAL).start()
@@ -0,0 +1,180 @@
+"""
+Native async versions of the read endpoints, for serving through bloodbank/asgi.py.
+
+Under ASGI the DRF views in views.py each run in a worker thread through sync_to_async. The views here are coroutines
+instead: the JWT is checked with CachedJWTAuthentication's aauthenticate and rows are read with the async ORM. Their
+responses are the same as the sync views' (same JSON bytes, same status codes, same errors).
+
+1. get_blood_inventory: Same as views.get_blood_inventory.
+2. get_all_donors: Same as views.get_all_donors, including ?q= and ?pagination=cursor.
+3. view_all_bloodrequest: Same as views.view_all_bloodrequest, including ?q= and ?pagination=cursor.
+4. inventory_stream: Server-Sent Events stream of the inventory levels (see streams.py), for clients that would
+   otherwise poll get_blood_inventory. Async only: every open stream is a coroutine waiting on the broadcaster, not a
+   thread.
+"""
+
+import functools
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import Paginator
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+
+from .authentication import CachedJWTAuthentication
+from .database import read_only
+from .models import BloodDonor, BloodInventory, BloodRequest
+from .pagination import KeysetPaginator, InvalidCursor, is_cursor_request, get_page_size, wants_count
+from .serializers import BloodInventoryValuesSerializer, BloodRequestValuesSerializer, DonorValuesSerializer
+from .streams import InventoryStream, inventory_broadcaster
+from .timing import TimedJSONRenderer
+from .views import filter_blood_requests, filter_donors
+
+authentication = CachedJWTAuthentication()
+
+
+def json_response(data, status_code=status.HTTP_200_OK):  # Rendered by the same JSONRenderer as Response
+    return HttpResponse(TimedJSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def async_api_view(http_method_names):  # Async counterpart of @api_view + @permission_classes([IsAuthenticated])
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                user_auth_tuple = await authentication.aauthenticate(request)
+                if user_auth_tuple is None:
+                    raise NotAuthenticated()
+            except APIException as exc:
+                response = json_response(exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail},
+                                         status.HTTP_401_UNAUTHORIZED)
+                response['WWW-Authenticate'] = authentication.authenticate_header(request)
+                return response
+
+            request.user, request.auth = user_auth_tuple
+            if request.method not in http_method_names:  # Checked after authentication, as DRF does
+                return json_response({'detail': f'Method "{request.method}" not allowed.'},
+                                     status.HTTP_405_METHOD_NOT_ALLOWED)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def paginate(queryset, page, per_page, columns):
+    # Paginator.get_page, with the COUNT and the page read done async. Only `columns` of the page are read
+    paginator = Paginator(range(await queryset.acount()), per_page)
+    page_number = paginator.get_page(page).number
+    offset = (page_number - 1) * per_page
+    return paginator, page_number, [row async for row in queryset[offset:offset + per_page].values_list(*columns)]
+
+
+@read_only
+@async_api_view(['GET'])
+async def get_blood_inventory(request):
+    columns = BloodInventoryValuesSerializer.columns()
+    blood_inventory = [row async for row in BloodInventory.objects.values_list(*columns)]
+    serializer = BloodInventoryValuesSerializer(blood_inventory)
+    return json_response(serializer.data)
+
+
+@read_only
+@async_api_view(['GET'])
+async def get_all_donors(request):
+    if request.user.is_staff:
+        page = request.GET.get('page', 1)
+        query = request.GET.get('q', '')
+        donors_list = BloodDonor.objects.all()
+
+        if query:  # The blood type registry may have to load, which is a sync query
+            donors_list = await sync_to_async(filter_donors)(donors_list, query)
+
+        if is_cursor_request(request):
+            try:
+                columns = DonorValuesSerializer.columns('last_donated', 'id')
+                keyset_page = await KeysetPaginator(donors_list.values_list(*columns), ('-last_donated', '-id'),
+                                                    get_page_size(request), columns).aget_page(
+                    request.GET.get('cursor'))
+            except InvalidCursor:
+                return json_response({'error': 'Invalid cursor'}, status.HTTP_400_BAD_REQUEST)
+
+            serializer = DonorValuesSerializer(keyset_page.object_list)
+            json_data = {
+                'donors': serializer.data,
+                'next': keyset_page.next_cursor,
+                'previous': keyset_page.previous_cursor,
+            }
+            if wants_count(request):
+                json_data['total_donors'] = await donors_list.acount()
+            return json_response(json_data)
+
+        donor_paginator, page_number, donors = await paginate(donors_list.order_by("-last_donated"), page, 5,
+                                                              DonorValuesSerializer.columns())
+
+        serializer = DonorValuesSerializer(donors)
+        json_data = {
+            'donors': serializer.data,
+            'total_donors': donor_paginator.count,
+            'page': page_number,
+            'total_pages': donor_paginator.num_pages
+        }
+        return json_response(json_data)
+    else:
+        return json_response({"message": "List of donors can only be viewed by admin"}, status.HTTP_403_FORBIDDEN)
+
+
+@read_only
+@async_api_view(['GET'])
+async def view_all_bloodrequest(request):
+    if request.user.is_staff:
+        page = request.GET.get('page', 1)
+        query = request.GET.get('q', '')
+        request_list = BloodRequest.objects.order_by('id')
+
+        if query:
+            try:
+                request_list = filter_blood_requests(request_list, query)
+            except ValueError as e:
+                return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+        if is_cursor_request(request):
+            try:
+                columns = BloodRequestValuesSerializer.columns()
+                keyset_page = await KeysetPaginator(request_list.values_list(*columns), ('id',),
+                                                    get_page_size(request), columns).aget_page(
+                    request.GET.get('cursor'))
+            except InvalidCursor:
+                return json_response({'error': 'Invalid cursor'}, status.HTTP_400_BAD_REQUEST)
+
+            serializer = BloodRequestValuesSerializer(keyset_page.object_list)
+            json_data = {
+                'blood_requests': serializer.data,
+                'next': keyset_page.next_cursor,
+                'previous': keyset_page.previous_cursor,
+            }
+            if wants_count(request):
+                json_data['total_request'] = await request_list.acount()
+            return json_response(json_data)
+
+        blood_request_paginator, page_number, blood_requests = await paginate(
+            request_list, page, 5, BloodRequestValuesSerializer.columns())
+
+        serializer = BloodRequestValuesSerializer(blood_requests)
+        json_data = {
+            'blood_requests': serializer.data,
+            'total_request': blood_request_paginator.count,
+            'page': page_number,
+            'total_pages': blood_request_paginator.num_pages
+        }
+        return json_response(json_data)
+    else:
+        return json_response({
+            "message": "list of blood request can only be viewed by admin"}, status.HTTP_403_FORBIDDEN)
+
+
+@async_api_view(['GET'])
+async def inventory_stream(request):  # Ends when the access token expires, the client reconnects with a new one
+    stream = InventoryStream(inventory_broadcaster, expires_at=request.auth.get('exp'))
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keeps nginx from buffering the events
+    return response
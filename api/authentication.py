@@ -0,0 +1,139 @@
+"""
+Authentication classes for the Blood Bank Management System API.
+
+1. AsyncJWTAuthentication: simplejwt's JWTAuthentication with an `aauthenticate` coroutine for the native async views.
+   Decoding and validating the token needs no I/O, so that part is shared; only loading the user goes through the
+   async ORM.
+2. CachedJWTAuthentication: The project's default authentication class. Takes the user id from the signed token and
+   the user row from a small per-process cache (UserCache), so most requests don't query auth_user at all.
+
+Cached users expire after UserCache.ttl seconds. Saving or deleting a User (see signals.py) drops its entry straight
+away, so deactivation and staff changes made in this process apply on the next request, and stores a new generation
+token in the shared default cache: every other process compares it with the generation it cached its users under (at
+most once every generation_check_interval seconds) and drops all of them when it changed. QuerySet.update() sends no
+signal; users changed that way are only picked up when their entries expire, unless user_cache.invalidate() is called
+for them. is_staff is read from the cached row rather than from a token claim, because a claim would stay valid for
+the token's whole lifetime after staff rights were taken away.
+"""
+
+import copy
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+GENERATION_CACHE_KEY = 'api:users:generation'
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):  # Same checks as JWTAuthentication.get_user
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+class UserCache:
+    ttl = 30  # Seconds
+    max_size = 1024
+    generation_check_interval = 1.0  # Seconds between looks at the shared generation token
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # {user_id: (expires_at, user)}, oldest first
+        self._generation = None
+        self._checked_at = 0.0
+
+    def _check_generation(self, force=False):  # Drops every entry once another process changed a user
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.generation_check_interval:
+            return
+        generation = cache.get(GENERATION_CACHE_KEY)
+        self._checked_at = now
+        if generation != self._generation:
+            with self._lock:
+                self._entries.clear()
+                self._generation = generation
+
+    def get(self, user_id):
+        self._check_generation()
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return copy.copy(entry[1])  # Every request gets its own instance
+
+    def set(self, user_id, user):
+        self._check_generation(force=True)  # A miss already ran a query, the user is cached under the latest generation
+        with self._lock:
+            self._entries.pop(user_id, None)
+            if len(self._entries) >= self.max_size:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[user_id] = (time.monotonic() + self.ttl, copy.copy(user))
+
+    def invalidate(self, user_id):  # Here straight away, in every other process on its next generation check
+        with self._lock:
+            self._entries.pop(user_id, None)
+        cache.set(GENERATION_CACHE_KEY, uuid.uuid4().hex, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(AsyncJWTAuthentication):
+    def get_user(self, validated_token):
+        user = self.cached_user(validated_token)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user.pk, user)
+        return user
+
+    async def aget_user(self, validated_token):
+        user = self.cached_user(validated_token)
+        if user is None:
+            user = await super().aget_user(validated_token)
+            user_cache.set(user.pk, user)
+        return user
+
+    def cached_user(self, validated_token):
+        user = user_cache.get(validated_token.get(api_settings.USER_ID_CLAIM))
+        if user is not None and api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
@@ -0,0 +1,109 @@
+"""
+Batched writes for the Blood Bank Management System, served by the batch view.
+
+A client syncing a shift's changes sends them as one ordered list of operations, each the method, path and JSON body
+it would otherwise send on its own request. The batch is authenticated once, and every operation runs through the
+same view as its own request would, as the batch's user, inside one transaction: one commit (and one fsync) for the
+whole list.
+
+1. read_operations: Checks the batch body and resolves each operation's path to its view. Only the routes in
+   BATCH_OPERATIONS can be batched.
+2. run_batch: Runs the operations in order. The first one answering with an error status stops the batch and rolls
+   back every operation before it, so a batch is applied whole or not at all.
+"""
+
+import io
+import json
+from dataclasses import dataclass
+from typing import Any, Callable
+from urllib.parse import urlsplit
+
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+MAX_BATCH_OPERATIONS = 100
+
+# Write routes an operation may target. Reads (routed to the read connection, which doesn't see the batch's
+# uncommitted writes), uploads and user management are left out, and so is add_blood_type: the blood type registry
+# would cache a new type before the batch commits
+BATCH_OPERATIONS = {
+    'add_donor': ['POST'],
+    'update_donor': ['PATCH', 'PUT'],
+    'delete_donor': ['DELETE'],
+    'add_to_bloodinventory': ['POST'],
+    'update_bloodinventory': ['PATCH', 'PUT'],
+    'request_blood': ['POST'],
+    'approve_request': ['POST'],
+}
+
+
+class InvalidBatch(Exception):
+    pass
+
+
+@dataclass
+class Operation:
+    method: str
+    path: str
+    query: str
+    body: Any
+    view: Callable
+    kwargs: dict
+
+
+def read_operations(data):  # Returns the list of Operations, raises InvalidBatch
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise InvalidBatch("operations must be a non-empty list")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise InvalidBatch(f"A batch holds at most {MAX_BATCH_OPERATIONS} operations")
+
+    result = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or not isinstance(operation.get('path'), str):
+            raise InvalidBatch(f"Operation {index}: path is required")
+        if not isinstance(operation.get('body', {}), dict):
+            raise InvalidBatch(f"Operation {index}: body must be an object")
+        method = str(operation.get('method', 'POST')).upper()
+        url = urlsplit(operation['path'])
+        path = '/' + url.path.lstrip('/')
+        try:
+            match = resolve(path)
+        except Resolver404:
+            raise InvalidBatch(f"Operation {index}: no route for {path}")
+        if method not in BATCH_OPERATIONS.get(match.url_name, []):
+            raise InvalidBatch(f"Operation {index}: {method} {path} can't be batched")
+        result.append(Operation(method, path, url.query, operation.get('body', {}), match.func, match.kwargs))
+    return result
+
+
+def _operation_request(request, operation):
+    # The request the operation would have been on its own, authenticated as the batch's user without decoding the JWT
+    # again (DRF's Request uses _force_auth_user / _force_auth_token instead of its authentication classes)
+    body = json.dumps(operation.body).encode()
+    operation_request = HttpRequest()
+    operation_request.method = operation.method
+    operation_request.path = operation_request.path_info = operation.path
+    operation_request.META = {**request.META, 'REQUEST_METHOD': operation.method, 'PATH_INFO': operation.path,
+                              'QUERY_STRING': operation.query, 'CONTENT_TYPE': 'application/json',
+                              'CONTENT_LENGTH': str(len(body))}
+    operation_request.GET = QueryDict(operation.query)
+    operation_request._stream = io.BytesIO(body)
+    operation_request._read_started = False
+    operation_request._force_auth_user = request.user
+    operation_request._force_auth_token = request.auth
+    return operation_request
+
+
+def run_batch(request, operations):
+    # Returns ([{'status': ..., 'body': ...} per operation run], index of the operation that failed or None)
+    results = []
+    with transaction.atomic():
+        for index, operation in enumerate(operations):
+            response = operation.view(_operation_request(request, operation), **operation.kwargs)
+            results.append({'status': response.status_code, 'body': response.data})
+            if response.status_code >= 400:
+                transaction.set_rollback(True)
+                return results, index
+    return results, None
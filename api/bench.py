@@ -0,0 +1,270 @@
+"""
+In-process benchmark of every API route, run by `manage.py bench`.
+
+1. seed: Fills the database with blood types, inventory, donors, blood requests, a queued approval job and the users
+   requests are sent as.
+2. SCENARIOS: One request per route name in bloodbank/urls.py, and the user (admin, regular or anonymous) it is sent
+   as. missing_scenarios lists the routes without one, so a new route can't silently drop out of the benchmark.
+3. run_benchmark: Sends every scenario through the Django test client with JWT auth. Each request runs inside a
+   transaction that is rolled back afterwards, so every sample sees the same data. Latency is timed without tracing;
+   queries and peak allocated memory are measured on one extra request each.
+4. failed_scenarios: The routes that didn't answer with a 2xx status, so a timing never silently measures an error path.
+5. compare: Lists the endpoints that answer with another status, run more queries, or got slower or allocate more
+   (beyond a tolerance) than in a saved baseline.
+"""
+
+import json
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Callable
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import ApprovalJob, BloodDonor, BloodInventory, BloodRequest, BloodType
+from .tokens import CachedRefreshToken
+
+BENCH_PASSWORD = 'bench-password'
+HASHING_REPEAT = 5  # Password hashing takes about half a second, endpoints that hash are sampled less
+UNSEEDED_BLOOD_TYPE = 'AB-'  # Left out of the seed so add_bloodtype can create it
+UNSTOCKED_BLOOD_TYPE = 'O-'  # Seeded without inventory so add_to_bloodinventory can add it
+LATENCY_SLACK_MS = 0.5  # Sub-millisecond differences are timer noise, never reported as a regression
+
+
+@dataclass
+class Scenario:
+    method: str
+    user: str | None  # 'admin', 'regular' or None for anonymous requests
+    data: Any = None  # dict (sent as JSON), str, or a callable taking the seeded fixtures
+    content_type: str = 'application/json'
+    query: str = ''
+    url_kwargs: Callable[[dict], dict] = field(default=lambda fixtures: {})
+    max_repeat: int | None = None
+    stream_chunks: int | None = None  # Chunks read from an endless streamed response before it is closed
+
+
+def _donor_rows(count):
+    return 'donor_name,blood_type,units_donated\n' + ''.join(f'bench-import-{i},A+,1\n' for i in range(count))
+
+
+def _batch_operations(fixtures):  # A shift's sync: a new donor and stock updates
+    inventory = fixtures['inventory']
+    return {'operations': [
+        {'method': 'POST', 'path': '/add_donor',
+         'body': {'donor_name': 'bench-batch', 'blood_type': 'O+', 'units_donated': 1}},
+        *({'method': 'PUT', 'path': f'/update_units/{inventory.id}',
+           'body': {'blood_type': inventory.blood_type.name, 'quantity': 50 + i}} for i in range(5)),
+    ]}
+
+
+SCENARIOS = {
+    'user_register': Scenario('POST', None, data={
+        'username': 'bench-new', 'email': 'bench-new@example.com', 'password': BENCH_PASSWORD,
+        'confirmPassword': BENCH_PASSWORD, 'is_staff': False}, max_repeat=HASHING_REPEAT),
+    'user_login': Scenario('POST', None, data={'username': 'bench-regular', 'password': BENCH_PASSWORD},
+                           max_repeat=HASHING_REPEAT),
+    'user_logout': Scenario('POST', 'regular',
+                            data=lambda fixtures: {'refresh': str(CachedRefreshToken.for_user(fixtures['regular']))}),
+    'provision_users': Scenario('POST', 'admin', data=f'username,password\nbench-provisioned,{BENCH_PASSWORD}\n',
+                                content_type='text/csv', max_repeat=HASHING_REPEAT),
+    'add_blood_type': Scenario('POST', 'admin', data={'name': UNSEEDED_BLOOD_TYPE}),
+    'add_donor': Scenario('POST', 'admin', data={'donor_name': 'bench-donor', 'blood_type': 'O+', 'units_donated': 1}),
+    'import_donors': Scenario('POST', 'admin', data=_donor_rows(100), content_type='text/csv'),
+    'update_donor': Scenario('PUT', 'admin',
+                             data={'donor_name': 'bench-updated', 'blood_type': 'A+', 'units_donated': 2},
+                             url_kwargs=lambda fixtures: {'id': fixtures['donor'].id}),
+    'delete_donor': Scenario('DELETE', 'admin', url_kwargs=lambda fixtures: {'id': fixtures['donor'].id}),
+    'get_all_donors': Scenario('GET', 'admin', query='page=3'),
+    'search_donors': Scenario('GET', 'admin', query='q=bench-1&blood_type=A%2B,O%2B'),
+    'export_donors': Scenario('GET', 'admin'),
+    'get_blood_inventory': Scenario('GET', 'admin'),
+    'add_to_bloodinventory': Scenario('POST', 'admin', data={'blood_type': UNSTOCKED_BLOOD_TYPE, 'quantity': 3}),
+    'update_bloodinventory': Scenario('PUT', 'admin',
+                                      data=lambda fixtures: {'blood_type': fixtures['inventory'].blood_type.name,
+                                                             'quantity': 50},
+                                      url_kwargs=lambda fixtures: {'id': fixtures['inventory'].id}),
+    'summary': Scenario('GET', 'admin'),
+    'changes': Scenario('GET', 'admin', query='since=0&limit=100'),
+    'request_blood': Scenario('POST', 'regular', data={'blood_type': 'A+', 'units_requested': 1}),
+    'view_all_bloodrequest': Scenario('GET', 'admin', query='q=pending'),
+    'approve_request': Scenario('POST', 'admin', data={'status': True},
+                                url_kwargs=lambda fixtures: {'id': fixtures['pending_request'].id}),
+    'approval_job': Scenario('GET', 'admin', url_kwargs=lambda fixtures: {'id': fixtures['approval_job'].id}),
+    'compatible_donors': Scenario('GET', 'admin', url_kwargs=lambda fixtures: {'id': fixtures['pending_request'].id}),
+    'allocate_requests': Scenario('POST', 'admin'),
+    'export_blood_requests': Scenario('GET', 'admin'),
+    'batch': Scenario('POST', 'admin', data=_batch_operations),
+    'get_blood_inventory_async': Scenario('GET', 'admin'),
+    'get_all_donors_async': Scenario('GET', 'admin', query='page=3'),
+    'view_all_bloodrequest_async': Scenario('GET', 'admin', query='q=pending'),
+    'inventory_stream': Scenario('GET', 'regular', stream_chunks=1),
+    'view_timings': Scenario('GET', 'admin'),
+    'metrics': Scenario('GET', None),
+}
+
+
+def route_names():  # Names of the routes in bloodbank/urls.py, included URLconfs such as admin/ are left out
+    return [pattern.name for pattern in get_resolver().url_patterns
+            if isinstance(pattern, URLPattern) and pattern.name]
+
+
+def missing_scenarios():
+    return [name for name in route_names() if name not in SCENARIOS]
+
+
+def seed(donors, requests, random_seed=0):  # Returns the fixtures the scenarios refer to
+    rng = random.Random(random_seed)
+    names = [name for name, _ in BloodType.BLOOD_TYPE_CHOICES if name != UNSEEDED_BLOOD_TYPE]
+    blood_types = [BloodType.objects.create(name=name) for name in names]
+    inventory = [BloodInventory.objects.create(blood_type=blood_type, quantity=10 * requests)
+                 for blood_type in blood_types if blood_type.name != UNSTOCKED_BLOOD_TYPE]
+
+    password = make_password(BENCH_PASSWORD)
+    admin = User.objects.create(username='bench-admin', is_staff=True, password=password)
+    regular = User.objects.create(username='bench-regular', is_staff=False, password=password)
+
+    start = date(2020, 1, 1)
+    BloodDonor.objects.bulk_create(
+        (BloodDonor(donor_name=f'bench-{i}', blood_type=rng.choice(blood_types), units_donated=rng.randint(1, 3),
+                    last_donated=start + timedelta(days=rng.randrange(1800))) for i in range(donors)),
+        batch_size=5000)
+    BloodRequest.objects.bulk_create(
+        (BloodRequest(user=regular, blood_type=rng.choice(blood_types), units_requested=rng.randint(1, 4),
+                      status=BloodRequest.PENDING if rng.random() < 0.5 else BloodRequest.FULFILLED)
+         for _ in range(requests)),
+        batch_size=5000)
+
+    # A request the seeded stock covers, so approve_request times a fulfilment whatever --seed and the sizes are
+    pending_request = BloodRequest.objects.filter(status=BloodRequest.PENDING).exclude(
+        blood_type__name=UNSTOCKED_BLOOD_TYPE).order_by('id').first()
+    return {
+        'admin': admin,
+        'regular': regular,
+        'donor': BloodDonor.objects.order_by('id').first(),
+        'inventory': inventory[0],
+        'pending_request': pending_request,
+        'approval_job': ApprovalJob.objects.create(blood_request=pending_request, requested_by=admin),
+    }
+
+
+async def _read_stream(content, max_chunks):  # Reads an async streamed response, at most max_chunks chunks of it
+    chunks = 0
+    async for _ in content:
+        chunks += 1
+        if chunks == max_chunks:
+            return
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Runner:
+    def __init__(self, fixtures):
+        self.fixtures = fixtures
+        self.clients = {None: Client()}
+        for user in ('admin', 'regular'):
+            token = AccessToken.for_user(fixtures[user])
+            self.clients[user] = Client(headers={'Authorization': f'Bearer {token}'})
+
+    def send(self, name, scenario):  # Sends one request and reads all of it, returns the status code
+        data = scenario.data(self.fixtures) if callable(scenario.data) else scenario.data
+        if isinstance(data, dict):
+            data = json.dumps(data)
+        path = reverse(name, kwargs=scenario.url_kwargs(self.fixtures))
+        if scenario.query:
+            path = f'{path}?{scenario.query}'
+
+        response = self.clients[scenario.user].generic(scenario.method, path, data or '',
+                                                       content_type=scenario.content_type)
+        if response.streaming and response.is_async:
+            async_to_sync(_read_stream)(response.streaming_content, scenario.stream_chunks)
+            response.close()
+        elif response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def rolled_back(self, function):  # Runs `function` in a transaction that is always rolled back
+        with transaction.atomic():
+            result = function()
+            transaction.set_rollback(True)
+        return result
+
+    def timed(self, name, scenario):
+        def request():
+            start = time.perf_counter()
+            self.send(name, scenario)
+            return time.perf_counter() - start
+        return self.rolled_back(request)
+
+    def counted_queries(self, name, scenario):
+        def request():
+            with CaptureQueriesContext(connection) as queries:
+                self.send(name, scenario)
+            return len(queries)
+        return self.rolled_back(request)
+
+    def peak_allocated(self, name, scenario):  # Peak bytes allocated by the Python heap during one request
+        def request():
+            tracemalloc.start()
+            try:
+                baseline = tracemalloc.get_traced_memory()[0]
+                self.send(name, scenario)
+                return tracemalloc.get_traced_memory()[1] - baseline
+            finally:
+                tracemalloc.stop()
+        return self.rolled_back(request)
+
+    def run(self, name, scenario, repeat):
+        status_code = self.rolled_back(lambda: self.send(name, scenario))  # Also warms up caches
+        if scenario.max_repeat is not None:
+            repeat = min(repeat, scenario.max_repeat)
+        samples = [self.timed(name, scenario) for _ in range(repeat)]
+        return {
+            'method': scenario.method,
+            'status': status_code,
+            'samples': repeat,
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+            'queries': self.counted_queries(name, scenario),
+            'peak_alloc_kib': round(self.peak_allocated(name, scenario) / 1024, 1),
+        }
+
+
+def run_benchmark(fixtures, repeat, names=None):  # Returns {route name: result} for `names` (all routes by default)
+    runner = Runner(fixtures)
+    return {name: runner.run(name, SCENARIOS[name], repeat) for name in (names or route_names())}
+
+
+def failed_scenarios(endpoints):  # {route name: status} of the routes that didn't answer with a 2xx status
+    return {name: result['status'] for name, result in endpoints.items() if not 200 <= result['status'] < 300}
+
+
+def compare(endpoints, baseline, tolerance):  # Returns a description of every regression against `baseline`
+    regressions = []
+    for name, before in baseline.items():
+        after = endpoints.get(name)
+        if after is None:
+            regressions.append(f"{name}: not benchmarked")
+            continue
+        if after['status'] != before['status']:
+            regressions.append(f"{name}: status {before['status']} -> {after['status']}")
+        if after['queries'] > before['queries']:
+            regressions.append(f"{name}: queries {before['queries']} -> {after['queries']}")
+        if after['p95_ms'] > max(before['p95_ms'] * (1 + tolerance), before['p95_ms'] + LATENCY_SLACK_MS):
+            regressions.append(f"{name}: p95 {before['p95_ms']} ms -> {after['p95_ms']} ms")
+        if after['peak_alloc_kib'] > before['peak_alloc_kib'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: peak allocation {before['peak_alloc_kib']} KiB -> {after['peak_alloc_kib']} KiB")
+    return regressions
@@ -0,0 +1,93 @@
+"""
+Process-wide lookup table for blood types.
+
+Blood types are written once and then only ever read, but the serializers have to turn a name such as
+"O+" into a BloodType primary key on every write. BloodTypeRegistry loads the whole name <-> id mapping
+once per process and shares it between threads, so those writes don't need a SELECT of their own.
+
+Saving or deleting a BloodType (through add_blood_type or the admin) invalidates the registry through the
+signal handlers in signals.py. The invalidation stores a new generation token in the default cache. Every
+process compares that token with the one it loaded (at most once a second) and reloads when they differ. The cache
+must be shared by all workers (settings.CACHES, file based by default), so a change made in one worker reaches all
+of them within a second.
+"""
+
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .models import BloodType
+
+GENERATION_CACHE_KEY = 'api:blood_types:generation'
+
+
+class BloodTypeRegistry:
+    generation_check_interval = 1.0  # Seconds between looks at the shared generation token
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (generation, {name: id}, {id: name}), replaced as a whole so readers never see a half built mapping
+        self._state = None
+        self._checked_at = 0.0
+
+    def _get_state(self, reload=False):
+        state = self._state
+        now = time.monotonic()
+        if state is not None and not reload and now - self._checked_at < self.generation_check_interval:
+            return state  # Bulk imports resolve thousands of names a second, don't ask the cache for every one
+
+        generation = cache.get(GENERATION_CACHE_KEY)
+        self._checked_at = now
+
+        if reload or state is None or state[0] != generation:
+            with self._lock:
+                state = self._state
+                if reload or state is None or state[0] != generation:
+                    rows = list(BloodType.objects.values_list('id', 'name'))
+                    state = (generation, {name: pk for pk, name in rows}, dict(rows))
+                    self._state = state
+        return state
+
+    def get_id(self, name):  # Returns the primary key of the blood type called `name`
+        if not isinstance(name, str):
+            raise BloodType.DoesNotExist(f"Blood type '{name}' does not exist.")
+
+        state = self._get_state()
+        if name not in state[1]:
+            # The blood type may have been added by another worker whose invalidation hasn't been seen yet
+            state = self._get_state(reload=True)
+
+        try:
+            return state[1][name]
+        except KeyError:
+            raise BloodType.DoesNotExist(f"Blood type '{name}' does not exist.")
+
+    def get_name(self, pk):  # Returns the name of the blood type with primary key `pk`
+        state = self._get_state()
+        if pk not in state[2]:
+            state = self._get_state(reload=True)
+
+        try:
+            return state[2][pk]
+        except KeyError:
+            raise BloodType.DoesNotExist(f"Blood type with id '{pk}' does not exist.")
+
+    def ids_containing(self, text):  # Same rows as `name__icontains=text`, answered without a join or LIKE scan
+        text = text.lower()
+        return [pk for name, pk in self._get_state()[1].items() if text in name.lower()]
+
+    def ids_named(self, names):  # Primary keys of the blood types among `names`, names not in the database are skipped
+        ids = self._get_state()[1]
+        return [ids[name] for name in names if name in ids]
+
+    def get_instance(self, pk):  # Builds a BloodType instance for `pk` without querying the database
+        return BloodType.from_db(None, ['id', 'name'], (pk, self.get_name(pk)))
+
+    def invalidate(self):
+        self._state = None
+        cache.set(GENERATION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+blood_type_registry = BloodTypeRegistry()
@@ -0,0 +1,99 @@
+"""
+Change feed of the blood inventory, donors and blood requests, served by the changes view.
+
+Triggers (see migration 0010) keep one ChangeLogEntry per inventory, donor and request row: every insert, update or
+delete replaces the row's entry with a new one, whose id is higher than that of any entry before it. A client that
+has synced up to id `since` gets every row changed after it by reading the entries with a higher id, in O(changes)
+instead of re-reading whole tables. Since SQLite commits one write at a time, entries never become visible out of id
+order, so a cursor never skips an entry committed later.
+
+Compaction policy:
+1. Superseded entries never pile up: a write replaces the row's previous entry, so the log holds one entry per live
+   row, plus one per deleted row.
+2. Entries of deleted rows are kept for CHANGE_LOG_RETENTION, then removed by compact_changes (`manage.py
+   compact_changes`, e.g. from cron). The highest id it removed is recorded in ChangeLogCompaction: a client whose
+   cursor is below it may have missed a deletion and must sync again from 0, which returns every live row.
+
+1. read_changes: One page of entries after a cursor, with the current data of every changed row, from one snapshot.
+2. compact_changes: Removes expired entries of deleted rows, in batches.
+"""
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import BloodDonor, BloodInventory, BloodRequest, ChangeLogCompaction, ChangeLogEntry
+from .serializers import BloodInventoryValuesSerializer, BloodRequestValuesSerializer, DonorValuesSerializer
+
+DEFAULT_CHANGES_LIMIT = 100
+MAX_CHANGES_LIMIT = 1000
+COMPACTION_BATCH_SIZE = 1000
+
+# Model and ValuesSerializer whose output is sent as the data of each kind of entry
+CHANGE_SOURCES = {
+    ChangeLogEntry.INVENTORY: (BloodInventory, BloodInventoryValuesSerializer),
+    ChangeLogEntry.DONOR: (BloodDonor, DonorValuesSerializer),
+    ChangeLogEntry.REQUEST: (BloodRequest, BloodRequestValuesSerializer),
+}
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def compacted_through():  # Highest entry id removed by compaction, 0 if none was
+    return ChangeLogCompaction.objects.order_by('-id').values_list('compacted_through', flat=True).first() or 0
+
+
+def _current_data(kind, object_ids):  # {object id: serialized row} of the rows that still exist
+    model, serializer_class = CHANGE_SOURCES[kind]
+    columns = serializer_class.columns('id')
+    rows = list(model.objects.filter(id__in=object_ids).values_list(*columns))
+    position = columns.index('id')
+    return {row[position]: data for row, data in zip(rows, serializer_class(rows).data)}
+
+
+def read_changes(since=0, limit=DEFAULT_CHANGES_LIMIT):
+    # Returns (changes, cursor to read the next page from, whether there are more entries)
+    with transaction.atomic(using=router.db_for_read(ChangeLogEntry)):  # Entries and rows from the same snapshot
+        if 0 < since < compacted_through():
+            raise CursorExpired(since)
+
+        entries = list(ChangeLogEntry.objects.filter(id__gt=since).order_by('id')
+                       .values_list('id', 'kind', 'object_id', 'deleted')[:limit + 1])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        data = {}
+        for kind in CHANGE_SOURCES:
+            object_ids = [object_id for _, entry_kind, object_id, deleted in entries
+                          if entry_kind == kind and not deleted]
+            if object_ids:
+                data[kind] = _current_data(kind, object_ids)
+
+    changes = []
+    for entry_id, kind, object_id, deleted in entries:
+        row = None if deleted else data[kind].get(object_id)
+        changes.append({'cursor': entry_id, 'type': kind, 'id': object_id, 'deleted': row is None, 'data': row})
+    return changes, entries[-1][0] if entries else since, has_more
+
+
+def compact_changes(retention=None, batch_size=COMPACTION_BATCH_SIZE):  # Returns the number of entries removed
+    cutoff = timezone.now() - (retention if retention is not None else settings.CHANGE_LOG_RETENTION)
+    last_id = 0
+    removed = 0
+
+    while True:
+        # Walks the primary key instead of re-scanning from the start for every batch
+        ids = list(ChangeLogEntry.objects.filter(id__gt=last_id, deleted=True, changed_at__lt=cutoff)
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+
+        with transaction.atomic():
+            ChangeLogEntry.objects.filter(id__in=ids)._raw_delete(router.db_for_write(ChangeLogEntry))
+            ChangeLogCompaction.objects.create(compacted_through=max(ids[-1], compacted_through()), removed=len(ids))
+        removed += len(ids)
+        last_id = ids[-1]
+
+    return removed
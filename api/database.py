@@ -0,0 +1,71 @@
+"""
+Production database profile and read routing for the Blood Bank Management System.
+
+With BLOODBANK_DATABASE_PROFILE=production, settings.py sets SQLITE_PRAGMAS and adds the READ_DATABASE alias, a second
+connection to the same SQLite file.
+
+1. apply_sqlite_pragmas: connection_created receiver running settings.SQLITE_PRAGMAS on every new SQLite connection
+   (see apps.py). In WAL mode readers keep reading while a writer commits, and busy_timeout makes a writer wait for
+   the write lock instead of failing at once with "database is locked".
+2. read_only: Marks a view (sync or async) as read only. Its queries run on the READ_DATABASE connection, so list
+   views don't queue behind writes on the per-thread 'default' connection.
+3. ReadRouter: Sends reads made inside a read_only view to READ_DATABASE when it is configured. Everything else,
+   and every write, goes to 'default'.
+"""
+
+import contextvars
+import functools
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+READ_DATABASE = 'read'
+
+reading_only = contextvars.ContextVar('reading_only', default=False)
+
+
+def apply_sqlite_pragmas(connection, **kwargs):  # connection_created receiver
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def read_only(view):
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            token = reading_only.set(True)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                reading_only.reset(token)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = reading_only.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            reading_only.reset(token)
+    return wrapper
+
+
+class ReadRouter:
+    def db_for_read(self, model, **hints):
+        if reading_only.get() and READ_DATABASE in connections.settings:
+            return READ_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Both aliases are the same database
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db != READ_DATABASE
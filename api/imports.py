@@ -0,0 +1,141 @@
+"""
+Bulk imports for the Blood Bank Management System.
+
+1. read_rows: Turns an uploaded CSV or NDJSON body into (row number, dict) pairs one line at a time, so the upload is
+   never held in memory as a whole.
+2. import_donor_rows: Validates each row with the DonorSerializer rules and inserts the valid ones in fixed size
+   batches, one transaction per batch. Donor names are checked for uniqueness once per batch instead of once per row.
+"""
+
+import csv
+import json
+from datetime import date
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from .models import BloodDonor
+from .serializers import DonorSerializer
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000  # Errors past this are counted but not listed in the response
+
+CSV_CONTENT_TYPES = ('text/csv',)
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+class RowError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def read_rows(stream, content_type):  # Yields (row number, dict) or (row number, RowError) for every data row
+    content_type = content_type.split(';')[0].strip().lower()
+    lines = (line.decode('utf-8-sig' if number == 0 else 'utf-8') for number, line in enumerate(stream))
+
+    if content_type in CSV_CONTENT_TYPES:
+        reader = csv.DictReader(lines)
+        for row in reader:
+            if None in row:
+                yield reader.line_num - 1, RowError({'non_field_errors': ['Row has more columns than the header']})
+            else:
+                yield reader.line_num - 1, {key: value for key, value in row.items() if value != ''}
+    elif content_type in NDJSON_CONTENT_TYPES:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, RowError({'non_field_errors': [f'Invalid JSON: {e}']})
+                continue
+            if not isinstance(row, dict):
+                yield number, RowError({'non_field_errors': ['Expected a JSON object']})
+                continue
+            yield number, row
+    else:
+        raise UnsupportedFormat(content_type)
+
+
+class DonorImportSerializer(DonorSerializer):
+    # DonorSerializer without the per row unique check on donor_name, import_donor_rows checks a whole batch at once
+    class Meta(DonorSerializer.Meta):
+        extra_kwargs = {'donor_name': {'validators': []}}
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def as_dict(self):
+        errors = sorted(self.errors, key=lambda error: error['row'])  # Duplicate names are found after validation
+        return {'imported': self.imported, 'failed': self.failed, 'errors': errors}
+
+
+def import_donor_rows(rows, batch_size=IMPORT_BATCH_SIZE):
+    result = ImportResult()
+    today = date.today()
+    rows = iter(rows)
+    serializer = DonorImportSerializer()  # Validates row after row, like ListSerializer does, so fields are built once
+
+    while batch := list(islice(rows, batch_size)):
+        valid = []
+        for row_number, row in batch:
+            if isinstance(row, RowError):
+                result.add_error(row_number, row.errors)
+                continue
+
+            try:
+                validated_data = serializer.run_validation(row)
+            except ValidationError as e:
+                result.add_error(row_number, as_serializer_error(e))
+                continue
+
+            donor = BloodDonor(**validated_data)
+            if donor.last_donated is None:
+                donor.last_donated = today  # Only a missing date defaults to today, a supplied one is kept
+            valid.append((row_number, donor))
+
+        names = [donor.donor_name for _, donor in valid]
+        taken = set(BloodDonor.objects.filter(donor_name__in=names).values_list('donor_name', flat=True))
+        donors = []
+        for row_number, donor in valid:
+            if donor.donor_name in taken:
+                result.add_error(row_number, {'donor_name': ['blood donor with this donor name already exists.']})
+                continue
+            taken.add(donor.donor_name)  # Also catches the same name twice within one batch
+            donors.append((row_number, donor))
+
+        _insert_batch(donors, result)
+
+    return result
+
+
+def _insert_batch(donors, result):
+    try:
+        with transaction.atomic():
+            BloodDonor.objects.bulk_create([donor for _, donor in donors])
+        result.imported += len(donors)
+    except IntegrityError:
+        # A concurrent writer took one of the names after the check, fall back to one savepoint per row
+        for row_number, donor in donors:
+            try:
+                with transaction.atomic():
+                    donor.save(force_insert=True)
+                result.imported += 1
+            except IntegrityError:
+                result.add_error(row_number, {'donor_name': ['blood donor with this donor name already exists.']})
@@ -0,0 +1,128 @@
+"""
+Stock movements for the Blood Bank Management System.
+
+1. fulfill_request: Marks a pending BloodRequest as Fulfilled and takes its units out of BloodInventory.
+2. allocate_pending_requests: Fulfills as many pending requests as the inventory allows, oldest first, in one
+   transaction. allocation_report turns its result into the response of allocate_requests.
+
+Stock is never written back from a value read into Python. Decrements are conditional UPDATEs
+(`quantity = quantity - n WHERE quantity >= n`), so concurrent approvals can't overwrite each other, and the
+status changes and the decrements commit or roll back together.
+"""
+
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import F
+
+from .blood_types import blood_type_registry
+from .models import BloodInventory, BloodRequest
+
+
+class RequestNotPending(Exception):
+    pass
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def fulfill_request(blood_request):
+    with transaction.atomic():
+        if not BloodRequest.objects.filter(pk=blood_request.pk, status=BloodRequest.PENDING).update(
+                status=BloodRequest.FULFILLED):
+            raise RequestNotPending(blood_request.pk)
+
+        if not BloodInventory.objects.filter(
+                blood_type_id=blood_request.blood_type_id, quantity__gte=blood_request.units_requested).update(
+                quantity=F('quantity') - blood_request.units_requested):
+            raise InsufficientStock(blood_request.blood_type_id)  # Rolls back the status change
+
+    blood_request.status = BloodRequest.FULFILLED
+
+
+ALLOCATION_ATTEMPTS = 3
+UPDATE_CHUNK_SIZE = 900  # Keeps `id IN (...)` below SQLite's bound parameter limit
+
+
+class AllocationConflict(Exception):
+    pass
+
+
+@dataclass
+class BloodTypeAllocation:
+    blood_type_id: int
+    units_available: int
+    fulfilled_ids: list = field(default_factory=list)
+    fulfilled_units: int = 0
+    pending_requests: int = 0
+    pending_units: int = 0
+
+    @property
+    def units_left(self):
+        return self.units_available - self.fulfilled_units
+
+    @property
+    def units_short(self):
+        return max(self.pending_units - self.units_left, 0)
+
+
+def allocate_pending_requests():
+    # A request approved or restocked concurrently makes one of the conditional updates miss, start over then
+    for attempt in range(ALLOCATION_ATTEMPTS):
+        try:
+            return _allocate()
+        except AllocationConflict:
+            if attempt == ALLOCATION_ATTEMPTS - 1:
+                raise
+
+
+def _allocate():
+    with transaction.atomic():
+        stock = dict(BloodInventory.objects.values_list('blood_type_id', 'quantity'))
+        allocations = {}
+
+        # Oldest request first (ids grow with age, and the (status, id) index returns them in that order). A request
+        # bigger than what is left doesn't block smaller requests behind it.
+        pending = BloodRequest.objects.filter(status=BloodRequest.PENDING).order_by('id')
+        for request_id, blood_type_id, units in pending.values_list('id', 'blood_type_id', 'units_requested'):
+            allocation = allocations.get(blood_type_id)
+            if allocation is None:
+                allocation = allocations[blood_type_id] = BloodTypeAllocation(blood_type_id, stock.get(blood_type_id, 0))
+
+            if units <= allocation.units_left:
+                allocation.fulfilled_ids.append(request_id)
+                allocation.fulfilled_units += units
+            else:
+                allocation.pending_requests += 1
+                allocation.pending_units += units
+
+        fulfilled_ids = [request_id for allocation in allocations.values() for request_id in allocation.fulfilled_ids]
+        for start in range(0, len(fulfilled_ids), UPDATE_CHUNK_SIZE):
+            chunk = fulfilled_ids[start:start + UPDATE_CHUNK_SIZE]
+            if BloodRequest.objects.filter(pk__in=chunk, status=BloodRequest.PENDING).update(
+                    status=BloodRequest.FULFILLED) != len(chunk):
+                raise AllocationConflict()
+
+        for allocation in allocations.values():
+            if allocation.fulfilled_units and not BloodInventory.objects.filter(
+                    blood_type_id=allocation.blood_type_id, quantity__gte=allocation.fulfilled_units).update(
+                    quantity=F('quantity') - allocation.fulfilled_units):
+                raise AllocationConflict()
+
+    return sorted(allocations.values(), key=lambda allocation: allocation.blood_type_id)
+
+
+def allocation_report(allocations):
+    return {
+        'fulfilled_requests': sum(len(allocation.fulfilled_ids) for allocation in allocations),
+        'pending_requests': sum(allocation.pending_requests for allocation in allocations),
+        'blood_types': [{
+            'blood_type': blood_type_registry.get_name(allocation.blood_type_id),
+            'fulfilled_requests': len(allocation.fulfilled_ids),
+            'fulfilled_units': allocation.fulfilled_units,
+            'pending_requests': allocation.pending_requests,
+            'units_left': allocation.units_left,
+            'units_short': allocation.units_short,
+        } for allocation in allocations],
+    }
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.inventory import AllocationConflict, allocate_pending_requests, allocation_report
+
+
+class Command(BaseCommand):
+    help = "Fulfills every pending blood request the inventory can cover, oldest first, in one transaction."
+
+    def handle(self, *args, **options):
+        try:
+            report = allocation_report(allocate_pending_requests())
+        except AllocationConflict:
+            raise CommandError("Inventory kept changing during allocation, try again")
+
+        for row in report['blood_types']:
+            self.stdout.write(
+                f"{row['blood_type']:<4} fulfilled {row['fulfilled_requests']} requests ({row['fulfilled_units']} units), "
+                f"{row['pending_requests']} still pending, {row['units_left']} units left, {row['units_short']} short")
+        self.stdout.write(self.style.SUCCESS(
+            f"Fulfilled {report['fulfilled_requests']} requests, {report['pending_requests']} still pending"))
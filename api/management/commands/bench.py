@@ -0,0 +1,74 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.authentication import user_cache
+from api.bench import compare, failed_scenarios, missing_scenarios, run_benchmark, seed
+from api.tokens import blacklist_filter
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks every API route in process on a throwaway database: latency percentiles, queries and peak "
+            "allocated memory per request. Fails when a result regresses against --baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donors', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=5000, help="Blood requests to seed")
+        parser.add_argument('--repeat', type=int, default=50, help="Timed requests per route")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the generated data")
+        parser.add_argument('--route', action='append', dest='routes', help="Only benchmark this route name")
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument('--baseline', help="JSON file written by an earlier --output run to compare against")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed relative growth of p95 latency and peak allocation (default 0.25)")
+
+    def handle(self, *args, **options):
+        missing = missing_scenarios()
+        if missing:
+            raise CommandError(
+                f"No bench scenario for route(s): {', '.join(missing)} (add them to api.bench.SCENARIOS)")
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        # Same isolation as the test runner: a throwaway database, and the test client allowed through ALLOWED_HOSTS
+        setup_test_environment(debug=False)
+        logging.getLogger('django.request').setLevel(logging.ERROR)  # Failed scenarios are reported below instead
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        user_cache.clear()
+        blacklist_filter.reset()
+        try:
+            fixtures = seed(options['donors'], options['requests'], options['seed'])
+            endpoints = run_benchmark(fixtures, options['repeat'], options['routes'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'route':<28} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                          f"{'queries':>7} {'peak KiB':>9}")
+        for name, result in endpoints.items():
+            self.stdout.write(f"{name:<28} {result['status']:>6} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} "
+                              f"{result['p99_ms']:>9.3f} {result['queries']:>7} {result['peak_alloc_kib']:>9.1f}")
+
+        failed = failed_scenarios(endpoints)
+        if failed:  # Their timings measured an error path, not the endpoint's work
+            raise CommandError("Scenarios without a 2xx answer: " +
+                               ", ".join(f"{name} ({status})" for name, status in failed.items()))
+
+        if options['output']:
+            settings = {key: options[key] for key in ('donors', 'requests', 'repeat', 'seed')}
+            with open(options['output'], 'w') as output:
+                json.dump({'settings': settings, 'endpoints': endpoints}, output, indent=2)
+
+        if baseline is not None:
+            expected = {name: result for name, result in baseline['endpoints'].items()
+                        if not options['routes'] or name in options['routes']}
+            regressions = compare(endpoints, expected, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.changes import COMPACTION_BATCH_SIZE, compact_changes
+
+
+class Command(BaseCommand):
+    help = "Removes the change feed entries of rows deleted longer ago than CHANGE_LOG_RETENTION, a batch at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=float,
+                            help="Days deletions are kept, instead of the CHANGE_LOG_RETENTION setting")
+        parser.add_argument('--batch-size', type=int, default=COMPACTION_BATCH_SIZE,
+                            help="Entries removed per transaction")
+
+    def handle(self, *args, **options):
+        retention = settings.CHANGE_LOG_RETENTION
+        if options['retention_days'] is not None:
+            retention = timedelta(days=options['retention_days'])
+        removed = compact_changes(retention, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} change log entries of deleted rows"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.tokens import FLUSH_BATCH_SIZE, flush_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Deletes expired outstanding tokens and their blacklist entries, a batch at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=FLUSH_BATCH_SIZE,
+                            help="Tokens deleted per transaction")
+
+    def handle(self, *args, **options):
+        deleted = flush_expired_tokens(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired tokens"))
@@ -0,0 +1,83 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.models import BloodDonor, BloodType
+from api.synthetic import (BLOOD_TYPE_WEIGHTS, GENERATE_BATCH_SIZE, generate_blood_requests, generate_donors,
+                           generate_users, index_generated_rows, insert_blood_requests, insert_donors, insert_users,
+                           last_ids, triggers_suspended)
+
+SQLITE_CACHE_KIB = 256 * 1024
+MAX_DONOR_NAME_LENGTH = BloodDonor._meta.get_field('donor_name').max_length
+
+
+class Command(BaseCommand):
+    help = ("Loads synthetic users, donors and blood requests with realistic distributions into the database, "
+            "reproducibly for a given --seed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=0)
+        parser.add_argument('--donors', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=0, help="Blood requests, made by the generated users")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='gen', help="Prefix of the generated usernames and donor names")
+        parser.add_argument('--password', default='generated',
+                            help="Password of every generated user (hashed once)")
+        parser.add_argument('--batch-size', type=int, default=GENERATE_BATCH_SIZE,
+                            help="Rows per INSERT")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['donors'] and len(f"{prefix}-donor-{options['donors'] - 1}") > MAX_DONOR_NAME_LENGTH:
+            raise CommandError(f"Donor names would be longer than {MAX_DONOR_NAME_LENGTH} characters, "
+                               f"use a shorter --prefix")
+        if User.objects.filter(username__startswith=f'{prefix}-user-').exists() or \
+                BloodDonor.objects.filter(donor_name__startswith=f'{prefix}-donor-').exists():
+            raise CommandError(f"Data with prefix '{prefix}' was already generated, use another --prefix")
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                # Inserts land all over the last_donated indexes, a page cache of 2 MiB (the default) spills constantly
+                cursor.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_KIB}')
+
+        for name in BLOOD_TYPE_WEIGHTS:
+            BloodType.objects.get_or_create(name=name)
+        blood_type_ids = dict(BloodType.objects.values_list('name', 'id'))
+        seed = options['seed']
+        batch_size = options['batch_size']
+
+        # One transaction: the tables are never seen (or written) without their triggers, and a failed load leaves
+        # nothing behind
+        with transaction.atomic(), triggers_suspended():
+            after = last_ids()
+            if options['users']:
+                rows = generate_users(random.Random(f'{seed}-users'), options['users'], prefix,
+                                      make_password(options['password']))
+                self.load('users', lambda: insert_users(rows, batch_size))
+
+            if options['donors']:
+                rows = generate_donors(random.Random(f'{seed}-donors'), options['donors'], prefix, blood_type_ids)
+                self.load('donors', lambda: insert_donors(rows, batch_size))
+
+            if options['requests']:
+                user_ids = list(User.objects.filter(username__startswith=f'{prefix}-user-', is_staff=False)
+                                .order_by('id').values_list('id', flat=True))
+                if not user_ids:
+                    raise CommandError("Blood requests need generated regular users, pass --users as well")
+                rows = generate_blood_requests(random.Random(f'{seed}-requests'), options['requests'], user_ids,
+                                               blood_type_ids)
+                self.load('blood requests', lambda: insert_blood_requests(rows, batch_size))
+
+            self.load('rows into the search index, summary and change log', lambda: index_generated_rows(after),
+                      'Indexed')
+
+    def load(self, label, insert, verb='Inserted'):
+        start = time.perf_counter()
+        written = insert()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {written} {label} in {elapsed:.1f} s ({written / max(elapsed, 1e-9):,.0f} rows/s)"))
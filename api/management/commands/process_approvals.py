@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.approvals import APPROVAL_BATCH_SIZE, WORKER_POLL_INTERVAL, ApprovalWorker
+
+
+class Command(BaseCommand):
+    help = "Runs the approvals queued by approve_request, a batch per transaction, from a pool of threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help="Worker threads")
+        parser.add_argument('--batch-size', type=int, default=APPROVAL_BATCH_SIZE, help="Jobs run per transaction")
+        parser.add_argument('--poll-interval', type=float, default=WORKER_POLL_INTERVAL,
+                            help="Seconds between checks of an empty queue")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        worker = ApprovalWorker(options['threads'], options['batch_size'], options['poll_interval'])
+        try:
+            processed = worker.run(until_empty=options['once'])
+        except KeyboardInterrupt:
+            worker.stop()
+            processed = worker.processed
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} approval jobs"))
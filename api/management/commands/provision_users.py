@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import CSV_CONTENT_TYPES, NDJSON_CONTENT_TYPES, read_rows
+from api.provisioning import PROVISION_BATCH_SIZE, default_workers, provision_users
+
+CONTENT_TYPES = {'.csv': CSV_CONTENT_TYPES[0], '.ndjson': NDJSON_CONTENT_TYPES[0], '.jsonl': NDJSON_CONTENT_TYPES[0]}
+
+
+class Command(BaseCommand):
+    help = ("Creates users from a CSV (username,email,password,is_staff header) or NDJSON file, hashing passwords "
+            "in a pool of processes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="A .csv, .ndjson or .jsonl file")
+        parser.add_argument('--workers', type=int, default=default_workers(),
+                            help="Processes hashing passwords, defaults to the number of CPUs")
+        parser.add_argument('--batch-size', type=int, default=PROVISION_BATCH_SIZE,
+                            help="Users inserted per INSERT")
+
+    def handle(self, *args, **options):
+        path = Path(options['file'])
+        if path.suffix.lower() not in CONTENT_TYPES:
+            raise CommandError(f"Unsupported file type '{path.suffix}', use .csv, .ndjson or .jsonl")
+
+        with path.open('rb') as stream:
+            result = provision_users(read_rows(stream, CONTENT_TYPES[path.suffix.lower()]),
+                                     workers=options['workers'], batch_size=options['batch_size'])
+
+        for error in result.as_dict()['errors']:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(f"Created {result.imported} users, {result.failed} rows failed"))
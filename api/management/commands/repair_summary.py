@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.blood_types import blood_type_registry
+from api.summary import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per blood type summary table from the blood inventory and blood requests."
+
+    def handle(self, *args, **options):
+        repaired = rebuild_summary()
+        for blood_type_id, (stored, rebuilt) in sorted(repaired.items()):
+            changes = ', '.join(f"{name} {stored[name] if stored else '-'} -> {value}"
+                                for name, value in rebuilt.items() if not stored or stored[name] != value)
+            self.stdout.write(f"{blood_type_registry.get_name(blood_type_id):<4} {changes}")
+        self.stdout.write(self.style.SUCCESS(f"Summary rebuilt, {len(repaired)} blood types were out of date"))
@@ -0,0 +1,64 @@
+"""
+Donor matching for blood requests the inventory can't cover, served by the compatible_donors view.
+
+1. COMPATIBLE_DONOR_TYPES: For every blood type code in BloodType.BLOOD_TYPE_CHOICES, the donor blood types whose red
+   cells it can receive. Precomputed from the ABO/Rh rules: a donor is compatible when their cells carry no antigen
+   (A, B, RhD) the recipient's don't.
+2. eligible_donors: Donors of compatible blood types who can give blood today (never donated, or last donated at least
+   DONATION_INTERVAL ago), longest since donation first. One query: a UNION ALL with one branch per compatible blood
+   type, each reading the first rows of the (blood_type, last_donated, id) index, merged and cut to the page size.
+   An `IN (...)` filter instead makes SQLite sort every eligible donor of those types.
+"""
+
+from datetime import date, timedelta
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .blood_types import blood_type_registry
+from .models import BloodDonor, BloodType
+from .serializers import DonorValuesSerializer
+
+DONATION_INTERVAL = timedelta(days=56)  # Shortest time between two whole blood donations
+
+
+def _antigens(code):
+    abo, rh = code[:-1], code[-1]
+    return (set(abo) - {'O'}) | ({'D'} if rh == '+' else set())
+
+
+COMPATIBLE_DONOR_TYPES = {
+    recipient: tuple(donor for donor, _ in BloodType.BLOOD_TYPE_CHOICES if _antigens(donor) <= _antigens(recipient))
+    for recipient, _ in BloodType.BLOOD_TYPE_CHOICES
+}
+
+
+def eligible_since(today=None):  # Latest last_donated of a donor who may donate today
+    return (today or date.today()) - DONATION_INTERVAL
+
+
+def eligible_donors(blood_type_name, limit, today=None):  # DonorValuesSerializer rows
+    blood_type_ids = blood_type_registry.ids_named(COMPATIBLE_DONOR_TYPES[blood_type_name])
+    if not blood_type_ids:
+        return []
+
+    columns = DonorValuesSerializer.columns('last_donated', 'id')
+    eligible = Q(last_donated__isnull=True) | Q(last_donated__lte=eligible_since(today))
+    using = router.db_for_read(BloodDonor)
+    branches, params = [], []
+    for blood_type_id in blood_type_ids:
+        branch = (BloodDonor.objects.filter(eligible, blood_type_id=blood_type_id)
+                  .order_by('last_donated', 'id').values_list(*columns)[:limit])
+        sql, branch_params = branch.query.get_compiler(using=using).as_sql()
+        branches.append(f'SELECT * FROM ({sql})')
+        params += branch_params
+    # NULLs sort first in SQLite, donors who never donated come before everyone else as they do within each branch
+    order = f'{columns.index("last_donated") + 1}, {columns.index("id") + 1}'
+    sql = f'{" UNION ALL ".join(branches)} ORDER BY {order} LIMIT %s'
+
+    last_donated = BloodDonor._meta.get_field('last_donated')
+    position = columns.index('last_donated')
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [*params, limit])
+        return [(*row[:position], last_donated.to_python(row[position]), *row[position + 1:])
+                for row in cursor.fetchall()]
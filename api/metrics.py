@@ -0,0 +1,154 @@
+"""
+Prometheus metrics for the Blood Bank Management System, served in the text exposition format by the metrics view.
+
+1. RequestMetrics: Request counters, latency histograms and database query counters per URL name, fed by
+   ServerTimingMiddleware (see timing.py). Every thread counts into its own shard, so recording a request takes no
+   lock; a scrape adds the shards up. The shards of threads that have ended (a thread-per-connection server starts
+   one per connection) are folded into one retired shard whenever a new thread registers or a scrape runs, so the
+   shards never outnumber the live threads by more than the ones that ended since. With METRICS_ENABLED = False
+   nothing is recorded.
+2. render_metrics: The exposition text, with the request metrics and the inventory gauges read from the database at
+   scrape time (units per blood type, and pending blood requests added up from the BloodTypeSummary rows instead of
+   counted).
+"""
+
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .models import BloodInventory, BloodTypeSummary
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+UNMATCHED_VIEW = 'unmatched'  # Label of requests that didn't resolve to a named URL
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+class _Shard:
+    __slots__ = ('requests', 'durations', 'queries')
+
+    def __init__(self):
+        self.requests = {}  # {(view, method, status): count}
+        self.durations = {}  # {view: [count per bucket (the last one is +Inf), sum of durations]}
+        self.queries = {}  # {view: count}
+
+    def add(self, other):  # Adds the counts of `other` to this shard
+        # dict() and list() copy in one step under the GIL, while the thread owning `other` may be adding keys
+        for key, count in dict(other.requests).items():
+            self.requests[key] = self.requests.get(key, 0) + count
+        for view, (buckets, total) in dict(other.durations).items():
+            merged = self.durations.setdefault(view, [[0] * (len(LATENCY_BUCKETS) + 1), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], list(buckets))]
+            merged[1] += total
+        for view, count in dict(other.queries).items():
+            self.queries[view] = self.queries.get(view, 0) + count
+
+    def clear(self):
+        self.requests.clear()
+        self.durations.clear()
+        self.queries.clear()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()  # Only taken when a thread records its first request, and by scrapes
+        self._local = threading.local()
+        self._shards = {}  # {thread: its shard}
+        self._retired = _Shard()  # Counts of the threads that have ended
+
+    def _retire_ended_threads(self):  # Called with the lock held
+        for thread in [thread for thread in self._shards if not thread.is_alive()]:
+            self._retired.add(self._shards.pop(thread))  # Its thread is gone, nothing writes to it any more
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._retire_ended_threads()
+                self._shards[threading.current_thread()] = shard
+        return shard
+
+    def observe(self, view, method, status_code, duration, queries):
+        if not metrics_enabled():
+            return
+        shard = self._shard()
+        key = (view, method, status_code)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+
+        histogram = shard.durations.get(view)
+        if histogram is None:
+            histogram = shard.durations[view] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+        histogram[0][bisect_left(LATENCY_BUCKETS, duration)] += 1
+        histogram[1] += duration
+
+        shard.queries[view] = shard.queries.get(view, 0) + queries
+
+    def collect(self):  # (requests, durations, queries) added up over every thread
+        total = _Shard()
+        with self._lock:
+            self._retire_ended_threads()
+            total.add(self._retired)
+            shards = list(self._shards.values())
+        for shard in shards:
+            total.add(shard)
+        return total.requests, total.durations, total.queries
+
+    def clear(self):
+        with self._lock:
+            self._retired.clear()
+            for shard in self._shards.values():
+                shard.clear()
+
+
+request_metrics = RequestMetrics()
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _header(lines, name, kind, help_text):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def render_metrics():
+    requests, durations, queries = request_metrics.collect()
+    lines = []
+
+    _header(lines, 'bloodbank_requests_total', 'counter', 'Requests served, by URL name, method and status code.')
+    for (view, method, status_code), count in sorted(requests.items()):
+        lines.append(f'bloodbank_requests_total{_labels(view=view, method=method, status=status_code)} {count}')
+
+    _header(lines, 'bloodbank_request_duration_seconds', 'histogram', 'Time spent serving requests, by URL name.')
+    for view, (buckets, total) in sorted(durations.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+            cumulative += count
+            lines.append(f'bloodbank_request_duration_seconds_bucket{_labels(view=view, le=bound)} {cumulative}')
+        lines.append(f'bloodbank_request_duration_seconds_sum{_labels(view=view)} {total}')
+        lines.append(f'bloodbank_request_duration_seconds_count{_labels(view=view)} {cumulative}')
+
+    _header(lines, 'bloodbank_db_queries_total', 'counter', 'Database queries run while serving requests, by URL name.')
+    for view, count in sorted(queries.items()):
+        lines.append(f'bloodbank_db_queries_total{_labels(view=view)} {count}')
+
+    _header(lines, 'bloodbank_inventory_units', 'gauge', 'Units in the blood inventory, by blood type.')
+    for name, quantity in BloodInventory.objects.order_by('blood_type__name').values_list('blood_type__name',
+                                                                                          'quantity'):
+        lines.append(f'bloodbank_inventory_units{_labels(blood_type=name)} {quantity}')
+
+    _header(lines, 'bloodbank_pending_requests', 'gauge', 'Blood requests waiting to be fulfilled.')
+    pending = BloodTypeSummary.objects.aggregate(pending=Sum('pending_requests', default=0))['pending']
+    lines.append(f'bloodbank_pending_requests {pending}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,45 @@
+# Generated by Django 5.1 on 2026-10-18 03:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize_request_status(apps, schema_editor):
+    # Status used to be free text, map whatever was stored onto the new choices
+    BloodRequest = apps.get_model('api', 'BloodRequest')
+    BloodRequest.objects.filter(status__icontains='fil').exclude(status='Fulfilled').update(status='Fulfilled')
+    BloodRequest.objects.exclude(status__in=['Pending', 'Fulfilled']).update(status='Pending')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_alter_bloodinventory_blood_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_request_status, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bloodrequest',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Fulfilled', 'Fulfilled')], default='Pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='bloodtype',
+            name='name',
+            field=models.CharField(choices=[('A+', 'add_to_bloodinventory'), ('A-', 'A Negative'), ('B+', 'B Positive'), ('B-', 'B Negative'), ('AB+', 'AB Positive'), ('AB-', 'AB Negative'), ('O+', 'O Positive'), ('O-', 'O Negative')], max_length=3, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='blooddonor',
+            index=models.Index(fields=['last_donated', 'id'], name='donor_last_donated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blooddonor',
+            index=models.Index(fields=['blood_type', 'last_donated', 'id'], name='donor_type_last_donated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['status', 'id'], name='request_status_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# Full-text index of donor names for search_donors (see api/search.py). It is an external content FTS5 table: it
+# stores only the index and reads donor_name from api_blooddonor, and the triggers keep it in sync with every write.
+CREATE_SEARCH_INDEX = [
+    """
+    CREATE VIRTUAL TABLE api_blooddonor_fts USING fts5(
+        donor_name, content='api_blooddonor', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER api_blooddonor_fts_insert AFTER INSERT ON api_blooddonor BEGIN
+        INSERT INTO api_blooddonor_fts (rowid, donor_name) VALUES (new.id, new.donor_name);
+    END
+    """,
+    """
+    CREATE TRIGGER api_blooddonor_fts_delete AFTER DELETE ON api_blooddonor BEGIN
+        INSERT INTO api_blooddonor_fts (api_blooddonor_fts, rowid, donor_name) VALUES ('delete', old.id, old.donor_name);
+    END
+    """,
+    """
+    CREATE TRIGGER api_blooddonor_fts_update AFTER UPDATE OF donor_name ON api_blooddonor BEGIN
+        INSERT INTO api_blooddonor_fts (api_blooddonor_fts, rowid, donor_name) VALUES ('delete', old.id, old.donor_name);
+        INSERT INTO api_blooddonor_fts (rowid, donor_name) VALUES (new.id, new.donor_name);
+    END
+    """,
+    "INSERT INTO api_blooddonor_fts (api_blooddonor_fts) VALUES ('rebuild')",  # Indexes the existing donors
+]
+
+DROP_SEARCH_INDEX = [
+    'DROP TRIGGER api_blooddonor_fts_update',
+    'DROP TRIGGER api_blooddonor_fts_delete',
+    'DROP TRIGGER api_blooddonor_fts_insert',
+    'DROP TABLE api_blooddonor_fts',
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_bloodrequest_status_choices_and_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SEARCH_INDEX), run_on_sqlite(DROP_SEARCH_INDEX)),
+    ]
@@ -0,0 +1,120 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Per blood type totals of api_bloodinventory and api_bloodrequest (see api/summary.py). Every insert, update and delete
+# on those tables adds its difference to the summary row of its blood type in the same statement, so the totals commit
+# or roll back with the write whichever way it is made: views, admin, queryset updates or bulk inserts.
+SUMMARY = 'api_bloodtypesummary'
+PENDING = "'Pending'"
+FULFILLED = "'Fulfilled'"
+
+
+def add_row(blood_type_id):  # Makes sure the blood type has a summary row
+    return (f'INSERT OR IGNORE INTO {SUMMARY} (blood_type_id, units_available, pending_requests, pending_units, '
+            f'fulfilled_units) VALUES ({blood_type_id}, 0, 0, 0, 0);')
+
+
+def inventory_delta(row, sign):
+    return f'UPDATE {SUMMARY} SET units_available = units_available {sign} {row}.quantity ' \
+           f'WHERE blood_type_id = {row}.blood_type_id;'
+
+
+def request_delta(row, sign):
+    return (f'UPDATE {SUMMARY} SET '
+            f'pending_requests = pending_requests {sign} ({row}.status = {PENDING}), '
+            f'pending_units = pending_units {sign} (CASE WHEN {row}.status = {PENDING} THEN {row}.units_requested '
+            f'ELSE 0 END), '
+            f'fulfilled_units = fulfilled_units {sign} (CASE WHEN {row}.status = {FULFILLED} '
+            f'THEN {row}.units_requested ELSE 0 END) '
+            f'WHERE blood_type_id = {row}.blood_type_id;')
+
+
+# Deletes only subtract from an existing row: when a blood type is deleted its summary row may go before its inventory
+# and requests, and must not come back
+CREATE_SUMMARY_TRIGGERS = [
+    f"""
+    CREATE TRIGGER {SUMMARY}_type_insert AFTER INSERT ON api_bloodtype BEGIN
+        {add_row('new.id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SUMMARY}_inventory_insert AFTER INSERT ON api_bloodinventory BEGIN
+        {add_row('new.blood_type_id')} {inventory_delta('new', '+')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SUMMARY}_inventory_update AFTER UPDATE OF blood_type_id, quantity ON api_bloodinventory BEGIN
+        {inventory_delta('old', '-')} {add_row('new.blood_type_id')} {inventory_delta('new', '+')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SUMMARY}_inventory_delete AFTER DELETE ON api_bloodinventory BEGIN
+        {inventory_delta('old', '-')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SUMMARY}_request_insert AFTER INSERT ON api_bloodrequest BEGIN
+        {add_row('new.blood_type_id')} {request_delta('new', '+')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SUMMARY}_request_update AFTER UPDATE OF blood_type_id, units_requested, status ON api_bloodrequest
+    BEGIN
+        {request_delta('old', '-')} {add_row('new.blood_type_id')} {request_delta('new', '+')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SUMMARY}_request_delete AFTER DELETE ON api_bloodrequest BEGIN
+        {request_delta('old', '-')}
+    END
+    """,
+    # Summarises the existing rows, the same as `manage.py repair_summary`
+    f"""
+    INSERT INTO {SUMMARY} (blood_type_id, units_available, pending_requests, pending_units, fulfilled_units)
+    SELECT blood_type.id,
+        (SELECT COALESCE(SUM(quantity), 0) FROM api_bloodinventory WHERE blood_type_id = blood_type.id),
+        (SELECT COUNT(*) FROM api_bloodrequest WHERE blood_type_id = blood_type.id AND status = {PENDING}),
+        (SELECT COALESCE(SUM(units_requested), 0) FROM api_bloodrequest
+         WHERE blood_type_id = blood_type.id AND status = {PENDING}),
+        (SELECT COALESCE(SUM(units_requested), 0) FROM api_bloodrequest
+         WHERE blood_type_id = blood_type.id AND status = {FULFILLED})
+    FROM api_bloodtype blood_type
+    """,
+]
+
+DROP_SUMMARY_TRIGGERS = [
+    f'DROP TRIGGER {SUMMARY}_{name}'
+    for name in ['type_insert', 'inventory_insert', 'inventory_update', 'inventory_delete', 'request_insert',
+                 'request_update', 'request_delete']
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_donor_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloodTypeSummary',
+            fields=[
+                ('blood_type', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                                    serialize=False, to='api.bloodtype')),
+                ('units_available', models.IntegerField(default=0)),
+                ('pending_requests', models.IntegerField(default=0)),
+                ('pending_units', models.IntegerField(default=0)),
+                ('fulfilled_units', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(run_on_sqlite(CREATE_SUMMARY_TRIGGERS), run_on_sqlite(DROP_SUMMARY_TRIGGERS)),
+    ]
@@ -0,0 +1,74 @@
+from django.db import migrations, models
+
+# Change feed of api_bloodinventory, api_blooddonor and api_bloodrequest (see api/changes.py). Every insert, update and
+# delete replaces the row's entry in api_changelogentry with a new one in the same statement. The id is AUTOINCREMENT,
+# so a new entry always gets a higher id than any entry written before, even a removed one.
+CHANGE_LOG = 'api_changelogentry'
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"  # UTC, in the format Django stores datetimes in
+TABLES = {'inventory': 'api_bloodinventory', 'donor': 'api_blooddonor', 'request': 'api_bloodrequest'}
+
+
+def log_change(kind, object_id, deleted):
+    return (f"INSERT OR REPLACE INTO {CHANGE_LOG} (kind, object_id, deleted, changed_at) "
+            f"VALUES ('{kind}', {object_id}, {deleted}, {NOW});")
+
+
+CREATE_CHANGE_TRIGGERS = [
+    statement
+    for kind, table in TABLES.items()
+    for statement in [
+        f"CREATE TRIGGER {CHANGE_LOG}_{kind}_insert AFTER INSERT ON {table} BEGIN {log_change(kind, 'new.id', 0)} END",
+        f"CREATE TRIGGER {CHANGE_LOG}_{kind}_update AFTER UPDATE ON {table} BEGIN {log_change(kind, 'new.id', 0)} END",
+        f"CREATE TRIGGER {CHANGE_LOG}_{kind}_delete AFTER DELETE ON {table} BEGIN {log_change(kind, 'old.id', 1)} END",
+        # Rows written before the change log existed
+        f"INSERT INTO {CHANGE_LOG} (kind, object_id, deleted, changed_at) SELECT '{kind}', id, 0, {NOW} FROM {table}",
+    ]
+]
+
+DROP_CHANGE_TRIGGERS = [
+    f'DROP TRIGGER {CHANGE_LOG}_{kind}_{action}' for kind in TABLES for action in ['insert', 'update', 'delete']
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_blood_type_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogCompaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('compacted_at', models.DateTimeField(auto_now_add=True)),
+                ('compacted_through', models.BigIntegerField()),
+                ('removed', models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('inventory', 'Blood inventory'), ('donor', 'Blood donor'),
+                                                   ('request', 'Blood request')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'),
+                                                        name='change_log_object_unique')],
+            },
+        ),
+        migrations.RunPython(run_on_sqlite(CREATE_CHANGE_TRIGGERS), run_on_sqlite(DROP_CHANGE_TRIGGERS)),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-18 04:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_change_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done')], default='queued', max_length=10)),
+                ('outcome', models.CharField(blank=True, choices=[('approved', 'Approved'), ('already_fulfilled', 'Already fulfilled'), ('insufficient_stock', 'Insufficient stock')], max_length=20)),
+                ('message', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('blood_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.bloodrequest')),
+                ('requested_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='approval_job_status_idx')],
+            },
+        ),
+    ]
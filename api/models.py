@@ -4,7 +4,13 @@ Models for the Blood Bank Management System.
 1. BloodType: Represents different blood types, with choices including A+, A-, B+, B-, AB+, AB-, O+, and O-.
 2. BloodInventory: Tracks the inventory of blood types, linking to BloodType and storing the available quantity.
 3. BloodDonor: Stores information about blood donors, including their name, blood type, units donated, and last donation date.
-4. BloodRequest: Records requests made by users for specific blood types and quantities, along with the request status.
+4. BloodRequest: Records requests made by users for specific blood types and quantities, along with the request status
+   (Pending or Fulfilled).
+5. BloodTypeSummary: Holds per blood type totals of BloodInventory and BloodRequest (units available, pending requests
+   and units, fulfilled units), maintained on every write so they are read without counting.
+6. ChangeLogEntry: The change feed, one entry per inventory, donor and request row for its latest write (or deletion),
+   with a growing id clients sync from. ChangeLogCompaction records how far deleted entries have been expired.
+7. ApprovalJob: An approval queued by approve_request in queued mode, and once the worker ran it, its outcome.
 """
 
 from django.contrib.auth.models import User
@@ -26,7 +32,7 @@ class BloodType(models.Model):  # Model for storing  blood types
     name = models.CharField(max_length=3, choices=BLOOD_TYPE_CHOICES, unique=True)
 
     def __str__(self):
-        return self.nameD
+        return self.name
 
 
 class BloodInventory(models.Model):  # Model for storing available blood types with units available
@@ -43,12 +49,104 @@ class BloodDonor(models.Model):  # Model for storing blood donor details
     units_donated = models.IntegerField(blank=True, null=True)
     last_donated = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Donor list ordering (-last_donated, -id), with and without the blood type filter
+            models.Index(fields=['last_donated', 'id'], name='donor_last_donated_idx'),
+            models.Index(fields=['blood_type', 'last_donated', 'id'], name='donor_type_last_donated_idx'),
+        ]
+
 
 class BloodRequest(models.Model):  # Model for storing blood request made by regular users
+    PENDING = 'Pending'
+    FULFILLED = 'Fulfilled'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (FULFILLED, 'Fulfilled'),
+    ]
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     blood_type = models.ForeignKey(BloodType, on_delete=models.CASCADE)
     units_requested = models.IntegerField()
-    status = models.CharField(max_length=20, default='Pending')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+
+    class Meta:
+        indexes = [
+            # Blood request list filtered on status and ordered by id
+            models.Index(fields=['status', 'id'], name='request_status_idx'),
+        ]
 
     def __str__(self):
         return f"Request by {self.user.username} for {self.units_requested} units of {self.blood_type.name}"
+
+
+class BloodTypeSummary(models.Model):  # Model for storing inventory and request totals per blood type
+    # Kept up to date by database triggers on every write to BloodInventory and BloodRequest (see migration 0009), and
+    # rebuilt from those tables by `manage.py repair_summary`
+    blood_type = models.OneToOneField(BloodType, on_delete=models.CASCADE, primary_key=True)
+    units_available = models.IntegerField(default=0)
+    pending_requests = models.IntegerField(default=0)
+    pending_units = models.IntegerField(default=0)
+    fulfilled_units = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.blood_type.name} - {self.units_available} units, {self.pending_requests} pending requests"
+
+
+class ChangeLogEntry(models.Model):  # Model for storing the latest change of every inventory, donor and request row
+    # Written by database triggers on every insert, update and delete (see migration 0010). A write replaces the row's
+    # previous entry with a new one, so ids only grow and the log holds one entry per row (see changes.py)
+    INVENTORY = 'inventory'
+    DONOR = 'donor'
+    REQUEST = 'request'
+    KIND_CHOICES = [
+        (INVENTORY, 'Blood inventory'),
+        (DONOR, 'Blood donor'),
+        (REQUEST, 'Blood request'),
+    ]
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='change_log_object_unique'),
+        ]
+
+
+class ChangeLogCompaction(models.Model):  # Model for storing the runs of `manage.py compact_changes`
+    compacted_at = models.DateTimeField(auto_now_add=True)
+    compacted_through = models.BigIntegerField()  # Highest change log id removed so far
+    removed = models.IntegerField()
+
+
+class ApprovalJob(models.Model):  # Model for storing approvals queued by approve_request, run by process_approvals
+    QUEUED = 'queued'
+    RUNNING = 'running'  # Only ever seen inside the worker's transaction
+    DONE = 'done'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+    ]
+    APPROVED = 'approved'
+    ALREADY_FULFILLED = 'already_fulfilled'
+    INSUFFICIENT_STOCK = 'insufficient_stock'
+    OUTCOME_CHOICES = [
+        (APPROVED, 'Approved'),
+        (ALREADY_FULFILLED, 'Already fulfilled'),
+        (INSUFFICIENT_STOCK, 'Insufficient stock'),
+    ]
+    blood_request = models.ForeignKey(BloodRequest, on_delete=models.CASCADE)
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES, blank=True)
+    message = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker takes the oldest queued jobs first
+            models.Index(fields=['status', 'id'], name='approval_job_status_idx'),
+        ]
@@ -0,0 +1,147 @@
+"""
+Keyset (cursor) pagination for the list endpoints.
+
+Django's Paginator runs a COUNT(*) and then reads the page with OFFSET, which has to walk past every earlier row.
+KeysetPaginator instead remembers the ordering key of the last row it returned and asks for the rows after it,
+so every page costs the same index range scan however deep the client has paged. Clients opt in with
+`?pagination=cursor` and then follow the opaque `next` / `previous` cursors from the response.
+
+1. KeysetPaginator: Pages a queryset on a unique ordering such as ('-last_donated', '-id'). NULLs always sort last.
+   Pages hold model instances, or the tuples of a values_list() queryset when its `columns` are given.
+2. InvalidCursor: Raised when a client sends a cursor that wasn't produced by the paginator.
+3. is_cursor_request / get_page_size / wants_count: Read the pagination options from the query string.
+"""
+
+import base64
+import binascii
+import json
+import operator
+from dataclasses import dataclass
+from functools import reduce
+from types import SimpleNamespace
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+DEFAULT_PAGE_SIZE = 5  # Same page size as the offset paginated views
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+@dataclass
+class KeysetPage:
+    object_list: list
+    next_cursor: str | None
+    previous_cursor: str | None
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, ordering, page_size=DEFAULT_PAGE_SIZE, columns=None):
+        self.queryset = queryset
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.page_size = page_size
+        self.model_fields = [queryset.model._meta.get_field(name) for name, _ in self.fields]
+        # Positions of the ordering fields in values_list() rows, which must include them
+        self.key_positions = None if columns is None else [list(columns).index(name) for name, _ in self.fields]
+
+    def get_page(self, cursor=None):
+        forward, key, queryset = self.page_query(cursor)
+        return self.build_page(forward, key, list(queryset))
+
+    async def aget_page(self, cursor=None):
+        forward, key, queryset = self.page_query(cursor)
+        return self.build_page(forward, key, [row async for row in queryset])
+
+    def page_query(self, cursor):
+        forward, key = self.decode_cursor(cursor) if cursor else (True, None)
+
+        queryset = self.queryset.order_by(*self.ordering(reverse=not forward))
+        if key is not None:
+            queryset = queryset.filter(self.after(key) if forward else self.before(key))
+        return forward, key, queryset[:self.page_size + 1]  # One extra row tells whether there is another page
+
+    def build_page(self, forward, key, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if forward:
+            has_next, has_previous = has_more, key is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        return KeysetPage(
+            object_list=rows,
+            next_cursor=self.encode_cursor(True, rows[-1]) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(False, rows[0]) if rows and has_previous else None,
+        )
+
+    def ordering(self, reverse=False):
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        return [F(name).desc(**nulls) if descending != reverse else F(name).asc(**nulls)
+                for name, descending in self.fields]
+
+    def after(self, key):  # Rows that come after `key` in the page ordering (NULLs last)
+        terms = []
+        for i, ((name, descending), value) in enumerate(zip(self.fields, key)):
+            if value is None:
+                continue  # Nothing sorts after NULL within this column
+            lookup = f"{name}__lt" if descending else f"{name}__gt"
+            terms.append(self.equal(key[:i]) & (Q(**{lookup: value}) | Q(**{f"{name}__isnull": True})))
+        return reduce(operator.or_, terms)
+
+    def before(self, key):  # Rows that come before `key` in the page ordering (NULLs last)
+        terms = []
+        for i, ((name, descending), value) in enumerate(zip(self.fields, key)):
+            if value is None:
+                term = Q(**{f"{name}__isnull": False})
+            else:
+                term = Q(**{f"{name}__gt" if descending else f"{name}__lt": value})
+            terms.append(self.equal(key[:i]) & term)
+        return reduce(operator.or_, terms)
+
+    def equal(self, values):
+        condition = Q()
+        for (name, _), value in zip(self.fields, values):
+            condition &= Q(**{f"{name}__isnull": True}) if value is None else Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, forward, row):
+        if self.key_positions is not None:  # A values_list() tuple, value_to_string() reads attributes
+            row = SimpleNamespace(**{field.attname: row[position]
+                                     for field, position in zip(self.model_fields, self.key_positions)})
+        key = [field.value_to_string(row) if getattr(row, field.attname) is not None else None
+               for field in self.model_fields]
+        payload = json.dumps({'d': 'n' if forward else 'p', 'k': key}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values = payload['k']
+            if payload['d'] not in ('n', 'p') or len(values) != len(self.model_fields):
+                raise InvalidCursor(cursor)
+            key = [None if value is None else field.to_python(value)
+                   for field, value in zip(self.model_fields, values)]
+        except (binascii.Error, ValueError, TypeError, KeyError, ValidationError):
+            raise InvalidCursor(cursor)
+        return payload['d'] == 'n', key
+
+
+def is_cursor_request(request):
+    return request.GET.get('pagination') == 'cursor' or 'cursor' in request.GET
+
+
+def get_page_size(request):  # Client chosen page size, capped at MAX_PAGE_SIZE
+    try:
+        page_size = int(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+    return min(max(page_size, 1), MAX_PAGE_SIZE)
+
+
+def wants_count(request):  # The total is only counted when asked for, it costs a full COUNT(*)
+    return request.GET.get('count', '').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,141 @@
+"""
+Bulk user provisioning for the Blood Bank Management System.
+
+user_register hashes the password on the worker handling the request and writes each user with three queries.
+Onboarding a whole hospital's staff goes through provision_users instead:
+
+1. UserProvisionSerializer: The fields user_register accepts (username, email, password, is_staff), one row each.
+2. provision_users: Validates rows read by imports.read_rows, checks usernames and emails for uniqueness once per
+   batch, hashes the batch's passwords across a pool of processes (PBKDF2 is CPU bound) and inserts the batch with a
+   single bulk INSERT.
+3. PasswordHashing: Hashes each batch's passwords. Starting a worker (a new interpreter running django.setup()) costs
+   about as much as hashing a few passwords, so the pool is only started for a batch with at least
+   MIN_PASSWORDS_PER_WORKER passwords per worker, with no more workers than that allows. Smaller uploads, such as
+   one user sent to the endpoint, are hashed in the calling process.
+"""
+
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from .imports import ImportResult, RowError
+
+PROVISION_BATCH_SIZE = 500
+MIN_PASSWORDS_PER_WORKER = 8
+USERNAME_TAKEN = {'username': ['A user with that username already exists.']}
+EMAIL_TAKEN = {'email': ['A user with that email already exists.']}
+
+
+class UserProvisionSerializer(serializers.Serializer):
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField(required=False, allow_blank=True, default='')
+    password = serializers.CharField(max_length=128, trim_whitespace=False)
+    is_staff = serializers.BooleanField(default=False)
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def create_hashing_pool(workers):
+    # Spawned rather than forked, so the workers don't inherit the web server's threads and database connections
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+
+
+class PasswordHashing:
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = None
+        self.pool_workers = 0
+
+    def hash(self, passwords):  # Returns the hashes, in order
+        if self.pool is None:
+            workers = min(self.workers, len(passwords) // MIN_PASSWORDS_PER_WORKER)
+            if workers <= 1:
+                return [make_password(password) for password in passwords]
+            # Started once, by the first batch worth it, and reused by the next ones
+            self.pool = create_hashing_pool(workers)
+            self.pool_workers = workers
+        chunksize = max(1, math.ceil(len(passwords) / (self.pool_workers * 4)))
+        return list(self.pool.map(make_password, passwords, chunksize=chunksize))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+def provision_users(rows, workers=None, batch_size=PROVISION_BATCH_SIZE):
+    hashing = PasswordHashing(workers or default_workers())
+    try:
+        return _provision_users(rows, hashing, batch_size)
+    finally:
+        hashing.close()
+
+
+def _provision_users(rows, hashing, batch_size):
+    result = ImportResult()
+    rows = iter(rows)
+    serializer = UserProvisionSerializer()
+
+    while batch := list(islice(rows, batch_size)):
+        valid = []
+        for row_number, row in batch:
+            if isinstance(row, RowError):
+                result.add_error(row_number, row.errors)
+                continue
+            try:
+                valid.append((row_number, serializer.run_validation(row)))
+            except ValidationError as e:
+                result.add_error(row_number, as_serializer_error(e))
+
+        taken_usernames = set(User.objects.filter(username__in=[data['username'] for _, data in valid])
+                              .values_list('username', flat=True))
+        taken_emails = set(User.objects.filter(email__in=[data['email'] for _, data in valid if data['email']])
+                           .values_list('email', flat=True))
+        accepted = []
+        for row_number, data in valid:
+            if data['username'] in taken_usernames:
+                result.add_error(row_number, USERNAME_TAKEN)
+            elif data['email'] and data['email'] in taken_emails:
+                result.add_error(row_number, EMAIL_TAKEN)
+            else:
+                taken_usernames.add(data['username'])  # Also catches the same user twice within one batch
+                if data['email']:
+                    taken_emails.add(data['email'])
+                accepted.append((row_number, data))
+
+        hashes = hashing.hash([data['password'] for _, data in accepted])
+        users = [(row_number, User(username=data['username'], email=data['email'], is_staff=data['is_staff'],
+                                   password=password))
+                 for (row_number, data), password in zip(accepted, hashes)]
+        _insert_batch(users, result)
+
+    return result
+
+
+def _insert_batch(users, result):
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([user for _, user in users])
+        result.imported += len(users)
+    except IntegrityError:
+        # A concurrent writer took one of the usernames after the check, fall back to one savepoint per row
+        for row_number, user in users:
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                result.imported += 1
+            except IntegrityError:
+                result.add_error(row_number, USERNAME_TAKEN)
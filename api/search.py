@@ -0,0 +1,54 @@
+"""
+Full-text donor search, served by the search_donors view.
+
+Donor names are indexed in the api_blooddonor_fts FTS5 table, which triggers keep in sync with api_blooddonor (see
+migration 0008). A query matches the donors whose names contain all of its words, the last one as a prefix as it is
+still being typed ("john sm" finds "John Smith"). A search is an index lookup instead of a LIKE '%x%' scan over every
+donor.
+
+1. match_expression: Turns the words of a client query into an FTS5 prefix query. Each word is quoted, so FTS5 syntax
+   typed by a client is searched for literally.
+2. search_donors: One page of matching donors in id order, optionally of some blood types only. The ids of the page
+   come from the full-text index, then the page's columns are read with the same values_list() query as the donor
+   list.
+"""
+
+import re
+
+from django.db import connections, router
+
+from .models import BloodDonor
+from .serializers import DonorValuesSerializer
+
+SEARCH_TABLE = 'api_blooddonor_fts'
+WORD = re.compile(r'\w+')
+
+
+def match_expression(query):  # None when the query has no words
+    words = WORD.findall(query)
+    if not words:
+        return None
+    # Only the last word is a prefix: FTS5 reads a prefix's whole doclist into memory unless the prefix index covers
+    # its length, which takes tens of milliseconds for a word shared by millions of donors
+    return ' '.join([*(f'"{word}"' for word in words[:-1]), f'"{words[-1]}"*'])
+
+
+def search_donors(expression, blood_type_ids=(), page_size=20, after=0):
+    # Returns (DonorValuesSerializer rows, id to continue after or None on the last page)
+    sql = f'SELECT {SEARCH_TABLE}.rowid FROM {SEARCH_TABLE}'
+    params = []
+    if blood_type_ids:
+        sql += (f' JOIN {BloodDonor._meta.db_table} donor ON donor.id = {SEARCH_TABLE}.rowid'
+                f' AND donor.blood_type_id IN ({", ".join(["%s"] * len(blood_type_ids))})')
+        params += blood_type_ids
+    sql += f' WHERE {SEARCH_TABLE} MATCH %s AND {SEARCH_TABLE}.rowid > %s ORDER BY {SEARCH_TABLE}.rowid LIMIT %s'
+    params += [expression, after, page_size + 1]  # One extra row tells whether there is another page
+
+    with connections[router.db_for_read(BloodDonor)].cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+
+    has_more = len(ids) > page_size
+    ids = ids[:page_size]
+    rows = list(BloodDonor.objects.filter(id__in=ids).order_by('id').values_list(*DonorValuesSerializer.columns()))
+    return rows, ids[-1] if has_more else None
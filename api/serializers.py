@@ -15,24 +15,44 @@ This module contains serializers for the Blood Bank Management System API.
    - Serializes the BloodRequest model (all fields).
    - Converts blood type name to PK for requests.
 
+The name <-> PK conversion is shared through BloodTypeNameMixin, which resolves names with the process-wide
+blood type registry (see blood_types.py) instead of querying BloodType on every write. TimedSerializerMixin and
+TimedListSerializer add the time spent in `serializer.data` to the request's Server-Timing header (see timing.py).
+
+5. ValuesSerializer (DonorValuesSerializer, BloodRequestValuesSerializer, BloodInventoryValuesSerializer):
+   - Read-only fast path for the list responses. Serializes the tuples of `queryset.values_list(*Serializer.columns())`,
+     with the blood type name joined in SQL, to exactly the output of the ModelSerializer they stand in for, without
+     building model instances or running a DRF field per value.
+   - BloodTypeSummaryValuesSerializer has no ModelSerializer counterpart, it serializes the rows of the summary view.
+
+6. ApprovalJobSerializer:
+   - Serializes the ApprovalJob model (status and outcome of a queued approval), read-only.
+
 These serializers facilitate data conversion between models and JSON for API requests.
 """
 
 from rest_framework import serializers
 from .models import *
 from .models import BloodType
+from .blood_types import blood_type_registry
+from .timing import TimedListSerializer, TimedSerializerMixin, timed
 
 
-class BloodTypeSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = BloodType
-        fields = ['name']
+class BloodTypeField(serializers.PrimaryKeyRelatedField):
+    # Same as PrimaryKeyRelatedField, but the PK is checked against the blood type registry instead of the database
+    def to_internal_value(self, data):
+        try:
+            return blood_type_registry.get_instance(data)
+        except BloodType.DoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
 
 
-class BloodInventorySerializer(serializers.ModelSerializer):
-    class Meta:
-        model = BloodInventory
-        fields = "__all__"
+class BloodTypeNameMixin:
+    def build_relational_field(self, field_name, relation_info):
+        field_class, field_kwargs = super().build_relational_field(field_name, relation_info)
+        if field_name == 'blood_type':
+            field_class = BloodTypeField
+        return field_class, field_kwargs
 
     # For API responses, converting PK value to corresponding name for readability
     def to_representation(self, instance):
@@ -50,8 +70,7 @@ class BloodInventorySerializer(serializers.ModelSerializer):
             })
 
         try:
-            blood_type = BloodType.objects.get(name=blood_type_name)
-            data['blood_type'] = blood_type.id
+            data['blood_type'] = blood_type_registry.get_id(blood_type_name)
         except BloodType.DoesNotExist:
             raise serializers.ValidationError({
                 'blood_type': f"Blood type '{blood_type_name}' does not exist."
@@ -60,61 +79,82 @@ class BloodInventorySerializer(serializers.ModelSerializer):
         return super().to_internal_value(data)
 
 
-class DonorSerializer(serializers.ModelSerializer):
+class BloodTypeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
-        model = BloodDonor
-        fields = ['donor_name', 'blood_type', 'units_donated', 'last_donated']
-
-    # For API responses, converting PK value to corresponding name for readability
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        representation['blood_type'] = instance.blood_type.name
-        return representation
+        model = BloodType
+        list_serializer_class = TimedListSerializer
+        fields = ['name']
 
-    # For POST requests, converting name to corresponding PK value
-    def to_internal_value(self, data):
-        blood_type_name = data.get('blood_type')
 
-        if not blood_type_name:
-            raise serializers.ValidationError({
-                'blood_type': 'This field is required.'
-            })
+class BloodInventorySerializer(TimedSerializerMixin, BloodTypeNameMixin, serializers.ModelSerializer):
+    class Meta:
+        model = BloodInventory
+        list_serializer_class = TimedListSerializer
+        fields = "__all__"
 
-        try:
-            blood_type = BloodType.objects.get(name=blood_type_name)
-            data['blood_type'] = blood_type.id
-        except BloodType.DoesNotExist:
-            raise serializers.ValidationError({
-                'blood_type': f"Blood type '{blood_type_name}' does not exist."
-            })
 
-        return super().to_internal_value(data)
+class DonorSerializer(TimedSerializerMixin, BloodTypeNameMixin, serializers.ModelSerializer):
+    class Meta:
+        model = BloodDonor
+        list_serializer_class = TimedListSerializer
+        fields = ['donor_name', 'blood_type', 'units_donated', 'last_donated']
 
 
-class BloodRequestSerializer(serializers.ModelSerializer):
+class BloodRequestSerializer(TimedSerializerMixin, BloodTypeNameMixin, serializers.ModelSerializer):
     class Meta:
         model = BloodRequest
+        list_serializer_class = TimedListSerializer
         fields = "__all__"
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        representation['blood_type'] = instance.blood_type.name
-        return representation
 
-    def to_internal_value(self, data):
-        blood_type_name = data.get('blood_type')
+class ApprovalJobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ApprovalJob
+        fields = ['id', 'blood_request', 'status', 'outcome', 'message', 'created_at', 'finished_at']
+        read_only_fields = fields
 
-        if not blood_type_name:
-            raise serializers.ValidationError({
-                'blood_type': 'This field is required.'
-            })
 
-        try:
-            blood_type = BloodType.objects.get(name=blood_type_name)
-            data['blood_type'] = blood_type.id
-        except BloodType.DoesNotExist:
-            raise serializers.ValidationError({
-                'blood_type': f"Blood type '{blood_type_name}' does not exist."
-            })
+class ValuesSerializer:
+    # {output name: values_list() lookup}, in the ModelSerializer's field order (for "__all__": the primary key, other
+    # model fields, then relations)
+    fields = {}
+    date_fields = ()  # Output names holding dates, rendered in ISO 8601 as DRF's DateField does
 
-        return super().to_internal_value(data)
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def columns(cls, *extra):  # Extra columns (e.g. a keyset cursor's ordering) go last and are left out of the output
+        return [*cls.fields.values(), *(column for column in extra if column not in cls.fields.values())]
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            names = list(self.fields)
+            data = [dict(zip(names, row)) for row in self.rows]
+            for name in self.date_fields:
+                for item in data:
+                    if item[name] is not None:
+                        item[name] = item[name].isoformat()
+            return data
+
+
+class BloodInventoryValuesSerializer(ValuesSerializer):  # Same output as BloodInventorySerializer
+    fields = {'id': 'id', 'quantity': 'quantity', 'blood_type': 'blood_type__name'}
+
+
+class DonorValuesSerializer(ValuesSerializer):  # Same output as DonorSerializer
+    fields = {'donor_name': 'donor_name', 'blood_type': 'blood_type__name', 'units_donated': 'units_donated',
+              'last_donated': 'last_donated'}
+    date_fields = ('last_donated',)
+
+
+class BloodRequestValuesSerializer(ValuesSerializer):  # Same output as BloodRequestSerializer
+    fields = {'id': 'id', 'units_requested': 'units_requested', 'status': 'status', 'user': 'user',
+              'blood_type': 'blood_type__name'}
+
+
+class BloodTypeSummaryValuesSerializer(ValuesSerializer):  # Rows of BloodTypeSummary, for the summary view
+    fields = {'blood_type': 'blood_type__name', 'units_available': 'units_available',
+              'pending_requests': 'pending_requests', 'pending_units': 'pending_units',
+              'fulfilled_units': 'fulfilled_units'}
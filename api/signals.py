@@ -0,0 +1,44 @@
+"""
+Signal handlers for the Blood Bank Management System.
+
+1. BloodType post_save / post_delete: Invalidates the process-wide blood type registry, both straight away
+   (for this process) and again once the transaction commits (so other workers reload committed data).
+2. User post_save / post_delete: Drops the user from the authentication user cache of this process and, straight
+   away and again once the transaction commits, of every other process, so deactivation and staff changes apply on
+   the next request.
+3. BlacklistedToken post_save: Tells the token blacklist filters of every process to read the new entry, straight away
+   and again once the transaction commits.
+"""
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .authentication import user_cache
+from .blood_types import blood_type_registry
+from .models import BloodType
+from .tokens import blacklist_filter
+
+
+@receiver(post_save, sender=BloodType)
+@receiver(post_delete, sender=BloodType)
+def invalidate_blood_type_registry(sender, **kwargs):
+    blood_type_registry.invalidate()
+    transaction.on_commit(blood_type_registry.invalidate)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_id = instance.pk  # delete() clears instance.pk before the commit
+    user_cache.invalidate(user_id)
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def invalidate_blacklist_filter(sender, created, **kwargs):
+    if created:
+        blacklist_filter.invalidate()
+        transaction.on_commit(blacklist_filter.invalidate)
@@ -0,0 +1,147 @@
+"""
+Server-Sent Events stream of the blood inventory levels, served by async_views.inventory_stream through
+bloodbank/asgi.py.
+
+1. InventoryBroadcaster: One per process (inventory_broadcaster). While anyone is subscribed, a single task reads the
+   inventory levels every INVENTORY_STREAM_POLL_INTERVAL seconds and hands the blood types whose quantity changed to
+   every subscriber. That is one small query per interval however many clients are connected, and it sees every write:
+   views, admin, management commands and other server processes alike.
+2. Subscriber: Backpressure by coalescing. Handing changes to a subscriber only merges them into its pending levels
+   (the latest quantity per blood type) and never waits for the client. A slow client gets fewer, newer updates and
+   holds at most one pending level per blood type, and nobody else waits for it.
+3. InventoryStream: The body of one SSE response. Sends a `snapshot` event with every level on connect, then an
+   `inventory` event with the levels that changed, and a comment line as a heartbeat after STREAM_HEARTBEAT_INTERVAL
+   seconds without changes. A heartbeat written to a dead connection fails and ends the response, which unsubscribes;
+   so does the client disconnecting (Django cancels the response). The stream ends when the access token it was
+   opened with expires, and EventSource clients reconnect (with a fresh token) after RECONNECT_DELAY_MS.
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .database import reading_only
+from .models import BloodInventory
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY_MS = 5000
+HEARTBEAT = ': heartbeat\n\n'
+
+
+def sse_event(event, levels):
+    blood_types = [{'blood_type': name, 'quantity': quantity} for name, quantity in sorted(levels.items())]
+    return f'event: {event}\ndata: {json.dumps({"blood_types": blood_types})}\n\n'
+
+
+async def read_levels():  # {blood type name: units available}
+    return {name: quantity async for name, quantity in BloodInventory.objects.values_list('blood_type__name',
+                                                                                          'quantity')}
+
+
+class Subscriber:
+    def __init__(self):
+        self.pending = {}
+        self._changed = asyncio.Event()
+
+    def push(self, levels):
+        self.pending.update(levels)
+        self._changed.set()
+
+    async def changes(self, timeout):  # The pending levels, {} when none arrived within timeout seconds
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._changed.clear()
+        pending, self.pending = self.pending, {}
+        return pending
+
+
+class InventoryBroadcaster:
+    def __init__(self):
+        self.levels = {}
+        self.subscribers = set()
+        self._task = None
+        self._started = None
+
+    async def subscribe(self):  # Returns (Subscriber, the current levels)
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._started = loop.create_future()
+            self._task = loop.create_task(self._poll(self._started))
+        await asyncio.shield(self._started)
+
+        subscriber = Subscriber()
+        self.subscribers.add(subscriber)
+        return subscriber, dict(self.levels)
+
+    def unsubscribe(self, subscriber):  # The polling task stops by itself once nobody is subscribed
+        self.subscribers.discard(subscriber)
+
+    def publish(self, levels):
+        changed = {name: quantity for name, quantity in levels.items() if self.levels.get(name) != quantity}
+        changed.update({name: 0 for name in self.levels if name not in levels})  # Inventory row deleted
+        self.levels = levels
+        if changed:
+            for subscriber in list(self.subscribers):
+                subscriber.push(changed)
+
+    async def _poll(self, started):
+        reading_only.set(True)  # Only in this task's own copy of the context: reads go to the read connection
+        try:
+            self.levels = await read_levels()
+        except DatabaseError as e:
+            started.set_exception(e)
+            return
+        started.set_result(None)
+
+        while True:
+            await asyncio.sleep(settings.INVENTORY_STREAM_POLL_INTERVAL)
+            if not self.subscribers:
+                return
+            try:
+                self.publish(await read_levels())
+            except DatabaseError:
+                logger.exception("Reading the inventory levels for the stream failed")
+
+
+inventory_broadcaster = InventoryBroadcaster()
+
+
+class InventoryStream:  # Async iterator of SSE messages, unsubscribed by close() or by being cancelled
+    def __init__(self, broadcaster, expires_at=None):
+        self.broadcaster = broadcaster
+        self.expires_at = expires_at  # Unix time the stream ends at
+        self.subscriber = None
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        timeout = settings.STREAM_HEARTBEAT_INTERVAL
+        if self.expires_at is not None:
+            timeout = min(timeout, self.expires_at - time.time())
+        if self.closed or timeout <= 0:
+            self.close()
+            raise StopAsyncIteration
+
+        try:
+            if self.subscriber is None:
+                self.subscriber, levels = await self.broadcaster.subscribe()
+                return f'retry: {RECONNECT_DELAY_MS}\n' + sse_event('snapshot', levels)
+            changes = await self.subscriber.changes(timeout)
+        except asyncio.CancelledError:  # Client disconnected: Django cancels the response without closing it
+            self.close()
+            raise
+        return sse_event('inventory', changes) if changes else HEARTBEAT
+
+    def close(self):
+        self.closed = True
+        if self.subscriber is not None:
+            self.broadcaster.unsubscribe(self.subscriber)
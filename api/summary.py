@@ -0,0 +1,57 @@
+"""
+Per blood type totals of the inventory and the blood requests, served by the summary view.
+
+BloodTypeSummary holds one row per blood type: units available, pending requests and their units, and fulfilled units.
+Triggers on api_bloodinventory and api_bloodrequest (see migration 0009) add the difference of every write to it, in the
+same transaction as the write, so the summary is one primary key scan instead of a COUNT / SUM over every request.
+
+1. summary_rows: The BloodTypeSummaryValuesSerializer rows of every blood type, in one query.
+2. source_totals: The totals of every blood type computed from BloodInventory and BloodRequest (a GROUP BY over every
+   request).
+3. rebuild_summary: Recomputes every row from BloodInventory and BloodRequest, for `manage.py repair_summary`. Returns
+   the blood types whose row was wrong (or missing), with the stored and the recomputed totals.
+"""
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .models import BloodInventory, BloodRequest, BloodType, BloodTypeSummary
+from .serializers import BloodTypeSummaryValuesSerializer
+
+TOTALS = ('units_available', 'pending_requests', 'pending_units', 'fulfilled_units')
+
+
+def summary_rows():
+    return list(BloodTypeSummary.objects.order_by('blood_type_id')
+                .values_list(*BloodTypeSummaryValuesSerializer.columns()))
+
+
+def source_totals():  # {blood type id: totals} read from the source tables
+    blood_type_ids = BloodType.objects.values_list('id', flat=True)
+    totals = {blood_type_id: dict.fromkeys(TOTALS, 0) for blood_type_id in blood_type_ids}
+    for blood_type_id, quantity in BloodInventory.objects.values_list('blood_type_id', 'quantity'):
+        totals[blood_type_id]['units_available'] += quantity
+
+    pending = Q(status=BloodRequest.PENDING)
+    requests = BloodRequest.objects.order_by().values('blood_type_id').annotate(
+        pending_requests=Count('id', filter=pending),
+        pending_units=Sum('units_requested', filter=pending, default=0),
+        fulfilled_units=Sum('units_requested', filter=Q(status=BloodRequest.FULFILLED), default=0),
+    )
+    for row in requests:
+        totals[row['blood_type_id']].update({name: row[name] for name in TOTALS[1:]})
+    return totals
+
+
+def rebuild_summary():
+    with transaction.atomic():
+        totals = source_totals()
+        stored = {row['blood_type_id']: {name: row[name] for name in TOTALS}
+                  for row in BloodTypeSummary.objects.select_for_update().values('blood_type_id', *TOTALS)}
+        repaired = {blood_type_id: (stored.get(blood_type_id), row)
+                    for blood_type_id, row in totals.items() if stored.get(blood_type_id) != row}
+
+        BloodTypeSummary.objects.all().delete()
+        BloodTypeSummary.objects.bulk_create([BloodTypeSummary(blood_type_id=blood_type_id, **row)
+                                              for blood_type_id, row in totals.items()])
+    return repaired
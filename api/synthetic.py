@@ -0,0 +1,167 @@
+"""
+Synthetic data for scaling tests, loaded by `manage.py generate_data`.
+
+1. generate_users / generate_donors / generate_blood_requests: Yield rows with realistic distributions. Blood types
+   follow their approximate share of the population, donation dates cluster in the recent past with a long tail,
+   and most blood requests are already fulfilled. The same seed always yields the same rows.
+2. insert_rows: Writes rows with one executemany INSERT per batch. Building a model instance per row (what bulk_create
+   does) costs several times more than the INSERT itself at these volumes.
+3. triggers_suspended / index_generated_rows: On SQLite, the triggers of api_blooddonor and api_bloodrequest (search
+   index, blood type summary and change log, see migrations 0008 - 0010) more than double the cost of an insert. The
+   load runs with them dropped, then the derived tables are brought up to date with one statement each. Generated
+   rows go into the change log like any other write: a client syncing from 0 must get every live row.
+"""
+
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import BloodDonor, BloodRequest, ChangeLogEntry
+from .search import SEARCH_TABLE
+from .summary import rebuild_summary
+
+GENERATE_BATCH_SIZE = 10000
+
+# Approximate share of each blood type in the population, in percent
+BLOOD_TYPE_WEIGHTS = {'O+': 37.4, 'A+': 35.7, 'B+': 8.5, 'O-': 6.6, 'A-': 6.3, 'AB+': 3.4, 'B-': 1.5, 'AB-': 0.6}
+NEVER_DONATED_SHARE = 0.05  # Registered donors without a recorded donation
+MEAN_DAYS_SINCE_DONATION = 240
+DONATION_HISTORY_DAYS = 5 * 365
+PENDING_SHARE = 0.15
+STAFF_SHARE = 0.02
+UNITS_DONATED_WEIGHTS = {1: 50, 2: 25, 3: 13, 4: 8, 5: 4}
+UNITS_REQUESTED_WEIGHTS = {1: 45, 2: 30, 3: 15, 4: 10}
+TRIGGER_TABLES = [BloodDonor._meta.db_table, BloodRequest._meta.db_table]
+
+
+def _weighted(rng, weights, count):
+    return rng.choices(list(weights), weights=list(weights.values()), k=count)
+
+
+def generate_users(rng, count, prefix, password):  # Yields (username, email, password hash, is_staff)
+    for i in range(count):
+        username = f'{prefix}-user-{i}'
+        yield username, f'{username}@example.com', password, rng.random() < STAFF_SHARE
+
+
+def generate_donors(rng, count, prefix, blood_type_ids, today=None):
+    # Yields (donor_name, blood_type_id, units_donated, last_donated)
+    today = today or date.today()
+    for start in range(0, count, GENERATE_BATCH_SIZE):
+        size = min(GENERATE_BATCH_SIZE, count - start)
+        blood_types = _weighted(rng, BLOOD_TYPE_WEIGHTS, size)
+        units = _weighted(rng, UNITS_DONATED_WEIGHTS, size)
+        for i, blood_type, units_donated in zip(range(start, start + size), blood_types, units):
+            if rng.random() < NEVER_DONATED_SHARE:
+                last_donated = None
+            else:
+                days_ago = min(int(rng.expovariate(1 / MEAN_DAYS_SINCE_DONATION)), DONATION_HISTORY_DAYS)
+                last_donated = today - timedelta(days=days_ago)
+            yield f'{prefix}-donor-{i}', blood_type_ids[blood_type], units_donated, last_donated
+
+
+def generate_blood_requests(rng, count, user_ids, blood_type_ids):
+    # Yields (user_id, blood_type_id, units_requested, status)
+    for start in range(0, count, GENERATE_BATCH_SIZE):
+        size = min(GENERATE_BATCH_SIZE, count - start)
+        blood_types = _weighted(rng, BLOOD_TYPE_WEIGHTS, size)
+        units = _weighted(rng, UNITS_REQUESTED_WEIGHTS, size)
+        for blood_type, units_requested in zip(blood_types, units):
+            status = BloodRequest.PENDING if rng.random() < PENDING_SHARE else BloodRequest.FULFILLED
+            yield rng.choice(user_ids), blood_type_ids[blood_type], units_requested, status
+
+
+def insert_rows(model, field_names, rows, batch_size=GENERATE_BATCH_SIZE):  # Returns the number of rows written
+    fields = [model._meta.get_field(name) for name in field_names]
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+    adapters = [_adapter(field) for field in fields]
+
+    rows = iter(rows)
+    written = 0
+    while batch := list(islice(rows, batch_size)):
+        if any(adapters):
+            batch = [tuple(adapt(value) if adapt and value is not None else value
+                           for adapt, value in zip(adapters, row)) for row in batch]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+        written += len(batch)
+    return written
+
+
+def _adapter(field):  # The backend's conversion for date and datetime values, None when values go in as they are
+    internal_type = field.get_internal_type()
+    if internal_type == 'DateField':
+        return connection.ops.adapt_datefield_value
+    if internal_type == 'DateTimeField':
+        return connection.ops.adapt_datetimefield_value
+    return None
+
+
+def insert_users(rows, batch_size=GENERATE_BATCH_SIZE):
+    joined = timezone.now()
+    return insert_rows(
+        User, ['username', 'email', 'password', 'is_staff', 'is_superuser', 'is_active', 'first_name', 'last_name',
+               'date_joined'],
+        ((username, email, password, is_staff, False, True, '', '', joined)
+         for username, email, password, is_staff in rows),
+        batch_size)
+
+
+def insert_donors(rows, batch_size=GENERATE_BATCH_SIZE):
+    return insert_rows(BloodDonor, ['donor_name', 'blood_type', 'units_donated', 'last_donated'], rows, batch_size)
+
+
+def insert_blood_requests(rows, batch_size=GENERATE_BATCH_SIZE):
+    return insert_rows(BloodRequest, ['user', 'blood_type', 'units_requested', 'status'], rows, batch_size)
+
+
+@contextmanager
+def triggers_suspended(tables=TRIGGER_TABLES):
+    # Drops the SQLite triggers of the tables and creates them again on exit. Run it inside the load's transaction: the
+    # DROP takes SQLite's write lock, so no other connection writes to the tables while their triggers are gone
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+                       f"AND tbl_name IN ({', '.join(['%s'] * len(tables))})", tables)
+        triggers = cursor.fetchall()
+        for name, _ in triggers:
+            cursor.execute(f'DROP TRIGGER {connection.ops.quote_name(name)}')
+    yield
+    with connection.cursor() as cursor:
+        for _, sql in triggers:
+            cursor.execute(sql)
+
+
+def last_ids():  # {model: highest id}, the rows after which a load starts
+    return {model: model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            for model in (BloodDonor, BloodRequest)}
+
+
+def index_generated_rows(after):
+    # Does what the suspended triggers would have for the rows with an id above `after` (see last_ids). Returns the
+    # number of rows indexed
+    if connection.vendor != 'sqlite':
+        return 0
+    donors = connection.ops.quote_name(BloodDonor._meta.db_table)
+    changed_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    indexed = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {connection.ops.quote_name(SEARCH_TABLE)} (rowid, donor_name) '
+                       f'SELECT id, donor_name FROM {donors} WHERE id > %s ORDER BY id', [after[BloodDonor]])
+        for model, kind in ((BloodDonor, ChangeLogEntry.DONOR), (BloodRequest, ChangeLogEntry.REQUEST)):
+            cursor.execute(f'INSERT OR REPLACE INTO {connection.ops.quote_name(ChangeLogEntry._meta.db_table)} '
+                           f'(kind, object_id, deleted, changed_at) SELECT %s, id, 0, %s '
+                           f'FROM {connection.ops.quote_name(model._meta.db_table)} WHERE id > %s ORDER BY id',
+                           [kind, changed_at, after[model]])
+            indexed += cursor.rowcount
+    if BloodRequest.objects.filter(id__gt=after[BloodRequest]).exists():
+        rebuild_summary()
+    return indexed
@@ -8,6 +8,34 @@ Tests Included:
 - Donor Management: Tests for adding, updating, deleting, and fetching blood donor records.
 - Blood Inventory Management: Verifies the functionality for managing blood inventory.
 - Blood Request Management: Tests the ability to request blood and for admins to approve these requests.
+- Blood Type Registry: Checks that writes resolve blood type names without querying BloodType and that the
+  registry is invalidated when blood types change.
+- Query Budgets: Each list endpoint runs a fixed number of queries, however many rows it returns.
+- Cursor Pagination: Walks the donor and blood request lists forwards and backwards with keyset cursors.
+- List Indexes: Exact status filtering and the query plans of the filtered, sorted list queries.
+- Request Approval: Approving takes the requested units out of inventory, or fails with a conflict.
+- Donor Import: Bulk CSV / NDJSON donor uploads, with per row errors.
+- Request Allocation: Fulfilling all pending requests from inventory in one pass (endpoint and management command).
+- Exports: Streamed CSV / NDJSON dumps of donors and blood requests.
+- Async Views: The native async read endpoints answer exactly like their sync counterparts.
+- Cached Authentication: JWT requests reuse the cached user, and user changes invalidate it.
+- Token Blacklist: Blacklist checks answered by the in-memory filter, and batched deletion of expired tokens.
+- User Provisioning: Bulk user creation from CSV / NDJSON with hashed passwords (endpoint and management command),
+  and a hashing pool only for uploads worth one.
+- Bench: The endpoint benchmark covers every route and reports regressions against a baseline.
+- Synthetic Data: generate_data loads reproducible users, donors and blood requests in batches, and indexes them
+  once at the end.
+- Server Timing: Server-Timing headers with database, serialization and render time, and per view aggregates.
+- Metrics: The Prometheus /metrics endpoint, per view counters and histograms and the inventory gauges.
+- Database Profile: SQLite pragmas applied on connect, and list views routed to the read connection.
+- Values Serializers: The values_list() fast path renders the same bytes as the model serializers.
+- Donor Search: Full-text prefix search over donor names, kept in sync by triggers, with blood type filters.
+- Compatible Donors: ABO/Rh compatible donors who may donate today for a blood request, from one indexed query.
+- Blood Type Summary: Per blood type totals kept up to date by every write path, the summary endpoint and its repair.
+- Change Feed: Every write lands in the change log, clients sync from a cursor, and deletions expire by compaction.
+- Inventory Stream: The SSE stream of inventory levels, its shared broadcaster, coalescing and heartbeats.
+- Approval Queue: Queued approvals answer 202 with a job, workers run the jobs in batches, and the job endpoint.
+- Batch: Several write operations in one request and one transaction, applied whole or rolled back whole.
 
 Test Framework:
 - Uses Django's built-in testing framework for creating and running tests.
@@ -20,9 +48,64 @@ To run the tests, execute the following command in the terminal:
 
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from asgiref.sync import async_to_sync, sync_to_async
+import asyncio
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 from django.contrib.auth.models import User
-from rest_framework_simplejwt.tokens import RefreshToken
-from .models import BloodType, BloodDonor, BloodRequest
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from .exports import EXPORT_CHUNK_SIZE
+from .imports import IMPORT_BATCH_SIZE
+from .provisioning import MIN_PASSWORDS_PER_WORKER, provision_users
+from .pagination import MAX_PAGE_SIZE, KeysetPaginator
+from .search import SEARCH_TABLE
+from .matching import COMPATIBLE_DONOR_TYPES, DONATION_INTERVAL
+from .summary import rebuild_summary
+from .changes import compact_changes
+from .approvals import ApprovalWorker, process_approval_batch
+from .batch import MAX_BATCH_OPERATIONS
+from .streams import HEARTBEAT, InventoryBroadcaster, InventoryStream, Subscriber, inventory_broadcaster, \
+    read_levels
+from .synthetic import generate_donors
+from .timing import view_stats
+from .metrics import request_metrics
+from .authentication import UserCache, user_cache
+from .bench import UNSTOCKED_BLOOD_TYPE, compare, failed_scenarios, missing_scenarios, run_benchmark, seed
+from .blood_types import GENERATION_CACHE_KEY, BloodTypeRegistry, blood_type_registry
+from .database import READ_DATABASE, ReadRouter, apply_sqlite_pragmas, read_only, reading_only
+from .models import ApprovalJob, BloodType, BloodDonor, BloodInventory, BloodRequest, BloodTypeSummary, \
+    ChangeLogCompaction, ChangeLogEntry
+from .serializers import BloodInventorySerializer, BloodInventoryValuesSerializer, BloodRequestSerializer, \
+    BloodRequestValuesSerializer, DonorSerializer, DonorValuesSerializer
+from . import tokens
+from .tokens import BlacklistFilter, CachedRefreshToken, blacklist_filter, flush_expired_tokens
+
+
+def run_in_other_process(code):  # Runs `code` in a new Python process with this project's settings, like another worker
+    setup = "import django; django.setup(); "
+    subprocess.run([sys.executable, '-c', setup + code], cwd=settings.BASE_DIR, check=True,
+                   env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'bloodbank.settings',
+                        'BLOODBANK_CACHE_DIR': str(settings.CACHES['default']['LOCATION'])})
 
 
 class TestApiEndpoints(APITestCase):
@@ -236,6 +319,7 @@ class TestApiEndpoints(APITestCase):
         self.test_request_blood_as_regular_user()
 
         self.authenticate_as_admin()
+        BloodInventory.objects.create(blood_type=self.blood_type, quantity=5)  # Approval takes units out of stock
 
         blood_request = BloodRequest.objects.last()  # Get the latest created request
         data = {
@@ -261,3 +345,2075 @@ class TestApiEndpoints(APITestCase):
         response = self.client.post(f'/approve_request/{blood_request.id}', data, format='json')
 
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TestBloodTypeRegistry(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_type = BloodType.objects.create(name="O+")
+
+    def authenticate(self, user):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def blood_type_queries(self, queries):
+        return [query['sql'] for query in queries if '"api_bloodtype"' in query['sql']]
+
+    def test_add_donor_does_not_query_blood_type(self):
+        self.authenticate(self.admin_user)
+        blood_type_registry.get_id("O+")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/add_donor', {
+                "donor_name": "siddhu", "blood_type": "O+", "units_donated": 2}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(BloodDonor.objects.get(donor_name="siddhu").blood_type, self.blood_type)
+        self.assertEqual(self.blood_type_queries(queries.captured_queries), [])
+
+    def test_add_to_blood_inventory_does_not_query_blood_type(self):
+        self.authenticate(self.admin_user)
+        blood_type_registry.get_id("O+")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/add_to_bloodinventory', {"blood_type": "O+", "quantity": 2}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.blood_type_queries(queries.captured_queries), [])
+
+    def test_request_and_approve_do_not_query_blood_type(self):
+        blood_type_registry.get_id("O+")
+
+        self.authenticate(self.regular_user)
+        with CaptureQueriesContext(connection) as request_queries:
+            response = self.client.post('/request_blood', {"blood_type": "O+", "units_requested": 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.authenticate(self.admin_user)
+        BloodInventory.objects.create(blood_type=self.blood_type, quantity=2)
+        blood_request = BloodRequest.objects.get()
+        with CaptureQueriesContext(connection) as approve_queries:
+            response = self.client.post(f'/approve_request/{blood_request.id}',
+                                        {"blood_type": "O+", "status": True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.blood_type_queries(request_queries.captured_queries), [])
+        self.assertEqual(self.blood_type_queries(approve_queries.captured_queries), [])
+
+    def test_unknown_blood_type_is_rejected(self):
+        self.authenticate(self.admin_user)
+
+        response = self.client.post('/add_donor', {
+            "donor_name": "siddhu", "blood_type": "B+", "units_donated": 2}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['blood_type'], "Blood type 'B+' does not exist.")
+
+    def test_add_blood_type_invalidates_registry(self):
+        self.authenticate(self.admin_user)
+        generation = cache.get(GENERATION_CACHE_KEY)
+
+        response = self.client.post('/add_bloodtype', {"name": "B+"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertNotEqual(cache.get(GENERATION_CACHE_KEY), generation)
+        self.assertEqual(blood_type_registry.get_id("B+"), BloodType.objects.get(name="B+").id)
+
+    def test_registry_reloads_when_another_worker_invalidates(self):
+        blood_type_registry.get_id("O+")
+        BloodType.objects.filter(pk=self.blood_type.pk).update(name="O-")  # update() sends no signal
+
+        self.assertEqual(blood_type_registry.get_name(self.blood_type.pk), "O+")
+
+        cache.set(GENERATION_CACHE_KEY, "generation-from-another-worker", None)
+        with mock.patch.object(blood_type_registry, 'generation_check_interval', 0):
+            self.assertEqual(blood_type_registry.get_name(self.blood_type.pk), "O-")
+
+    def test_tests_use_their_own_cache(self):
+        location = Path(settings.CACHES['default']['LOCATION'])
+
+        self.assertNotEqual(location, settings.BASE_DIR / '.cache')  # Where a development server keeps its tokens
+        self.assertEqual(location.parent, Path(tempfile.gettempdir()))
+
+    def test_registry_sees_invalidation_from_another_process(self):
+        registry = BloodTypeRegistry()
+        registry.generation_check_interval = 0
+        registry.get_id("O+")
+        BloodType.objects.filter(pk=self.blood_type.pk).update(name="O-")
+
+        run_in_other_process("from api.blood_types import blood_type_registry; blood_type_registry.invalidate()")
+
+        self.assertEqual(registry.get_name(self.blood_type.pk), "O-")
+
+
+class TestListQueryBudget(APITestCase):
+    # The authenticated user comes from the user cache, so the budget is only what the endpoint itself runs
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_types = [BloodType.objects.create(name=name) for name, _ in BloodType.BLOOD_TYPE_CHOICES]
+        blood_type_registry.get_id("O+")  # Loaded once per process, not part of any request's budget
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.client.get('/get_bloodinventory')  # Puts the admin into the user cache
+
+    def create_rows(self, count):
+        for i in range(count):
+            blood_type = self.blood_types[i % len(self.blood_types)]
+            BloodDonor.objects.create(donor_name=f"donor{i}", blood_type=blood_type, units_donated=1)
+            BloodRequest.objects.create(user=self.regular_user, blood_type=blood_type, units_requested=1)
+            if i < len(self.blood_types):
+                BloodInventory.objects.create(blood_type=blood_type, quantity=i)
+
+    def assert_query_budget(self, url, budget, rows_key=None):
+        for count in (1, 8):
+            self.create_rows(count)
+            with self.assertNumQueries(budget):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            rows = response.json()[rows_key] if rows_key else response.json()
+            self.assertGreater(len(rows), 0)
+            BloodDonor.objects.all().delete()
+            BloodRequest.objects.all().delete()
+            BloodInventory.objects.all().delete()
+
+    def test_get_all_donors_query_budget(self):
+        self.assert_query_budget('/getall_donors/', 2, 'donors')  # COUNT, page
+
+    def test_get_all_donors_with_search_query_budget(self):
+        self.assert_query_budget('/getall_donors/?q=A', 2, 'donors')
+
+    def test_view_all_bloodrequest_query_budget(self):
+        self.assert_query_budget('/get_all_blood_request/', 2, 'blood_requests')  # COUNT, page
+
+    def test_get_blood_inventory_query_budget(self):
+        self.assert_query_budget('/get_bloodinventory', 1)  # inventory
+
+
+class TestCursorPagination(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_type = BloodType.objects.create(name="O+")
+        other_blood_type = BloodType.objects.create(name="A-")
+
+        # Several donors share a date and some never donated, so the id tie-breaker and NULL handling both matter
+        for i in range(13):
+            last_donated = None if i % 4 == 0 else date(2024, 1, 1) + timedelta(days=i // 3)
+            BloodDonor.objects.create(donor_name=f"donor{i}", blood_type=self.blood_type if i % 2 else other_blood_type,
+                                      units_donated=1, last_donated=last_donated)
+        for i in range(7):
+            BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type, units_requested=i + 1)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def walk(self, url, rows_key, params):
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            body = response.json()
+            pages.append(body)
+            if not body['next']:
+                return pages
+            response = self.client.get(url, {**params, 'cursor': body['next']})
+
+    def expected_donor_names(self, queryset):
+        donors = sorted(queryset, key=lambda donor: (donor.last_donated is not None, donor.last_donated, donor.id),
+                        reverse=True)
+        return [donor.donor_name for donor in donors]
+
+    def test_donor_pages_follow_last_donated_then_id(self):
+        pages = self.walk('/getall_donors/', 'donors', {'pagination': 'cursor', 'page_size': 4})
+
+        names = [donor['donor_name'] for page in pages for donor in page['donors']]
+        self.assertEqual(names, self.expected_donor_names(BloodDonor.objects.all()))
+        self.assertEqual([len(page['donors']) for page in pages], [4, 4, 4, 1])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertNotIn('total_donors', pages[0])
+
+    def test_donor_previous_cursor_returns_previous_page(self):
+        pages = self.walk('/getall_donors/', 'donors', {'pagination': 'cursor', 'page_size': 4})
+
+        for previous_page, page in zip(pages, pages[1:]):
+            response = self.client.get('/getall_donors/', {'page_size': 4, 'cursor': page['previous']})
+            self.assertEqual(response.json()['donors'], previous_page['donors'])
+
+    def test_donor_cursor_pages_keep_search_filter(self):
+        pages = self.walk('/getall_donors/', 'donors', {'pagination': 'cursor', 'page_size': 2, 'q': 'O'})
+
+        names = [donor['donor_name'] for page in pages for donor in page['donors']]
+        self.assertEqual(names, self.expected_donor_names(BloodDonor.objects.filter(blood_type=self.blood_type)))
+
+    def test_blood_request_pages_follow_id(self):
+        pages = self.walk('/get_all_blood_request/', 'blood_requests', {'pagination': 'cursor', 'page_size': 3})
+
+        ids = [blood_request['id'] for page in pages for blood_request in page['blood_requests']]
+        self.assertEqual(ids, list(BloodRequest.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_count_only_when_requested(self):
+        with self.assertNumQueries(2):  # user, page
+            response = self.client.get('/get_all_blood_request/', {'pagination': 'cursor'})
+        self.assertNotIn('total_request', response.json())
+
+        response = self.client.get('/get_all_blood_request/', {'pagination': 'cursor', 'count': 'true'})
+        self.assertEqual(response.json()['total_request'], 7)
+
+    def test_page_size_is_capped(self):
+        for i in range(MAX_PAGE_SIZE):
+            BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type, units_requested=1)
+
+        response = self.client.get('/get_all_blood_request/', {'pagination': 'cursor', 'page_size': 10 ** 6})
+
+        self.assertEqual(len(response.json()['blood_requests']), MAX_PAGE_SIZE)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/getall_donors/', {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestListIndexes(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_type = BloodType.objects.create(name="O+")
+        BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type, units_requested=1)
+        BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type, units_requested=2,
+                                    status=BloodRequest.FULFILLED)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_status_filter_is_exact_and_case_insensitive(self):
+        response = self.client.get('/get_all_blood_request/', {'q': 'fulfilled'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['units_requested'] for row in response.json()['blood_requests']], [2])
+
+    def test_unknown_status_is_rejected(self):
+        response = self.client.get('/get_all_blood_request/', {'q': 'fill'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_request_status_filter_uses_index(self):
+        plan = BloodRequest.objects.filter(status=BloodRequest.PENDING).order_by('id').explain()
+
+        self.assertIn('request_status_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_donor_blood_type_filter_uses_index(self):
+        plan = BloodDonor.objects.filter(blood_type_id__in=[self.blood_type.id]).order_by('-last_donated').explain()
+
+        self.assertIn('donor_type_last_donated_idx', plan)
+
+    def test_donor_ordering_uses_index(self):
+        plan = BloodDonor.objects.order_by('-last_donated', '-id').explain()
+
+        self.assertIn('donor_last_donated_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class TestApproveRequestReservation(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_type = BloodType.objects.create(name="O+")
+        self.inventory = BloodInventory.objects.create(blood_type=self.blood_type, quantity=5)
+        self.blood_request = BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type,
+                                                         units_requested=3)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def approve(self, blood_request):
+        return self.client.post(f'/approve_request/{blood_request.id}', {"status": True}, format='json')
+
+    def test_approve_decrements_inventory(self):
+        response = self.approve(self.blood_request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.inventory.refresh_from_db()
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 2)
+        self.assertEqual(self.blood_request.status, BloodRequest.FULFILLED)
+
+    def test_approve_with_insufficient_stock_conflicts(self):
+        self.approve(self.blood_request)
+        second_request = BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type,
+                                                     units_requested=3)
+
+        response = self.approve(second_request)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        second_request.refresh_from_db()
+        self.inventory.refresh_from_db()
+        self.assertEqual(second_request.status, BloodRequest.PENDING)
+        self.assertEqual(self.inventory.quantity, 2)
+
+    def test_approve_without_inventory_row_conflicts(self):
+        blood_type = BloodType.objects.create(name="A-")
+        blood_request = BloodRequest.objects.create(user=self.regular_user, blood_type=blood_type, units_requested=1)
+
+        response = self.approve(blood_request)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_approve_twice_only_takes_units_once(self):
+        self.approve(self.blood_request)
+
+        response = self.approve(self.blood_request)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 2)
+
+    def test_approve_uses_conditional_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.approve(self.blood_request)
+
+        inventory_queries = [query['sql'] for query in queries.captured_queries if '"api_bloodinventory"' in query['sql']]
+        self.assertEqual(len(inventory_queries), 1)
+        self.assertTrue(inventory_queries[0].startswith('UPDATE'))
+
+
+class TestImportDonors(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_type = BloodType.objects.create(name="O+")
+        BloodType.objects.create(name="A-")
+        BloodDonor.objects.create(donor_name="John Doe", blood_type=self.blood_type, units_donated=2)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_import_csv(self):
+        body = (
+            "donor_name,blood_type,units_donated,last_donated\n"
+            "Mark,O+,3,2024-10-01\n"
+            "Zenda,A-,1,\n"
+        )
+
+        response = self.client.post('/import_donors', body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['imported'], 2)
+        self.assertEqual(BloodDonor.objects.get(donor_name="Mark").last_donated, date(2024, 10, 1))
+        self.assertEqual(BloodDonor.objects.get(donor_name="Zenda").last_donated, date.today())
+        self.assertEqual(BloodDonor.objects.get(donor_name="Zenda").blood_type.name, "A-")
+
+    def test_import_ndjson_reports_row_errors(self):
+        body = "\n".join([
+            '{"donor_name": "Mark", "blood_type": "O+", "units_donated": 3}',
+            '{"donor_name": "John Doe", "blood_type": "O+"}',
+            '{"donor_name": "Mark", "blood_type": "A-"}',
+            '{"donor_name": "Zenda", "blood_type": "Z+"}',
+            '{"donor_name": "Siddu"',
+            '{"donor_name": "Siddu", "blood_type": "A-", "units_donated": "many"}',
+        ])
+
+        response = self.client.post('/import_donors', body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response_data = response.json()
+        self.assertEqual(response_data['imported'], 1)
+        self.assertEqual(response_data['failed'], 5)
+        self.assertEqual([error['row'] for error in response_data['errors']], [2, 3, 4, 5, 6])
+        self.assertIn('donor_name', response_data['errors'][0]['errors'])
+        self.assertIn('blood_type', response_data['errors'][2]['errors'])
+        self.assertIn('units_donated', response_data['errors'][4]['errors'])
+        self.assertEqual(BloodDonor.objects.count(), 2)
+
+    def test_import_inserts_in_batches(self):
+        rows = "".join(f"donor{i},O+,1\n" for i in range(IMPORT_BATCH_SIZE * 2 + 1))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/import_donors', "donor_name,blood_type,units_donated\n" + rows,
+                                        content_type='text/csv')
+
+        self.assertEqual(response.json()['imported'], IMPORT_BATCH_SIZE * 2 + 1)
+        name_checks = [query for query in queries.captured_queries if query['sql'].startswith('SELECT "api_blooddonor"')]
+        self.assertEqual(len(name_checks), 3)  # One uniqueness check per batch, not per row
+
+    def test_import_unsupported_format(self):
+        response = self.client.post('/import_donors', {"donor_name": "Mark"}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_import_as_regular_user(self):
+        refresh = RefreshToken.for_user(self.regular_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        response = self.client.post('/import_donors', "donor_name,blood_type\nMark,O+\n", content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(BloodDonor.objects.filter(donor_name="Mark").exists())
+
+
+class TestAllocateRequests(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.o_positive = BloodType.objects.create(name="O+")
+        self.a_negative = BloodType.objects.create(name="A-")
+        BloodInventory.objects.create(blood_type=self.o_positive, quantity=6)
+        BloodInventory.objects.create(blood_type=self.a_negative, quantity=1)
+
+        # O+: 4 units (oldest), then 5 units (too many once the first is served), then 2 units
+        self.requests = [
+            BloodRequest.objects.create(user=self.regular_user, blood_type=blood_type, units_requested=units)
+            for blood_type, units in [(self.o_positive, 4), (self.o_positive, 5), (self.o_positive, 2),
+                                      (self.a_negative, 3)]
+        ]
+        BloodRequest.objects.create(user=self.regular_user, blood_type=self.o_positive, units_requested=1,
+                                    status=BloodRequest.FULFILLED)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def statuses(self):
+        return [BloodRequest.objects.get(pk=blood_request.pk).status for blood_request in self.requests]
+
+    def test_allocate_oldest_first_without_blocking_smaller_requests(self):
+        response = self.client.post('/allocate_requests')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.statuses(), [BloodRequest.FULFILLED, BloodRequest.PENDING, BloodRequest.FULFILLED,
+                                           BloodRequest.PENDING])
+        self.assertEqual(BloodInventory.objects.get(blood_type=self.o_positive).quantity, 0)
+        self.assertEqual(BloodInventory.objects.get(blood_type=self.a_negative).quantity, 1)
+
+        response_data = response.json()
+        self.assertEqual(response_data['fulfilled_requests'], 2)
+        self.assertEqual(response_data['pending_requests'], 2)
+        self.assertEqual(response_data['blood_types'], [
+            {'blood_type': 'O+', 'fulfilled_requests': 2, 'fulfilled_units': 6, 'pending_requests': 1,
+             'units_left': 0, 'units_short': 5},
+            {'blood_type': 'A-', 'fulfilled_requests': 0, 'fulfilled_units': 0, 'pending_requests': 1,
+             'units_left': 1, 'units_short': 2},
+        ])
+
+    def test_allocate_query_count_does_not_grow_with_requests(self):
+        self.client.get('/get_bloodinventory')  # Puts the admin into the user cache
+        with CaptureQueriesContext(connection) as few:
+            self.client.post('/allocate_requests')
+
+        BloodInventory.objects.update(quantity=1000)
+        BloodRequest.objects.bulk_create(
+            BloodRequest(user=self.regular_user, blood_type=self.o_positive, units_requested=1) for _ in range(500))
+        with CaptureQueriesContext(connection) as many:
+            self.client.post('/allocate_requests')
+
+        self.assertEqual(len(many.captured_queries), len(few.captured_queries))
+        self.assertFalse(BloodRequest.objects.filter(status=BloodRequest.PENDING).exists())
+
+    def test_allocate_command(self):
+        out = StringIO()
+
+        call_command('allocate_requests', stdout=out)
+
+        self.assertIn("Fulfilled 2 requests, 2 still pending", out.getvalue())
+        self.assertEqual(BloodInventory.objects.get(blood_type=self.o_positive).quantity, 0)
+
+    def test_allocate_as_regular_user(self):
+        refresh = RefreshToken.for_user(self.regular_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        response = self.client.post('/allocate_requests')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.statuses(), [BloodRequest.PENDING] * 4)
+
+
+class TestExports(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.o_positive = BloodType.objects.create(name="O+")
+        self.a_negative = BloodType.objects.create(name="A-")
+        self.donor = BloodDonor.objects.create(donor_name="John Doe", blood_type=self.o_positive, units_donated=2,
+                                               last_donated=date(2024, 10, 20))
+        BloodDonor.objects.create(donor_name="Zenda", blood_type=self.a_negative)
+        BloodRequest.objects.create(user=self.regular_user, blood_type=self.o_positive, units_requested=2)
+        BloodRequest.objects.create(user=self.regular_user, blood_type=self.a_negative, units_requested=1,
+                                    status=BloodRequest.FULFILLED)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_donors_csv(self):
+        response = self.client.get('/export_donors')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(StringIO(self.content(response))))
+        self.assertEqual(rows, [
+            ['id', 'donor_name', 'blood_type', 'units_donated', 'last_donated'],
+            [str(self.donor.id), 'John Doe', 'O+', '2', '2024-10-20'],
+            [str(self.donor.id + 1), 'Zenda', 'A-', '', ''],
+        ])
+
+    def test_export_donors_ndjson_with_search(self):
+        response = self.client.get('/export_donors', {'output': 'ndjson', 'q': 'O'})
+
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(rows, [{'id': self.donor.id, 'donor_name': 'John Doe', 'blood_type': 'O+',
+                                 'units_donated': 2, 'last_donated': '2024-10-20'}])
+
+    def test_export_blood_requests_with_status_filter(self):
+        response = self.client.get('/export_blood_requests', {'output': 'ndjson', 'q': 'pending'})
+
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([(row['user'], row['blood_type'], row['status']) for row in rows],
+                         [(self.regular_user.id, 'O+', 'Pending')])
+
+    def test_export_streams_in_chunks(self):
+        BloodDonor.objects.bulk_create(BloodDonor(donor_name=f"donor{i}", blood_type=self.o_positive)
+                                       for i in range(EXPORT_CHUNK_SIZE * 2))
+
+        response = self.client.get('/export_donors')
+
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(sum(chunk.count(b"\n") for chunk in chunks), EXPORT_CHUNK_SIZE * 2 + 3)
+
+    def test_export_unknown_output(self):
+        response = self.client.get('/export_donors', {'output': 'xml'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_as_regular_user(self):
+        refresh = RefreshToken.for_user(self.regular_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.assertEqual(self.client.get('/export_donors').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/export_blood_requests').status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TestAsyncViews(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        o_positive = BloodType.objects.create(name="O+")
+        a_negative = BloodType.objects.create(name="A-")
+        BloodInventory.objects.create(blood_type=o_positive, quantity=3)
+        BloodInventory.objects.create(blood_type=a_negative, quantity=4)
+        for i in range(7):
+            BloodDonor.objects.create(donor_name=f"donor{i}", blood_type=o_positive if i % 2 else a_negative,
+                                      units_donated=i, last_donated=date(2024, 1, 1) + timedelta(days=i))
+            BloodRequest.objects.create(user=self.regular_user, blood_type=o_positive, units_requested=i + 1,
+                                        status=BloodRequest.FULFILLED if i % 3 else BloodRequest.PENDING)
+
+    def authenticate(self, user):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def assert_same_response(self, path, params=None):
+        sync_response = self.client.get(f'/{path}', params)
+        async_response = self.client.get(f'/async/{path}', params)
+
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.content, sync_response.content)
+        return async_response
+
+    def test_blood_inventory(self):
+        self.authenticate(self.regular_user)
+
+        self.assert_same_response('get_bloodinventory')
+
+    def test_donors(self):
+        self.authenticate(self.admin_user)
+
+        for params in [None, {'page': 2}, {'page': 'x'}, {'page': 99}, {'q': 'A'},
+                       {'pagination': 'cursor', 'page_size': 3, 'count': 'true'}, {'cursor': 'broken'}]:
+            self.assert_same_response('getall_donors/', params)
+
+        first_page = self.client.get('/async/getall_donors/', {'pagination': 'cursor', 'page_size': 3}).json()
+        self.assert_same_response('getall_donors/', {'cursor': first_page['next'], 'page_size': 3})
+
+    def test_blood_requests(self):
+        self.authenticate(self.admin_user)
+
+        for params in [None, {'page': 2}, {'q': 'pending'}, {'q': 'unknown'}, {'pagination': 'cursor'}]:
+            self.assert_same_response('get_all_blood_request/', params)
+
+    def test_forbidden_for_regular_user(self):
+        self.authenticate(self.regular_user)
+
+        response = self.assert_same_response('getall_donors/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assert_same_response('get_all_blood_request/')
+
+    def test_authentication_errors(self):
+        response = self.assert_same_response('get_bloodinventory')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assert_same_response('get_bloodinventory')
+
+        self.authenticate(self.admin_user)
+        self.admin_user.is_active = False
+        self.admin_user.save()
+        self.assert_same_response('getall_donors/')
+
+    def test_method_not_allowed(self):
+        self.authenticate(self.admin_user)
+
+        response = self.client.post('/async/get_bloodinventory')
+
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(response.content, self.client.post('/get_bloodinventory').content)
+
+
+class TestCachedJWTAuthentication(APITestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.blood_type = BloodType.objects.create(name="O+")
+        BloodInventory.objects.create(blood_type=self.blood_type, quantity=1)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def user_queries(self, queries):
+        return [query['sql'] for query in queries.captured_queries if 'FROM "auth_user"' in query['sql']]
+
+    def test_second_request_does_not_query_user(self):
+        with CaptureQueriesContext(connection) as first:
+            self.client.get('/getall_donors/')
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get('/getall_donors/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.user_queries(first)), 1)
+        self.assertEqual(self.user_queries(second), [])
+
+    def test_async_views_share_the_cache(self):
+        self.client.get('/getall_donors/')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/async/getall_donors/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.user_queries(queries), [])
+
+    def test_staff_change_applies_on_next_request(self):
+        self.assertEqual(self.client.get('/getall_donors/').status_code, status.HTTP_200_OK)
+
+        self.admin_user.is_staff = False
+        self.admin_user.save()
+
+        self.assertEqual(self.client.get('/getall_donors/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_deactivation_applies_on_next_request(self):
+        self.client.get('/getall_donors/')
+
+        self.admin_user.is_active = False
+        self.admin_user.save()
+
+        self.assertEqual(self.client.get('/getall_donors/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_is_rejected(self):
+        self.client.get('/getall_donors/')
+
+        self.admin_user.delete()
+
+        self.assertEqual(self.client.get('/get_bloodinventory').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_entries_expire(self):
+        self.client.get('/getall_donors/')
+        User.objects.filter(pk=self.admin_user.pk).update(is_staff=False)  # update() sends no signal
+
+        self.assertEqual(self.client.get('/getall_donors/').status_code, status.HTTP_200_OK)
+        with mock.patch.object(UserCache, 'ttl', -1):
+            user_cache.set(self.admin_user.pk, self.admin_user)
+        self.assertEqual(self.client.get('/getall_donors/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_change_in_another_process_applies_on_next_check(self):
+        self.client.get('/getall_donors/')
+        User.objects.filter(pk=self.admin_user.pk).update(is_active=False)  # As another worker's save would, unseen here
+
+        run_in_other_process(f"from api.authentication import user_cache; user_cache.invalidate({self.admin_user.pk})")
+
+        with mock.patch.object(user_cache, 'generation_check_interval', 0):
+            self.assertEqual(self.client.get('/getall_donors/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_is_bounded(self):
+        cache = UserCache()
+        with mock.patch.object(UserCache, 'max_size', 2):
+            for user_id in range(3):
+                cache.set(user_id, self.admin_user)
+
+        self.assertIsNone(cache.get(0))
+        self.assertIsNotNone(cache.get(2))
+
+
+class TestTokenBlacklist(APITestCase):
+
+    def setUp(self):
+        blacklist_filter.reset()  # Ids of rolled back tokens are handed out again in the next test
+        self.user = User.objects.create(username="regularuser")
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def create_tokens(self, count, expires_at, blacklisted=False):
+        outstanding = OutstandingToken.objects.bulk_create(
+            OutstandingToken(user=self.user, jti=f"{expires_at:%Y%m%d}-{i}", token='', expires_at=expires_at)
+            for i in range(count))
+        if blacklisted:
+            BlacklistedToken.objects.bulk_create(BlacklistedToken(token=token) for token in outstanding)
+        return outstanding
+
+    def test_logged_out_token_is_rejected(self):
+        refresh = str(CachedRefreshToken.for_user(self.user))
+
+        self.assertEqual(self.client.post('/user_logout', {'refresh': refresh}).status_code,
+                         status.HTTP_205_RESET_CONTENT)
+        response = self.client.post('/user_logout', {'refresh': refresh})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Token is blacklisted')
+
+    def test_check_without_new_entries_does_not_query(self):
+        token = CachedRefreshToken.for_user(self.user)
+        blacklist_filter.contains('warm up')
+
+        with CaptureQueriesContext(connection) as queries:
+            token.check_blacklist()
+
+        self.assertEqual(len(queries), 0)
+
+    def test_generation_change_rereads_entries(self):
+        refresh = CachedRefreshToken.for_user(self.user)
+        self.assertFalse(blacklist_filter.contains(refresh['jti']))
+
+        # Blacklisted without a signal in this process, only the shared generation changes
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get(jti=refresh['jti']))])
+        cache.set(tokens.GENERATION_CACHE_KEY, 'other process')
+
+        self.assertTrue(blacklist_filter.contains(refresh['jti']))
+
+    def test_entries_from_another_process_are_read(self):
+        refresh = CachedRefreshToken.for_user(self.user)
+        self.assertFalse(blacklist_filter.contains(refresh['jti']))
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get(jti=refresh['jti']))])
+
+        run_in_other_process("from api.tokens import blacklist_filter; blacklist_filter.invalidate()")
+
+        self.assertTrue(blacklist_filter.contains(refresh['jti']))
+
+    def test_negative_answers_go_stale(self):
+        refresh = CachedRefreshToken.for_user(self.user)
+        self.assertFalse(blacklist_filter.contains(refresh['jti']))
+
+        # Blacklisted without the generation changing, as if the invalidation never reached this process
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get(jti=refresh['jti']))])
+        self.assertFalse(blacklist_filter.contains(refresh['jti']))
+
+        with mock.patch.object(BlacklistFilter, 'max_staleness', 0):
+            self.assertTrue(blacklist_filter.contains(refresh['jti']))
+
+    def test_full_reload_drops_expired_tokens(self):
+        expired = self.create_tokens(1, tokens.aware_utcnow() - timedelta(days=1), blacklisted=True)
+        blacklist_filter.contains('warm up')
+        self.assertFalse(blacklist_filter.contains(expired[0].jti))  # Expired tokens are never loaded
+
+        fresh = BlacklistFilter()
+        with mock.patch.object(BlacklistFilter, 'full_reload_interval', 0):
+            self.assertFalse(fresh.contains(expired[0].jti))
+
+    def test_flush_deletes_expired_tokens_in_batches(self):
+        now = tokens.aware_utcnow()
+        self.create_tokens(5, now - timedelta(days=1), blacklisted=True)
+        kept = self.create_tokens(2, now + timedelta(days=1), blacklisted=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            deleted = flush_expired_tokens(batch_size=2)
+
+        self.assertEqual(deleted, 5)
+        self.assertEqual(set(OutstandingToken.objects.values_list('jti', flat=True)), {token.jti for token in kept})
+        self.assertEqual(BlacklistedToken.objects.count(), 2)
+        deletes = [query for query in queries.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 6)  # Blacklist and outstanding rows for 3 batches
+
+    def test_compact_tokens_command(self):
+        self.create_tokens(3, tokens.aware_utcnow() - timedelta(days=1))
+        out = StringIO()
+
+        call_command('compact_tokens', stdout=out)
+
+        self.assertIn('Deleted 3 expired tokens', out.getvalue())
+        self.assertFalse(OutstandingToken.objects.exists())
+
+
+# Fast hashing in the test process; the pool's processes load the project settings and hash with PBKDF2
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher',
+                                     'django.contrib.auth.hashers.PBKDF2PasswordHasher'])
+@mock.patch('api.provisioning.default_workers', return_value=1)
+class TestProvisionUsers(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", email="admin@example.com", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_provision_csv(self, default_workers):
+        body = (
+            "username,email,password,is_staff\n"
+            "nurse1,nurse1@example.com,secret-1,false\n"
+            "doctor1,,secret-2,true\n"
+        )
+
+        response = self.client.post('/provision_users', body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['imported'], 2)
+        nurse = User.objects.get(username="nurse1")
+        self.assertTrue(nurse.check_password("secret-1"))
+        self.assertEqual(nurse.email, "nurse1@example.com")
+        self.assertFalse(nurse.is_staff)
+        self.assertTrue(User.objects.get(username="doctor1").is_staff)
+
+    def test_provision_reports_row_errors(self, default_workers):
+        body = "\n".join([
+            '{"username": "nurse1", "password": "secret"}',
+            '{"username": "regularuser", "password": "secret"}',
+            '{"username": "nurse2", "email": "admin@example.com", "password": "secret"}',
+            '{"username": "nurse1", "password": "other"}',
+            '{"username": "bad name!", "password": "secret"}',
+            '{"username": "nurse3"}',
+        ])
+
+        response = self.client.post('/provision_users', body, content_type='application/x-ndjson')
+
+        response_data = response.json()
+        self.assertEqual(response_data['imported'], 1)
+        self.assertEqual(response_data['failed'], 5)
+        errors = {error['row']: error['errors'] for error in response_data['errors']}
+        self.assertIn('username', errors[2])
+        self.assertIn('email', errors[3])
+        self.assertIn('username', errors[4])
+        self.assertIn('username', errors[5])
+        self.assertIn('password', errors[6])
+        self.assertTrue(User.objects.get(username="nurse1").check_password("secret"))
+
+    def test_provision_inserts_each_batch_at_once(self, default_workers):
+        body = "username,password\n" + "".join(f"user{i},secret\n" for i in range(20))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/provision_users', body, content_type='text/csv')
+
+        self.assertEqual(response.json()['imported'], 20)
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "auth_user"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_provision_as_regular_user(self, default_workers):
+        refresh = RefreshToken.for_user(self.regular_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        response = self.client.post('/provision_users', "username,password\nnurse1,secret\n", content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(User.objects.filter(username="nurse1").exists())
+
+    @mock.patch('api.provisioning.MIN_PASSWORDS_PER_WORKER', 1)
+    def test_provision_users_command_with_worker_pool(self, default_workers):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as upload:
+            upload.write('{"username": "nurse1", "password": "secret-1"}\n{"username": "nurse2", "password": "secret-2"}\n')
+        self.addCleanup(os.remove, upload.name)
+        out = StringIO()
+
+        call_command('provision_users', upload.name, workers=2, stdout=out)
+
+        self.assertIn('Created 2 users, 0 rows failed', out.getvalue())
+        self.assertTrue(User.objects.get(username="nurse2").check_password("secret-2"))
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    @mock.patch('api.provisioning.create_hashing_pool', side_effect=ThreadPoolExecutor)
+    def test_pool_is_sized_by_passwords(self, create_hashing_pool, default_workers):
+        result = provision_users(((i, {'username': f'small{i}', 'password': 'secret'}) for i in range(1, 8)),
+                                 workers=8)
+
+        self.assertEqual(result.imported, 7)
+        create_hashing_pool.assert_not_called()  # Not worth starting a worker
+
+        result = provision_users(((i, {'username': f'large{i}', 'password': 'secret'}) for i in range(1, 41)),
+                                 workers=8, batch_size=20)
+
+        self.assertEqual(result.imported, 40)
+        create_hashing_pool.assert_called_once_with(20 // MIN_PASSWORDS_PER_WORKER)  # Reused by the second batch
+        self.assertTrue(User.objects.get(username="large40").check_password("secret"))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+@mock.patch('api.provisioning.default_workers', return_value=1)
+class TestBench(APITestCase):
+
+    def setUp(self):
+        blacklist_filter.reset()
+
+    def result(self, **changes):
+        result = {'method': 'GET', 'status': 200, 'samples': 5, 'p50_ms': 2.0, 'p95_ms': 4.0, 'p99_ms': 5.0,
+                  'queries': 2, 'peak_alloc_kib': 30.0}
+        return {**result, **changes}
+
+    def test_every_route_has_a_scenario(self, default_workers):
+        self.assertEqual(missing_scenarios(), [])
+
+    def test_run_benchmark_succeeds_on_every_route(self, default_workers):
+        fixtures = seed(donors=20, requests=20)
+
+        endpoints = run_benchmark(fixtures, repeat=2)
+
+        self.assertEqual(failed_scenarios(endpoints), {})
+        self.assertEqual(endpoints['get_all_donors']['queries'], 2)
+        self.assertEqual(endpoints['user_register']['samples'], 2)
+        self.assertTrue(all(result['p50_ms'] <= result['p99_ms'] for result in endpoints.values()))
+        # Every request was rolled back
+        self.assertEqual(BloodDonor.objects.count(), 20)
+        self.assertFalse(User.objects.filter(username='bench-new').exists())
+
+    def test_seeded_pending_request_is_covered_by_stock(self, default_workers):
+        for random_seed in range(5):
+            with self.subTest(random_seed=random_seed), transaction.atomic():
+                pending_request = seed(donors=0, requests=200, random_seed=random_seed)['pending_request']
+
+                self.assertNotEqual(pending_request.blood_type.name, UNSTOCKED_BLOOD_TYPE)
+                inventory = BloodInventory.objects.get(blood_type=pending_request.blood_type)
+                self.assertGreaterEqual(inventory.quantity, pending_request.units_requested)
+                transaction.set_rollback(True)
+
+    def test_failed_scenarios(self, default_workers):
+        endpoints = {'a': self.result(), 'b': self.result(status=204), 'c': self.result(status=409)}
+
+        self.assertEqual(failed_scenarios(endpoints), {'c': 409})
+
+    def test_compare_reports_regressions(self, default_workers):
+        baseline = {'a': self.result(), 'b': self.result(), 'c': self.result()}
+        endpoints = {
+            'a': self.result(p95_ms=4.3, peak_alloc_kib=31.0),  # Within the tolerance
+            'b': self.result(status=500, queries=3, p95_ms=9.0, peak_alloc_kib=90.0),
+        }
+
+        regressions = compare(endpoints, baseline, tolerance=0.25)
+
+        self.assertEqual(regressions, [
+            'b: status 200 -> 500',
+            'b: queries 2 -> 3',
+            'b: p95 4.0 ms -> 9.0 ms',
+            'b: peak allocation 30.0 KiB -> 90.0 KiB',
+            'c: not benchmarked',
+        ])
+
+
+class TestGenerateData(APITestCase):
+
+    def test_generate_data(self):
+        out = StringIO()
+
+        call_command('generate_data', users=50, donors=500, requests=200, seed=1, prefix='t', stdout=out)
+
+        self.assertEqual(User.objects.filter(username__startswith='t-user-').count(), 50)
+        self.assertEqual(BloodDonor.objects.filter(donor_name__startswith='t-donor-').count(), 500)
+        self.assertEqual(BloodRequest.objects.count(), 200)
+        self.assertFalse(BloodRequest.objects.filter(user__is_staff=True).exists())
+        self.assertEqual(BloodType.objects.count(), 8)
+        self.assertGreater(BloodDonor.objects.filter(blood_type__name='O+').count(),
+                           BloodDonor.objects.filter(blood_type__name='AB-').count())
+        self.assertTrue(User.objects.get(username='t-user-0').check_password('generated'))
+        self.assertIn('Inserted 500 donors', out.getvalue())
+
+    def test_same_seed_same_rows(self):
+        blood_type_ids = {name: i for i, (name, _) in enumerate(BloodType.BLOOD_TYPE_CHOICES)}
+        first = list(generate_donors(random.Random(7), 100, 'a', blood_type_ids, today=date(2024, 1, 1)))
+        second = list(generate_donors(random.Random(7), 100, 'a', blood_type_ids, today=date(2024, 1, 1)))
+        other = list(generate_donors(random.Random(8), 100, 'a', blood_type_ids, today=date(2024, 1, 1)))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_one_insert_per_batch(self):
+        with CaptureQueriesContext(connection) as queries:
+            call_command('generate_data', donors=250, batch_size=100, stdout=StringIO())
+
+        inserts = [query for query in queries.captured_queries if 'INSERT INTO "api_blooddonor"' in query['sql']]
+        self.assertEqual(len(inserts), 3)  # Logged as "100 times: INSERT ..."
+        self.assertEqual(BloodDonor.objects.count(), 250)
+
+    def test_derived_tables_cover_generated_rows(self):
+        def triggers():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' ORDER BY name")
+                return cursor.fetchall()
+
+        before = triggers()
+        BloodDonor.objects.create(donor_name="Ann Other", blood_type=BloodType.objects.create(name='O+'),
+                                  units_donated=1)
+
+        call_command('generate_data', users=20, donors=300, requests=100, seed=1, prefix='t', stdout=StringIO())
+
+        self.assertEqual(triggers(), before)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH 'donor'")
+            self.assertEqual(cursor.fetchone()[0], 300)
+            cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH 'ann'")
+            self.assertEqual(cursor.fetchone()[0], 1)  # Indexed once, by its trigger
+        self.assertEqual(rebuild_summary(), {})
+        self.assertEqual(ChangeLogEntry.objects.filter(kind=ChangeLogEntry.DONOR).count(), 301)
+        self.assertEqual(ChangeLogEntry.objects.filter(kind=ChangeLogEntry.REQUEST).count(), 100)
+
+        # Writes after the load go through the triggers again
+        donor = BloodDonor.objects.create(donor_name="Bea Later", blood_type_id=BloodType.objects.get(name='O+').id,
+                                          units_donated=1)
+        self.assertEqual(ChangeLogEntry.objects.order_by('-id').values_list('object_id', flat=True).first(), donor.id)
+
+    def test_refuses_a_used_prefix(self):
+        call_command('generate_data', donors=10, stdout=StringIO())
+
+        with self.assertRaises(CommandError):
+            call_command('generate_data', donors=10, stdout=StringIO())
+
+    def test_requests_need_users(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_data', requests=10, stdout=StringIO())
+
+
+class TestServerTiming(APITestCase):
+
+    def setUp(self):
+        view_stats.clear()
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.blood_type = BloodType.objects.create(name="O+")
+        BloodInventory.objects.create(blood_type=self.blood_type, quantity=4)
+        for i in range(3):
+            BloodDonor.objects.create(donor_name=f"donor{i}", blood_type=self.blood_type, units_donated=1)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def server_timing(self, response):  # {metric: (duration in ms, description)}
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            params = dict(param.split('=', 1) for param in params)
+            metrics[name] = (float(params['dur']), params.get('desc', '').strip('"'))
+        return metrics
+
+    def test_header_splits_the_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/getall_donors/')
+
+        metrics = self.server_timing(response)
+        self.assertEqual(metrics['db'][1], f"{len(queries)} queries")
+        self.assertGreater(metrics['serialize'][0], 0)
+        self.assertGreater(metrics['render'][0], 0)
+        self.assertGreaterEqual(metrics['total'][0], metrics['db'][0] + metrics['serialize'][0] + metrics['render'][0])
+
+    def test_async_views_count_their_queries(self):
+        self.client.get('/async/getall_donors/')  # Puts the admin into the user cache
+
+        response = self.client.get('/async/getall_donors/')
+
+        self.assertEqual(self.server_timing(response)['db'][1], "2 queries")  # COUNT, page
+
+    def test_view_timings(self):
+        for _ in range(3):
+            self.client.get('/getall_donors/')
+        self.client.get('/get_bloodinventory')
+
+        response = self.client.get('/view_timings')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        views = response.json()['views']
+        self.assertEqual(views['get_all_donors']['requests'], 3)
+        self.assertEqual(views['get_blood_inventory']['requests'], 1)
+        self.assertLessEqual(views['get_all_donors']['total_p50_ms'], views['get_all_donors']['total_max_ms'])
+
+    def test_view_timings_as_regular_user(self):
+        regular_user = User.objects.create(username="regularuser", is_staff=False)
+        refresh = RefreshToken.for_user(regular_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        response = self.client.get('/view_timings')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TestMetrics(APITestCase):
+
+    def setUp(self):
+        request_metrics.clear()
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_type = BloodType.objects.create(name="O+")
+        BloodInventory.objects.create(blood_type=self.blood_type, quantity=4)
+        BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type, units_requested=1)
+        BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type, units_requested=1,
+                                    status=BloodRequest.FULFILLED)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def metrics(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode().splitlines()
+
+    def test_request_metrics(self):
+        self.client.get('/getall_donors/')
+        self.client.get('/getall_donors/')
+        self.client.get('/no_such_url')
+
+        lines = self.metrics()
+
+        self.assertIn('bloodbank_requests_total{view="get_all_donors",method="GET",status="200"} 2', lines)
+        self.assertIn('bloodbank_requests_total{view="unmatched",method="GET",status="404"} 1', lines)
+        self.assertIn('bloodbank_request_duration_seconds_bucket{view="get_all_donors",le="+Inf"} 2', lines)
+        self.assertIn('bloodbank_request_duration_seconds_count{view="get_all_donors"} 2', lines)
+        self.assertTrue(any(line.startswith('bloodbank_db_queries_total{view="get_all_donors"}') for line in lines))
+        buckets = [int(line.rsplit(' ', 1)[1]) for line in lines
+                   if line.startswith('bloodbank_request_duration_seconds_bucket{view="get_all_donors"')]
+        self.assertEqual(buckets, sorted(buckets))  # Cumulative
+
+    def test_inventory_gauges(self):
+        lines = self.metrics()
+
+        self.assertIn('bloodbank_inventory_units{blood_type="O+"} 4', lines)
+        self.assertIn('bloodbank_pending_requests 1', lines)
+
+    def test_threads_are_added_up(self):
+        threads = [threading.Thread(target=request_metrics.observe, args=('view', 'GET', 200, 0.002, 3))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        requests, durations, queries = request_metrics.collect()
+
+        self.assertEqual(requests[('view', 'GET', 200)], 4)
+        self.assertEqual(durations['view'][0][0], 4)  # All in the first bucket
+        self.assertEqual(queries['view'], 12)
+
+    def test_ended_threads_are_folded(self):
+        for _ in range(50):  # One short-lived thread per connection, as runserver's ThreadingMixIn starts them
+            thread = threading.Thread(target=request_metrics.observe, args=('view', 'GET', 200, 0.002, 1))
+            thread.start()
+            thread.join()
+        self.assertLessEqual(len(request_metrics._shards), threading.active_count() + 1)
+
+        requests, durations, queries = request_metrics.collect()
+
+        self.assertLessEqual(len(request_metrics._shards), threading.active_count())
+        self.assertEqual(requests[('view', 'GET', 200)], 50)
+        self.assertEqual(durations['view'][0][0], 50)
+        self.assertEqual(queries['view'], 50)
+
+    def test_disabled(self):
+        with override_settings(METRICS_ENABLED=False):
+            self.client.get('/getall_donors/')
+            response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(request_metrics.collect(), ({}, {}, {}))
+
+
+class TestDatabaseProfile(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        blood_type = BloodType.objects.create(name="O+")
+        BloodDonor.objects.create(donor_name="Donor", blood_type=blood_type, units_donated=1)
+
+        refresh = AccessToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh}')
+
+    def routed_reads(self, send):  # reading_only at every db_for_read call made while `send` runs
+        routed = []
+
+        def db_for_read(router, model, **hints):
+            routed.append(reading_only.get())
+            return None
+
+        with mock.patch.object(ReadRouter, 'db_for_read', autospec=True, side_effect=db_for_read):
+            response = send()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return routed
+
+    def test_list_views_read_from_read_database(self):
+        for path in ('/getall_donors/', '/get_bloodinventory', '/get_all_blood_request/', '/export_donors'):
+            routed = self.routed_reads(lambda: self.client.get(path))
+            self.assertTrue(routed, path)
+            self.assertTrue(all(routed), path)
+
+    def test_writes_stay_on_default(self):
+        routed = self.routed_reads(lambda: self.client.post(
+            '/add_donor', {'donor_name': 'New', 'blood_type': 'O+', 'units_donated': 1}, format='json'))
+
+        self.assertFalse(any(routed))
+
+    def test_router(self):
+        router = ReadRouter()
+        read_settings = dict(connections.settings['default'], TEST={'MIRROR': 'default'})
+
+        token = reading_only.set(True)
+        try:
+            self.assertIsNone(router.db_for_read(BloodDonor))  # No read alias configured
+            with mock.patch.dict(connections.settings, {READ_DATABASE: read_settings}):
+                self.assertEqual(router.db_for_read(BloodDonor), READ_DATABASE)
+        finally:
+            reading_only.reset(token)
+
+        with mock.patch.dict(connections.settings, {READ_DATABASE: read_settings}):
+            self.assertIsNone(router.db_for_read(BloodDonor))
+        self.assertEqual(router.db_for_write(BloodDonor), 'default')
+        self.assertFalse(router.allow_migrate(READ_DATABASE, 'api'))
+        self.assertTrue(router.allow_migrate('default', 'api'))
+
+    def test_read_only_async_view(self):
+        @read_only
+        async def view():
+            await asyncio.sleep(0)
+            return reading_only.get()
+
+        self.assertTrue(asyncio.run(view()))
+        self.assertFalse(reading_only.get())
+
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            busy_timeout = cursor.fetchone()[0]
+            cursor.execute('PRAGMA cache_size')
+            cache_size = cursor.fetchone()[0]
+        try:
+            with override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234, 'cache_size': -4096}):
+                apply_sqlite_pragmas(connection)
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], 1234)
+                cursor.execute('PRAGMA cache_size')
+                self.assertEqual(cursor.fetchone()[0], -4096)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+                cursor.execute(f'PRAGMA cache_size = {cache_size}')
+
+        with CaptureQueriesContext(connection) as queries:
+            apply_sqlite_pragmas(connection)  # The development profile sets none
+        self.assertEqual(len(queries), 0)
+
+
+class TestValuesSerializers(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create(username="regularuser", is_staff=False)
+        blood_types = [BloodType.objects.create(name=name) for name in ("A+", "O-", "AB+")]
+        for i, blood_type in enumerate(blood_types):
+            BloodInventory.objects.create(blood_type=blood_type, quantity=i * 7)
+        for i in range(12):
+            BloodDonor.objects.create(donor_name=f"Donor {i} \u00e9\"", blood_type=blood_types[i % 3],
+                                      units_donated=None if i % 4 == 0 else i,
+                                      last_donated=None if i % 5 == 0 else date(2024, 1, 1) + timedelta(days=i % 3))
+            BloodRequest.objects.create(user=user, blood_type=blood_types[i % 3], units_requested=i + 1,
+                                        status=BloodRequest.FULFILLED if i % 2 else BloodRequest.PENDING)
+
+    def assertSameBytes(self, queryset, serializer_class, values_serializer_class):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        rows = queryset.values_list(*values_serializer_class.columns())
+        self.assertEqual(JSONRenderer().render(values_serializer_class(rows).data), expected)
+
+    def test_same_bytes(self):
+        self.assertSameBytes(BloodDonor.objects.order_by('id'), DonorSerializer, DonorValuesSerializer)
+        self.assertSameBytes(BloodRequest.objects.order_by('id'), BloodRequestSerializer, BloodRequestValuesSerializer)
+        self.assertSameBytes(BloodInventory.objects.order_by('id'), BloodInventorySerializer,
+                             BloodInventoryValuesSerializer)
+
+    def test_extra_columns_left_out(self):
+        columns = DonorValuesSerializer.columns('last_donated', 'id')
+        self.assertEqual(columns, ['donor_name', 'blood_type__name', 'units_donated', 'last_donated', 'id'])
+
+        data = DonorValuesSerializer(BloodDonor.objects.values_list(*columns)).data
+        self.assertEqual(list(data[0]), ['donor_name', 'blood_type', 'units_donated', 'last_donated'])
+
+    def test_same_cursors(self):
+        ordering = ('-last_donated', '-id')
+        columns = DonorValuesSerializer.columns('last_donated', 'id')
+        instances = KeysetPaginator(BloodDonor.objects.all(), ordering, 5)
+        rows = KeysetPaginator(BloodDonor.objects.values_list(*columns), ordering, 5, columns)
+
+        cursor = None
+        for _ in range(3):
+            page = instances.get_page(cursor)
+            row_page = rows.get_page(cursor)
+            self.assertEqual((row_page.next_cursor, row_page.previous_cursor), (page.next_cursor, page.previous_cursor))
+            cursor = page.next_cursor
+        self.assertIsNone(cursor)  # 12 donors, the third page was the last
+
+
+class TestDonorSearch(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.a_pos = BloodType.objects.create(name="A+")
+        self.o_neg = BloodType.objects.create(name="O-")
+        BloodDonor.objects.create(donor_name="John Smith", blood_type=self.a_pos, units_donated=2,
+                                  last_donated=date(2024, 3, 1))
+        BloodDonor.objects.create(donor_name="Johanna Smythe", blood_type=self.o_neg, units_donated=1)
+        BloodDonor.objects.create(donor_name="Zoë Jones", blood_type=self.a_pos, units_donated=3)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin_user)}')
+
+    def search(self, **params):
+        response = self.client.get('/search_donors', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def names(self, **params):
+        return [donor['donor_name'] for donor in self.search(**params)['donors']]
+
+    def test_prefix_search(self):
+        self.assertEqual(self.names(q='joh'), ["John Smith", "Johanna Smythe"])
+        self.assertEqual(self.names(q='john sm'), ["John Smith"])
+        self.assertEqual(self.names(q='jo sm'), [])  # Only the last word is a prefix
+        self.assertEqual(self.names(q='smith john'), ["John Smith"])
+        self.assertEqual(self.names(q='smi'), ["John Smith"])
+        self.assertEqual(self.names(q='JONES'), ["Zoë Jones"])
+        self.assertEqual(self.names(q='zoe'), ["Zoë Jones"])  # Diacritics are folded
+        self.assertEqual(self.names(q='mith'), [])  # Words match from their start
+
+    def test_response(self):
+        self.assertEqual(self.search(q='john'), {
+            'donors': [{'donor_name': 'John Smith', 'blood_type': 'A+', 'units_donated': 2,
+                        'last_donated': '2024-03-01'}],
+            'next': None,
+        })
+
+    def test_blood_type_filter(self):
+        self.assertEqual(self.names(q='jo', blood_type='O-'), ["Johanna Smythe"])
+        self.assertEqual(self.names(q='jo', blood_type='A+'), ["John Smith", "Zoë Jones"])
+        self.assertEqual(self.names(q='jo', blood_type='A+,O-'), ["John Smith", "Johanna Smythe", "Zoë Jones"])
+
+    def test_pages(self):
+        first = self.search(q='jo', page_size=2)
+        self.assertEqual([donor['donor_name'] for donor in first['donors']], ["John Smith", "Johanna Smythe"])
+        self.assertIsNotNone(first['next'])
+
+        second = self.search(q='jo', page_size=2, after=first['next'])
+        self.assertEqual([donor['donor_name'] for donor in second['donors']], ["Zoë Jones"])
+        self.assertIsNone(second['next'])
+
+    def test_index_follows_writes(self):
+        donor = BloodDonor.objects.get(donor_name="John Smith")
+        donor.donor_name = "Jack Brown"
+        donor.save()
+        self.assertEqual(self.names(q='smith'), [])
+        self.assertEqual(self.names(q='brown'), ["Jack Brown"])
+
+        donor.delete()
+        self.assertEqual(self.names(q='brown'), [])
+
+        BloodDonor.objects.bulk_create([BloodDonor(donor_name="Bulk Brownlow", blood_type=self.o_neg)])
+        self.assertEqual(self.names(q='brown'), ["Bulk Brownlow"])
+
+    def test_query_syntax_is_literal(self):
+        self.assertEqual(self.names(q='"john" OR NEAR(smith'), [])  # All of john, or, near and smith
+        self.assertEqual(self.names(q='john* smith'), ["John Smith"])
+
+    def test_uses_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH '\"jo\"*'")
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('VIRTUAL TABLE INDEX', plan)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get('/search_donors', {'q': '  *'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/search_donors', {'q': 'jo', 'blood_type': 'X'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/search_donors', {'q': 'jo', 'after': 'x'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(regular_user)}')
+        self.assertEqual(self.client.get('/search_donors', {'q': 'jo'}).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TestCompatibleDonors(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_types = {name: BloodType.objects.create(name=name) for name in ("A+", "A-", "O-", "B+", "AB+")}
+        self.today = date.today()
+        self.eligible_date = self.today - DONATION_INTERVAL
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin_user)}')
+
+    def donor(self, name, blood_type, last_donated):
+        return BloodDonor.objects.create(donor_name=name, blood_type=self.blood_types[blood_type], units_donated=1,
+                                         last_donated=last_donated)
+
+    def blood_request(self, blood_type):
+        return BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_types[blood_type],
+                                           units_requested=1)
+
+    def matches(self, blood_request, **params):
+        response = self.client.get(f'/compatible_donors/{blood_request.id}', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_compatibility_table(self):
+        self.assertEqual(COMPATIBLE_DONOR_TYPES['O-'], ('O-',))
+        self.assertEqual(COMPATIBLE_DONOR_TYPES['O+'], ('O+', 'O-'))
+        self.assertEqual(COMPATIBLE_DONOR_TYPES['A-'], ('A-', 'O-'))
+        self.assertEqual(COMPATIBLE_DONOR_TYPES['B+'], ('B+', 'B-', 'O+', 'O-'))
+        self.assertEqual(COMPATIBLE_DONOR_TYPES['AB-'], ('A-', 'B-', 'AB-', 'O-'))
+        self.assertEqual(set(COMPATIBLE_DONOR_TYPES['AB+']), {name for name, _ in BloodType.BLOOD_TYPE_CHOICES})
+
+    def test_eligible_donors(self):
+        self.donor("Recent A+", "A+", self.today - timedelta(days=3))
+        self.donor("Old A-", "A-", self.eligible_date - timedelta(days=100))
+        self.donor("Just eligible O-", "O-", self.eligible_date)
+        self.donor("Not yet O-", "O-", self.eligible_date + timedelta(days=1))
+        self.donor("Never A+", "A+", None)
+        self.donor("Old B+", "B+", self.eligible_date - timedelta(days=500))  # Incompatible with A+
+
+        data = self.matches(self.blood_request("A+"))
+
+        self.assertEqual(data['blood_type'], 'A+')
+        self.assertEqual(data['compatible_blood_types'], ['A+', 'A-', 'O+', 'O-'])
+        self.assertEqual(data['last_donated_before'], self.eligible_date)
+        self.assertEqual([donor['donor_name'] for donor in data['donors']],
+                         ["Never A+", "Old A-", "Just eligible O-"])  # Longest since donation first
+        self.assertEqual(data['donors'][1], {'donor_name': 'Old A-', 'blood_type': 'A-', 'units_donated': 1,
+                                             'last_donated': str(self.eligible_date - timedelta(days=100))})
+
+    def test_universal_donor_only(self):
+        self.donor("A-", "A-", None)
+        self.donor("O-", "O-", None)
+
+        data = self.matches(self.blood_request("O-"))
+
+        self.assertEqual([donor['donor_name'] for donor in data['donors']], ["O-"])
+
+    def test_page_size(self):
+        for i in range(8):
+            self.donor(f"Donor {i}", ("A+", "O-", "AB+")[i % 3], self.eligible_date - timedelta(days=i))
+
+        data = self.matches(self.blood_request("AB+"), page_size=4)
+
+        self.assertEqual([donor['donor_name'] for donor in data['donors']],
+                         ["Donor 7", "Donor 6", "Donor 5", "Donor 4"])
+
+    def test_one_indexed_query(self):
+        blood_request = self.blood_request("AB+")
+        self.client.get(f'/compatible_donors/{blood_request.id}')  # Warms the user cache and blood type registry
+
+        with CaptureQueriesContext(connection) as queries:
+            self.matches(blood_request)
+        self.assertEqual(len(queries), 2)  # The blood request, then the donors
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[1]['sql']}")
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('donor_type_last_donated_idx', plan)
+        self.assertNotIn('SCAN api_blooddonor', plan)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get('/compatible_donors/999').status_code, status.HTTP_404_NOT_FOUND)
+
+        blood_request = self.blood_request("A+")
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.regular_user)}')
+        self.assertEqual(self.client.get(f'/compatible_donors/{blood_request.id}').status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+
+class TestBloodTypeSummary(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_type_a = BloodType.objects.create(name="A+")
+        self.blood_type_o = BloodType.objects.create(name="O-")
+        self.inventory = BloodInventory.objects.create(blood_type=self.blood_type_a, quantity=10)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin_user)}')
+
+    def totals(self, blood_type):
+        summary = BloodTypeSummary.objects.get(blood_type=blood_type)
+        return summary.units_available, summary.pending_requests, summary.pending_units, summary.fulfilled_units
+
+    def blood_request(self, units, blood_type=None, status=BloodRequest.PENDING):
+        return BloodRequest.objects.create(user=self.regular_user, blood_type=blood_type or self.blood_type_a,
+                                           units_requested=units, status=status)
+
+    def test_every_blood_type_has_a_row(self):
+        self.assertEqual(self.totals(self.blood_type_a), (10, 0, 0, 0))
+        self.assertEqual(self.totals(self.blood_type_o), (0, 0, 0, 0))
+
+    def test_view_write_paths(self):
+        self.client.post('/add_to_bloodinventory', {'blood_type': 'O-', 'quantity': 4}, format='json')
+        self.client.put(f'/update_units/{self.inventory.id}', {'blood_type': 'A+', 'quantity': 7}, format='json')
+        self.assertEqual(self.totals(self.blood_type_o), (4, 0, 0, 0))
+        self.assertEqual(self.totals(self.blood_type_a), (7, 0, 0, 0))
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.regular_user)}')
+        for units in (3, 5):
+            response = self.client.post('/request_blood', {'blood_type': 'A+', 'units_requested': units}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.totals(self.blood_type_a), (7, 2, 8, 0))
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin_user)}')
+        first = BloodRequest.objects.order_by('id').first()
+        self.client.post(f'/approve_request/{first.id}', {'status': True}, format='json')
+        self.assertEqual(self.totals(self.blood_type_a), (4, 1, 5, 3))
+
+        self.client.put(f'/update_units/{self.inventory.id}', {'blood_type': 'A+', 'quantity': 20}, format='json')
+        self.client.post('/allocate_requests')
+        self.assertEqual(self.totals(self.blood_type_a), (15, 0, 0, 8))
+
+    def test_failed_approval_leaves_the_summary_alone(self):
+        blood_request = self.blood_request(11)
+        response = self.client.post(f'/approve_request/{blood_request.id}', {'status': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.totals(self.blood_type_a), (10, 1, 11, 0))
+
+    def test_model_writes(self):  # What the admin does: save() and delete() on model instances
+        blood_request = self.blood_request(2)
+        blood_request.blood_type = self.blood_type_o
+        blood_request.units_requested = 6
+        blood_request.save()
+        self.assertEqual(self.totals(self.blood_type_a), (10, 0, 0, 0))
+        self.assertEqual(self.totals(self.blood_type_o), (0, 1, 6, 0))
+
+        blood_request.status = BloodRequest.FULFILLED
+        blood_request.save()
+        self.assertEqual(self.totals(self.blood_type_o), (0, 0, 0, 6))
+        blood_request.delete()
+        self.assertEqual(self.totals(self.blood_type_o), (0, 0, 0, 0))
+
+        self.inventory.blood_type = self.blood_type_o
+        self.inventory.save()
+        self.assertEqual(self.totals(self.blood_type_a), (0, 0, 0, 0))
+        self.assertEqual(self.totals(self.blood_type_o), (10, 0, 0, 0))
+        self.inventory.delete()
+        self.assertEqual(self.totals(self.blood_type_o), (0, 0, 0, 0))
+
+    def test_bulk_writes(self):
+        BloodRequest.objects.bulk_create([BloodRequest(user=self.regular_user, blood_type=self.blood_type_o,
+                                                       units_requested=units) for units in (1, 2, 3)])
+        BloodRequest.objects.filter(units_requested__gte=2).update(status=BloodRequest.FULFILLED)
+        self.assertEqual(self.totals(self.blood_type_o), (0, 1, 1, 5))
+
+    def test_rolled_back_writes(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.blood_request(4)
+                BloodInventory.objects.update(quantity=0)
+                raise RuntimeError()
+        self.assertEqual(self.totals(self.blood_type_a), (10, 0, 0, 0))
+
+    def test_deleting_a_blood_type(self):
+        self.blood_request(2)
+        self.blood_type_a.delete()
+        self.assertEqual(list(BloodTypeSummary.objects.values_list('blood_type_id', flat=True)),
+                         [self.blood_type_o.id])
+
+    def test_summary_endpoint(self):
+        self.blood_request(3)
+        self.blood_request(4, status=BloodRequest.FULFILLED)
+        self.blood_request(1, blood_type=self.blood_type_o)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/summary')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([query for query in queries if 'api_bloodtypesummary' in query['sql']]), 1)
+        self.assertEqual(response.data, {'blood_types': [
+            {'blood_type': 'A+', 'units_available': 10, 'pending_requests': 1, 'pending_units': 3,
+             'fulfilled_units': 4},
+            {'blood_type': 'O-', 'units_available': 0, 'pending_requests': 1, 'pending_units': 1,
+             'fulfilled_units': 0},
+        ]})
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.regular_user)}')
+        self.assertEqual(self.client.get('/summary').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_repair(self):
+        self.blood_request(3)
+        self.assertEqual(rebuild_summary(), {})
+
+        BloodTypeSummary.objects.filter(blood_type=self.blood_type_a).update(units_available=0, pending_units=9)
+        BloodTypeSummary.objects.filter(blood_type=self.blood_type_o).delete()
+        out = StringIO()
+        call_command('repair_summary', stdout=out)
+
+        self.assertEqual(self.totals(self.blood_type_a), (10, 1, 3, 0))
+        self.assertEqual(self.totals(self.blood_type_o), (0, 0, 0, 0))
+        self.assertIn('A+   units_available 0 -> 10, pending_units 9 -> 3', out.getvalue())
+        self.assertIn('2 blood types were out of date', out.getvalue())
+
+
+class TestChangeFeed(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_type = BloodType.objects.create(name="A+")
+        self.inventory = BloodInventory.objects.create(blood_type=self.blood_type, quantity=10)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin_user)}')
+
+    def changes(self, since, **params):
+        response = self.client.get('/changes', {'since': since, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_sync_from_cursor(self):
+        data = self.changes(0)
+        self.assertEqual(data['changes'], [
+            {'cursor': data['next'], 'type': 'inventory', 'id': self.inventory.id, 'deleted': False,
+             'data': {'id': self.inventory.id, 'quantity': 10, 'blood_type': 'A+'}},
+        ])
+        cursor = data['next']
+        self.assertEqual(self.changes(cursor), {'changes': [], 'next': cursor, 'has_more': False})
+
+        self.client.post('/add_donor', {'donor_name': 'Zeny', 'blood_type': 'A+', 'units_donated': 2}, format='json')
+        donor = BloodDonor.objects.get(donor_name='Zeny')
+        self.client.put(f'/update_units/{self.inventory.id}', {'blood_type': 'A+', 'quantity': 4}, format='json')
+        self.client.delete(f'/delete_donor/{donor.id}')
+
+        data = self.changes(cursor)
+        self.assertEqual([(change['type'], change['id'], change['deleted'], change['data'])
+                          for change in data['changes']], [
+            ('inventory', self.inventory.id, False, {'id': self.inventory.id, 'quantity': 4, 'blood_type': 'A+'}),
+            ('donor', donor.id, True, None),  # Its earlier entries were replaced by the deletion
+        ])
+        self.assertGreater(data['next'], cursor)
+
+    def test_every_write_path_is_logged(self):
+        cursor = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first()
+        blood_request = BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type,
+                                                    units_requested=3)
+        self.client.post(f'/approve_request/{blood_request.id}', {'status': True}, format='json')
+        self.client.post('/import_donors', 'donor_name,blood_type,units_donated\nImported,A+,1\n',
+                         content_type='text/csv')
+
+        data = self.changes(cursor)
+        self.assertEqual({(change['type'], change['id']) for change in data['changes']}, {
+            ('request', blood_request.id), ('inventory', self.inventory.id),
+            ('donor', BloodDonor.objects.get(donor_name='Imported').id),
+        })
+        request_change = next(change for change in data['changes'] if change['type'] == 'request')
+        self.assertEqual(request_change['data']['status'], BloodRequest.FULFILLED)
+
+    def test_one_entry_per_row(self):
+        for quantity in range(5):
+            BloodInventory.objects.filter(pk=self.inventory.pk).update(quantity=quantity)
+        self.assertEqual(ChangeLogEntry.objects.filter(kind=ChangeLogEntry.INVENTORY).count(), 1)
+
+    def test_paging(self):
+        for i in range(5):
+            BloodDonor.objects.create(donor_name=f'donor-{i}', blood_type=self.blood_type)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.changes(0, limit=2)
+        self.assertLessEqual(len([query for query in queries if 'SAVEPOINT' not in query['sql']]), 4)
+
+        seen, cursor, has_more = [], 0, True
+        while has_more:
+            data = self.changes(cursor, limit=2)
+            self.assertLessEqual(len(data['changes']), 2)
+            seen += [change['id'] for change in data['changes'] if change['type'] == 'donor']
+            cursor, has_more = data['next'], data['has_more']
+        self.assertEqual(seen, list(BloodDonor.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_compaction(self):
+        donor = BloodDonor.objects.create(donor_name='Old', blood_type=self.blood_type)
+        cursor = self.changes(0)['next']
+        self.client.delete(f'/delete_donor/{donor.id}')
+        self.assertEqual(compact_changes(), 0)  # Not older than the retention yet
+
+        removed_entry = ChangeLogEntry.objects.get(kind=ChangeLogEntry.DONOR, object_id=donor.id)
+        ChangeLogEntry.objects.filter(pk=removed_entry.pk).update(
+            changed_at=removed_entry.changed_at - timedelta(days=31))
+        out = StringIO()
+        call_command('compact_changes', stdout=out)
+        self.assertIn('Removed 1 change log entries', out.getvalue())
+        self.assertEqual(ChangeLogCompaction.objects.get().compacted_through, removed_entry.id)
+        self.assertFalse(ChangeLogEntry.objects.filter(kind=ChangeLogEntry.DONOR).exists())
+
+        response = self.client.get('/changes', {'since': cursor})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertEqual([change['id'] for change in self.changes(0)['changes']], [self.inventory.id])
+        self.changes(removed_entry.id)  # Cursors past the removed entries still work
+
+    def test_invalid_parameters(self):
+        for params in ({'since': 'x'}, {'since': -1}, {'limit': 'all'}):
+            self.assertEqual(self.client.get('/changes', params).status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.regular_user)}')
+        self.assertEqual(self.client.get('/changes').status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(INVENTORY_STREAM_POLL_INTERVAL=0.01, STREAM_HEARTBEAT_INTERVAL=5)
+class TestInventoryStream(APITestCase):
+
+    def setUp(self):
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.a_positive = BloodInventory.objects.create(blood_type=BloodType.objects.create(name="A+"), quantity=10)
+        self.o_negative = BloodInventory.objects.create(blood_type=BloodType.objects.create(name="O-"), quantity=2)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.regular_user)}')
+
+    def open_stream(self):
+        response = self.client.get('/async/inventory_stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.addCleanup(response.close)
+        return response
+
+    @staticmethod
+    def event(chunk):  # (event name, data) of one SSE message
+        lines = chunk.decode().strip().split('\n')
+        fields = dict(line.split(': ', 1) for line in lines if not line.startswith('retry'))
+        return fields['event'], json.loads(fields['data'])['blood_types']
+
+    def test_snapshot_then_changes(self):
+        response = self.open_stream()
+
+        async def read():
+            content = response.streaming_content
+            snapshot = await anext(content)
+            await sync_to_async(BloodInventory.objects.filter(pk=self.a_positive.pk).update)(quantity=7)
+            return snapshot, await anext(content)
+
+        snapshot, change = async_to_sync(read)()
+        self.assertTrue(snapshot.startswith(b'retry: 5000\n'))
+        self.assertEqual(self.event(snapshot), ('snapshot', [{'blood_type': 'A+', 'quantity': 10},
+                                                              {'blood_type': 'O-', 'quantity': 2}]))
+        self.assertEqual(self.event(change), ('inventory', [{'blood_type': 'A+', 'quantity': 7}]))
+
+        response.close()
+        self.assertEqual(inventory_broadcaster.subscribers, set())
+
+    @override_settings(STREAM_HEARTBEAT_INTERVAL=0.05)
+    def test_heartbeat(self):
+        response = self.open_stream()
+
+        async def read():
+            content = response.streaming_content
+            await anext(content)
+            return await anext(content)
+
+        self.assertEqual(async_to_sync(read)(), HEARTBEAT.encode())
+
+    def test_one_read_for_every_subscriber(self):
+        reads = []
+
+        async def counted_read_levels():
+            reads.append(time.monotonic())
+            return await read_levels()
+
+        async def read():
+            broadcaster = InventoryBroadcaster()
+            subscribers = [(await broadcaster.subscribe())[0] for _ in range(50)]
+            await sync_to_async(BloodInventory.objects.filter(pk=self.o_negative.pk).update)(quantity=5)
+            return [await subscriber.changes(1) for subscriber in subscribers]
+
+        with mock.patch('api.streams.read_levels', counted_read_levels):
+            changes = async_to_sync(read)()
+        self.assertEqual(changes, [{'O-': 5}] * 50)
+        self.assertLess(len(reads), 10)  # The first read and a few polls, not one read per subscriber
+
+    def test_slow_subscriber_gets_latest_levels(self):
+        broadcaster = InventoryBroadcaster()
+        broadcaster.levels = {'A+': 10, 'O-': 2}
+
+        async def read():
+            slow_subscriber, fast_subscriber = Subscriber(), Subscriber()
+            broadcaster.subscribers.update({slow_subscriber, fast_subscriber})
+            broadcaster.publish({'A+': 9, 'O-': 2})
+            fast_changes = [await fast_subscriber.changes(1)]
+            broadcaster.publish({'A+': 8, 'O-': 1})
+            broadcaster.publish({'A+': 8})  # O- inventory deleted
+            fast_changes.append(await fast_subscriber.changes(1))
+            return fast_changes, await slow_subscriber.changes(1)
+
+        fast_changes, slow_changes = async_to_sync(read)()
+        self.assertEqual(fast_changes, [{'A+': 9}, {'A+': 8, 'O-': 0}])
+        self.assertEqual(slow_changes, {'A+': 8, 'O-': 0})  # Three updates coalesced into the latest levels
+
+    def test_cancelled_stream_unsubscribes(self):
+        async def read():
+            broadcaster = InventoryBroadcaster()
+            stream = InventoryStream(broadcaster)
+            await anext(stream)
+            waiting = asyncio.ensure_future(anext(stream))
+            await asyncio.sleep(0.02)
+            subscribed = len(broadcaster.subscribers)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            return subscribed, len(broadcaster.subscribers)
+
+        self.assertEqual(async_to_sync(read)(), (1, 0))
+
+    def test_stream_ends_when_token_expires(self):
+        async def read():
+            return [chunk async for chunk in InventoryStream(InventoryBroadcaster(), expires_at=time.time() - 1)]
+
+        self.assertEqual(async_to_sync(read)(), [])
+
+    def test_authentication_required(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/async/inventory_stream').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TestApprovalQueue(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_type = BloodType.objects.create(name="O+")
+        self.inventory = BloodInventory.objects.create(blood_type=self.blood_type, quantity=5)
+        self.blood_request = BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type,
+                                                         units_requested=3)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def approve(self, blood_request, **headers):
+        return self.client.post(f'/approve_request/{blood_request.id}', {"status": True}, format='json', **headers)
+
+    @override_settings(APPROVAL_QUEUE=True)
+    def test_queued_approval_answers_202(self):
+        response = self.approve(self.blood_request)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = ApprovalJob.objects.get()
+        self.assertEqual(response.json(), {"message": "Request queued for approval", "job": job.id})
+        self.assertEqual(response['Location'], f'/approval_jobs/{job.id}')
+        self.assertEqual(job.status, ApprovalJob.QUEUED)
+        self.assertEqual(job.requested_by, self.admin_user)
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 5)  # Nothing taken out until a worker runs the job
+
+    def test_prefer_header_queues_approval(self):
+        response = self.approve(self.blood_request, HTTP_PREFER='respond-async')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(ApprovalJob.objects.count(), 1)
+
+    def test_synchronous_by_default(self):
+        response = self.approve(self.blood_request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(ApprovalJob.objects.exists())
+
+    @override_settings(APPROVAL_QUEUE=True)
+    def test_queueing_fulfilled_request_conflicts(self):
+        self.blood_request.status = BloodRequest.FULFILLED
+        self.blood_request.save()
+
+        response = self.approve(self.blood_request)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(ApprovalJob.objects.exists())
+
+    @override_settings(APPROVAL_QUEUE=True)
+    def test_batch_runs_jobs_with_outcomes(self):
+        second_request = BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type,
+                                                     units_requested=3)
+        job_ids = [self.approve(blood_request).json()['job']
+                   for blood_request in (self.blood_request, second_request, self.blood_request)]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(process_approval_batch(), 3)
+        self.assertEqual(process_approval_batch(), 0)
+
+        jobs = ApprovalJob.objects.in_bulk(job_ids)
+        self.assertEqual([(jobs[job_id].status, jobs[job_id].outcome) for job_id in job_ids], [
+            (ApprovalJob.DONE, ApprovalJob.APPROVED),
+            (ApprovalJob.DONE, ApprovalJob.INSUFFICIENT_STOCK),
+            (ApprovalJob.DONE, ApprovalJob.ALREADY_FULFILLED),
+        ])
+        self.assertEqual(jobs[job_ids[1]].message, "Not enough units of O+ in inventory")
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 2)
+        job_updates = [query for query in queries.captured_queries
+                       if query['sql'].startswith('UPDATE "api_approvaljob"')]
+        self.assertEqual(len(job_updates), 2)  # The claim and the outcomes, whatever the batch size
+
+    @override_settings(APPROVAL_QUEUE=True)
+    def test_batch_size_limits_claimed_jobs(self):
+        for _ in range(3):
+            self.approve(self.blood_request)
+
+        self.assertEqual(process_approval_batch(batch_size=2), 2)
+        self.assertEqual(ApprovalJob.objects.filter(status=ApprovalJob.QUEUED).count(), 1)
+
+    @override_settings(APPROVAL_QUEUE=True)
+    def test_job_endpoint_reports_outcome(self):
+        location = self.approve(self.blood_request)['Location']
+        self.assertEqual(self.client.get(location).json()['status'], ApprovalJob.QUEUED)
+
+        ApprovalWorker(threads=1, poll_interval=0).run(until_empty=True)
+
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response_data = response.json()
+        self.assertEqual(response_data['status'], ApprovalJob.DONE)
+        self.assertEqual(response_data['outcome'], ApprovalJob.APPROVED)
+        self.assertEqual(response_data['message'], "Request successfully approved")
+        self.assertEqual(response_data['blood_request'], self.blood_request.id)
+        self.assertIsNotNone(response_data['finished_at'])
+
+    def test_job_endpoint_as_regular_user(self):
+        job = ApprovalJob.objects.create(blood_request=self.blood_request, requested_by=self.admin_user)
+        refresh = RefreshToken.for_user(self.regular_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.assertEqual(self.client.get(f'/approval_jobs/{job.id}').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.approve(self.blood_request, HTTP_PREFER='respond-async').status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+    def test_missing_job(self):
+        self.assertEqual(self.client.get('/approval_jobs/999').status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(APPROVAL_QUEUE=True)
+    def test_process_approvals_command(self):
+        self.approve(self.blood_request)
+        out = StringIO()
+
+        call_command('process_approvals', threads=1, once=True, stdout=out)
+
+        self.assertIn('Processed 1 approval jobs', out.getvalue())
+        self.blood_request.refresh_from_db()
+        self.assertEqual(self.blood_request.status, BloodRequest.FULFILLED)
+
+
+class TestBatch(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username="adminuser", is_staff=True)
+        self.regular_user = User.objects.create(username="regularuser", is_staff=False)
+        self.blood_type = BloodType.objects.create(name="O+")
+        self.inventory = BloodInventory.objects.create(blood_type=self.blood_type, quantity=5)
+        self.blood_request = BloodRequest.objects.create(user=self.regular_user, blood_type=self.blood_type,
+                                                         units_requested=3)
+
+        refresh = RefreshToken.for_user(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def send(self, operations):
+        return self.client.post('/batch', {'operations': operations}, format='json')
+
+    def test_operations_run_in_order(self):
+        response = self.send([
+            {'method': 'POST', 'path': '/add_donor', 'body': {'donor_name': 'Zeny', 'blood_type': 'O+',
+                                                               'units_donated': 2}},
+            {'method': 'PUT', 'path': f'/update_units/{self.inventory.id}',
+             'body': {'blood_type': 'O+', 'quantity': 9}},
+            {'method': 'POST', 'path': f'/approve_request/{self.blood_request.id}', 'body': {'status': True}},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response_data = response.json()
+        self.assertTrue(response_data['committed'])
+        self.assertEqual([result['status'] for result in response_data['results']], [201, 201, 200])
+        self.assertEqual(response_data['results'][0]['body']['message'], "Donor added successfully")
+        self.assertTrue(BloodDonor.objects.filter(donor_name='Zeny', last_donated=date.today()).exists())
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 6)  # Set to 9, then 3 taken by the approval
+
+    def test_failed_operation_rolls_back_batch(self):
+        response = self.send([
+            {'method': 'PUT', 'path': f'/update_units/{self.inventory.id}',
+             'body': {'blood_type': 'O+', 'quantity': 1}},
+            {'method': 'POST', 'path': '/add_donor', 'body': {'donor_name': 'Zeny', 'blood_type': 'O+',
+                                                               'units_donated': 2}},
+            {'method': 'POST', 'path': f'/approve_request/{self.blood_request.id}', 'body': {'status': True}},
+            {'method': 'DELETE', 'path': '/delete_donor/999'},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response_data = response.json()
+        self.assertFalse(response_data['committed'])
+        self.assertEqual(response_data['failed'], 2)
+        self.assertEqual(len(response_data['results']), 3)  # The operation after the failed one never ran
+        self.assertEqual(response_data['results'][2]['body']['message'], "Not enough units of O+ in inventory")
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 5)
+        self.assertFalse(BloodDonor.objects.filter(donor_name='Zeny').exists())
+
+    def test_one_authentication_and_one_transaction(self):
+        operations = [{'method': 'PATCH', 'path': f'/update_units/{self.inventory.id}',
+                       'body': {'blood_type': 'O+', 'quantity': quantity}} for quantity in range(10)]
+
+        with mock.patch('rest_framework_simplejwt.authentication.JWTAuthentication.get_validated_token',
+                        wraps=AccessToken) as validate, CaptureQueriesContext(connection) as queries:
+            response = self.send(operations)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(validate.call_count, 1)
+        savepoints = [query for query in queries.captured_queries if query['sql'].startswith('SAVEPOINT')]
+        self.assertEqual(len(savepoints), 1)  # The batch's own atomic block inside the test's transaction
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 9)
+
+    def test_operations_keep_view_permissions(self):
+        refresh = RefreshToken.for_user(self.regular_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        response = self.send([
+            {'method': 'POST', 'path': '/request_blood', 'body': {'blood_type': 'O+', 'units_requested': 1}},
+            {'method': 'PUT', 'path': f'/update_units/{self.inventory.id}',
+             'body': {'blood_type': 'O+', 'quantity': 50}},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual([result['status'] for result in response.json()['results']], [201, 403])
+        self.assertEqual(BloodRequest.objects.count(), 1)
+
+    def test_invalid_batches(self):
+        invalid = [
+            [],
+            [{'method': 'POST'}],
+            [{'method': 'GET', 'path': '/get_bloodinventory'}],
+            [{'method': 'POST', 'path': '/add_bloodtype', 'body': {'name': 'AB-'}}],
+            [{'method': 'DELETE', 'path': '/add_donor'}],
+            [{'method': 'POST', 'path': '/no_such_route'}],
+            [{'method': 'POST', 'path': '/add_donor', 'body': ['Zeny']}],
+            [{'method': 'DELETE', 'path': f'/delete_donor/{i}'} for i in range(MAX_BATCH_OPERATIONS + 1)],
+        ]
+        for operations in invalid:
+            with self.subTest(operations=operations[:1]):
+                response = self.send(operations)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('error', response.json())
+
+    def test_authentication_required(self):
+        self.client.credentials()
+        self.assertEqual(self.send([{'method': 'DELETE', 'path': '/delete_donor/1'}]).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
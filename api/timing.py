@@ -0,0 +1,178 @@
+"""
+Per-request timing for the Blood Bank Management System API.
+
+ServerTimingMiddleware splits the time spent on every request into database, serialization and rendering time and
+reports it in a Server-Timing response header, e.g.
+
+    Server-Timing: db;dur=3.120;desc="4 queries", serialize;dur=0.845, render;dur=0.310, total;dur=6.204
+
+1. RequestTimings: The numbers collected for the current request, held in a context variable so they follow the
+   request into sync_to_async threads under ASGI.
+2. time_queries: Database execute wrapper, installed on every connection as it is created (see apps.py). Outside a
+   request it only looks up the context variable.
+3. TimedSerializerMixin / TimedListSerializer: Time `serializer.data`, where DRF turns instances into primitives.
+4. TimedJSONRenderer: JSONRenderer timing render().
+5. ViewStats: Rolling aggregates of the last ROLLING_WINDOW requests per URL name, served by the view_timings
+   endpoint. Recording a request is a deque append, no lock is taken on the request path.
+
+The middleware also feeds every request into the Prometheus counters and histograms of metrics.py.
+"""
+
+import contextvars
+import statistics
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import UNMATCHED_VIEW, request_metrics
+
+ROLLING_WINDOW = 1000  # Requests kept per URL name
+
+current_timings = contextvars.ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    __slots__ = ('db_count', 'db', 'serialize', 'render')
+
+    def __init__(self):
+        self.db_count = 0
+        self.db = 0.0  # Seconds
+        self.serialize = 0.0
+        self.render = 0.0
+
+    def header(self, total):  # Server-Timing header value, durations in milliseconds
+        return (f'db;dur={self.db * 1000:.3f};desc="{self.db_count} queries", '
+                f'serialize;dur={self.serialize * 1000:.3f}, render;dur={self.render * 1000:.3f}, '
+                f'total;dur={total * 1000:.3f}')
+
+
+@contextmanager
+def timed(phase):  # Adds the time spent in the block to `phase` of the current request, if there is one
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timings, phase, getattr(timings, phase) + time.perf_counter() - start)
+
+
+def time_queries(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - start
+        timings.db_count += 1
+
+
+def install_query_timer(connection, **kwargs):  # connection_created receiver
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedSerializerMixin:
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class ViewStats:
+    def __init__(self, window=ROLLING_WINDOW):
+        self.window = window
+        self._samples = {}  # {url name: deque of (total, db, db_count, serialize, render)}
+
+    def record(self, view_name, timings, total):
+        samples = self._samples.get(view_name)
+        if samples is None:
+            samples = self._samples.setdefault(view_name, deque(maxlen=self.window))
+        samples.append((total, timings.db, timings.db_count, timings.serialize, timings.render))
+
+    def snapshot(self):  # {url name: aggregates over its recent requests}, durations in milliseconds
+        result = {}
+        for view_name, samples in list(self._samples.items()):
+            samples = list(samples)
+            if not samples:
+                continue
+            totals = sorted(sample[0] for sample in samples)
+            result[view_name] = {
+                'requests': len(samples),
+                'total_p50_ms': round(totals[len(totals) // 2] * 1000, 3),
+                'total_p95_ms': round(totals[min(len(totals) - 1, int(len(totals) * 0.95))] * 1000, 3),
+                'total_max_ms': round(totals[-1] * 1000, 3),
+                'db_mean_ms': round(statistics.fmean(sample[1] for sample in samples) * 1000, 3),
+                'queries_mean': round(statistics.fmean(sample[2] for sample in samples), 2),
+                'serialize_mean_ms': round(statistics.fmean(sample[3] for sample in samples) * 1000, 3),
+                'render_mean_ms': round(statistics.fmean(sample[4] for sample in samples) * 1000, 3),
+            }
+        return dict(sorted(result.items()))
+
+    def clear(self):
+        self._samples.clear()
+
+
+view_stats = ViewStats()
+
+
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    def finish(self, request, response, timings, total):
+        response['Server-Timing'] = timings.header(total)
+        match = request.resolver_match
+        if match is not None and match.url_name:
+            view_stats.record(match.url_name, timings, total)
+        request_metrics.observe(match.url_name if match is not None and match.url_name else UNMATCHED_VIEW,
+                                request.method, response.status_code, total, timings.db_count)
+        return response
@@ -0,0 +1,139 @@
+"""
+Refresh token blacklist handling for the Blood Bank Management System.
+
+Every user_login writes an OutstandingToken row and every user_logout (or rotated refresh) a BlacklistedToken row.
+simplejwt never removes them, and checks the blacklist with a join query on every refresh token it verifies.
+
+1. BlacklistFilter: Per-process set of the blacklisted token ids (jti). Checking a token that isn't blacklisted, the
+   common case, is answered from the set without a query. New blacklist entries store a new generation token in the
+   shared default cache (see signals.py and settings.CACHES); every process compares it with the generation it loaded
+   on each check and then reads only the entries added since. Should the generation be missed (a cache that isn't
+   shared, or an evicted key), a "not blacklisted" answer is still trusted for at most max_staleness seconds before
+   the new entries are read anyway. The set is rebuilt from scratch every full_reload_interval seconds, which drops
+   the tokens removed by flush_expired_tokens.
+2. CachedRefreshToken: simplejwt's RefreshToken checking the blacklist through the filter.
+3. flush_expired_tokens: Deletes expired outstanding tokens, and their blacklist entries, in batches so the tables
+   never stay locked for long. Run by the compact_tokens command or by TokenCompactor.
+4. TokenCompactor: Optional background thread that runs flush_expired_tokens every TOKEN_COMPACTION_INTERVAL seconds.
+"""
+
+import logging
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+logger = logging.getLogger(__name__)
+
+GENERATION_CACHE_KEY = 'api:token_blacklist:generation'
+FLUSH_BATCH_SIZE = 1000
+
+
+class BlacklistFilter:
+    full_reload_interval = 3600  # Seconds between full rebuilds of the set
+    max_staleness = 5  # Seconds a check may go without reading new entries, whatever the generation says
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (generation, frozenset of jti, highest BlacklistedToken id read, loaded_at, read_at), replaced as a whole
+        self._state = None
+
+    def _get_state(self):
+        state = self._state
+        generation = cache.get(GENERATION_CACHE_KEY)  # Read before the rows, so a newer entry forces another read
+        now = time.monotonic()
+        if state is not None and state[0] == generation and now - state[4] < self.max_staleness \
+                and now - state[3] < self.full_reload_interval:
+            return state
+
+        with self._lock:
+            state = self._state
+            now = time.monotonic()
+            if state is None or now - state[3] >= self.full_reload_interval:
+                rows = self._read_rows(BlacklistedToken.objects.filter(token__expires_at__gt=aware_utcnow()))
+                state = (generation, frozenset(jti for _, jti in rows), max((pk for pk, _ in rows), default=0), now,
+                         now)
+            elif state[0] != generation or now - state[4] >= self.max_staleness:
+                rows = self._read_rows(BlacklistedToken.objects.filter(id__gt=state[2]))
+                state = (generation, state[1].union(jti for _, jti in rows),
+                         max((pk for pk, _ in rows), default=state[2]), state[3], now)
+            self._state = state
+        return state
+
+    def _read_rows(self, queryset):
+        return list(queryset.values_list('id', 'token__jti'))
+
+    def contains(self, jti):  # True when the token with id `jti` is blacklisted
+        return jti in self._get_state()[1]
+
+    def invalidate(self):
+        cache.set(GENERATION_CACHE_KEY, uuid.uuid4().hex, None)
+
+    def reset(self):  # Forgets the loaded set, the next check rebuilds it
+        self._state = None
+
+
+blacklist_filter = BlacklistFilter()
+
+
+class CachedRefreshToken(RefreshToken):
+    def check_blacklist(self):  # Same check as BlacklistMixin.check_blacklist, answered by blacklist_filter
+        if blacklist_filter.contains(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+
+def flush_expired_tokens(batch_size=FLUSH_BATCH_SIZE):  # Returns the number of outstanding tokens deleted
+    now = aware_utcnow()
+    last_id = 0
+    deleted = 0
+
+    while True:
+        # Walks the primary key instead of re-scanning from the start for every batch
+        ids = list(OutstandingToken.objects.filter(id__gt=last_id, expires_at__lte=now)
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+
+        with transaction.atomic():
+            # The cascade is done by hand: QuerySet.delete() would load every token into a model instance first
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            outstanding = OutstandingToken.objects.filter(id__in=ids)
+            outstanding._raw_delete(outstanding.db)
+        deleted += len(ids)
+        last_id = ids[-1]
+
+
+class TokenCompactor:
+    def __init__(self, interval, batch_size=FLUSH_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='token-compactor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                deleted = flush_expired_tokens(self.batch_size)
+                if deleted:
+                    logger.info("Deleted %d expired tokens", deleted)
+            except DatabaseError:
+                logger.exception("Token compaction failed")
+            finally:
+                connection.close()  # The thread's own connection, opened again on the next run
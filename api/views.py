@@ -1,6 +1,4 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import authenticate
@@ -8,8 +6,40 @@ from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
 from .serializers import *
+from .approvals import enqueue_approval, wants_queued_approval
+from .batch import InvalidBatch, read_operations, run_batch
+from .blood_types import blood_type_registry
+from .changes import CursorExpired, DEFAULT_CHANGES_LIMIT, MAX_CHANGES_LIMIT, read_changes
+from .database import read_only
+from .exports import export_response, EXPORT_FORMATS
+from .imports import import_donor_rows, read_rows, UnsupportedFormat
+from .inventory import fulfill_request, RequestNotPending, InsufficientStock, allocate_pending_requests, \
+    allocation_report, AllocationConflict
+from .matching import COMPATIBLE_DONOR_TYPES, eligible_donors, eligible_since
+from .provisioning import provision_users as provision_user_rows
+from .search import match_expression, search_donors as search_donor_rows
+from .summary import summary_rows
+from .pagination import KeysetPaginator, InvalidCursor, is_cursor_request, get_page_size, wants_count
+from .metrics import PROMETHEUS_CONTENT_TYPE, metrics_enabled, render_metrics
+from .timing import view_stats
+from .tokens import CachedRefreshToken
 from datetime import date
+import csv
+
+
+def filter_donors(donors_list, query):  # On blood_type_id so the (blood_type, last_donated) index is used
+    return donors_list.filter(blood_type_id__in=blood_type_registry.ids_containing(query.strip()))
+
+
+def filter_blood_requests(request_list, query):  # Exact match on status so the (status, id) index is used
+    statuses = {value.lower(): value for value, _ in BloodRequest.STATUS_CHOICES}
+    if query.strip().lower() not in statuses:
+        raise ValueError(f"Status must be one of: {', '.join(statuses.values())}")
+    return request_list.filter(status=statuses[query.strip().lower()])
 
 
 # Create your views here.
@@ -51,7 +81,7 @@ def user_login(request):  # Function for user login
     user = authenticate(username=username, password=password)
 
     if user is not None:
-        refresh = RefreshToken.for_user(user)
+        refresh = CachedRefreshToken.for_user(user)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token, ), 'user': {
@@ -68,13 +98,29 @@ def user_login(request):  # Function for user login
 def user_logout(request):
     try:
         refresh_token = request.data.get('refresh')
-        token = RefreshToken(refresh_token)
+        token = CachedRefreshToken(refresh_token)
         token.blacklist()
         return Response({'message': 'Successfully logged out'}, status=status.HTTP_205_RESET_CONTENT)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def provision_users(request):  # Function to register users in bulk from a streamed CSV or NDJSON upload
+    if request.user.is_staff:
+        try:
+            result = provision_user_rows(read_rows(request.stream or [], request.content_type))
+        except UnsupportedFormat:
+            return Response({'error': 'Upload must be text/csv or application/x-ndjson'},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        except (UnicodeDecodeError, csv.Error) as e:  # Batches before the broken line stay created
+            return Response({'error': f'Could not read upload: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Users provisioned", **result.as_dict()}, status=status.HTTP_200_OK)
+    else:
+        return Response({'message': 'Only admin can provision users'}, status=status.HTTP_403_FORBIDDEN)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_blood_type(request):
@@ -89,6 +135,7 @@ def add_blood_type(request):
         return Response({'message': 'Only admin can add blood type'}, status=status.HTTP_403_FORBIDDEN)
 
 
+@read_only
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_all_donors(request):  # Function to  get all list of donor
@@ -98,16 +145,35 @@ def get_all_donors(request):  # Function to  get all list of donor
         donors_list = BloodDonor.objects.all()
 
         if query:  # Included search functionality
-            donors_list = donors_list.filter(blood_type__name__icontains=query.strip())
+            donors_list = filter_donors(donors_list, query)
+
+        if is_cursor_request(request):  # Opt-in keyset pagination, no OFFSET scan and no COUNT unless asked for
+            try:
+                columns = DonorValuesSerializer.columns('last_donated', 'id')
+                keyset_page = KeysetPaginator(donors_list.values_list(*columns), ('-last_donated', '-id'),
+                                              get_page_size(request), columns).get_page(request.GET.get('cursor'))
+            except InvalidCursor:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = DonorValuesSerializer(keyset_page.object_list)
+            json_data = {
+                'donors': serializer.data,
+                'next': keyset_page.next_cursor,
+                'previous': keyset_page.previous_cursor,
+            }
+            if wants_count(request):
+                json_data['total_donors'] = donors_list.count()
+            return Response(json_data, status=status.HTTP_200_OK)
 
         donors = donors_list.order_by("-last_donated")
 
-        total_donors = donors.count()
-
         donor_paginator = Paginator(donors, 5)  # Pagination included for list of donors greater than 10 sets
         paginated_donors_list = donor_paginator.get_page(page)
+        total_donors = donor_paginator.count  # Reuses the paginator's COUNT instead of running a second one
 
-        serializer = DonorSerializer(paginated_donors_list, many=True)
+        # Only the serialized columns of the page are read, the blood type name is joined in SQL
+        serializer = DonorValuesSerializer(paginated_donors_list.object_list.values_list(
+            *DonorValuesSerializer.columns()))
         json_data = {
             'donors': serializer.data,
             'total_donors': total_donors,
@@ -119,6 +185,31 @@ def get_all_donors(request):  # Function to  get all list of donor
         return Response({"message": "List of donors can only be viewed by admin"}, status=status.HTTP_403_FORBIDDEN)
 
 
+@read_only
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_donors(request):  # Function to search donors by name (?q=), optionally of some blood types (?blood_type=)
+    if request.user.is_staff:
+        expression = match_expression(request.GET.get('q', ''))
+        if expression is None:
+            return Response({'error': 'q must contain a word to search for'}, status=status.HTTP_400_BAD_REQUEST)
+
+        names = [name for value in request.GET.getlist('blood_type') for name in value.split(',') if name]
+        try:
+            blood_type_ids = [blood_type_registry.get_id(name) for name in names]
+            after = int(request.GET.get('after', 0))
+        except BloodType.DoesNotExist as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({'error': 'after must be a donor id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        donors, next_after = search_donor_rows(expression, blood_type_ids, get_page_size(request), after)
+        serializer = DonorValuesSerializer(donors)
+        return Response({'donors': serializer.data, 'next': next_after}, status=status.HTTP_200_OK)
+    else:
+        return Response({"message": "Donors can only be searched by admin"}, status=status.HTTP_403_FORBIDDEN)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_donor(request):  # Function to Add a new donor
@@ -136,6 +227,22 @@ def add_donor(request):  # Function to Add a new donor
         return Response({'message': 'Only admin can add donor'}, status=status.HTTP_403_FORBIDDEN)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_donors(request):  # Function to add donors in bulk from a streamed CSV or NDJSON upload
+    if request.user.is_staff:
+        try:
+            result = import_donor_rows(read_rows(request.stream or [], request.content_type))
+        except UnsupportedFormat:
+            return Response({'error': 'Upload must be text/csv or application/x-ndjson'},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        except (UnicodeDecodeError, csv.Error) as e:  # Batches before the broken line stay imported
+            return Response({'error': f'Could not read upload: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Donors imported", **result.as_dict()}, status=status.HTTP_200_OK)
+    else:
+        return Response({'message': 'Only admin can import donors'}, status=status.HTTP_403_FORBIDDEN)
+
+
 @api_view(['PATCH', 'PUT'])
 @permission_classes([IsAuthenticated])
 def update_donor(request, id):  # Function to update current donor details
@@ -165,11 +272,12 @@ def delete_donor(request, id):  # Function to delete existing donor
 
 
 # Function to get all blood types in inventory and respected units available (*accessed by admin and users)
+@read_only
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_blood_inventory(request):
-    blood_inventory = BloodInventory.objects.all()
-    serializer = BloodInventorySerializer(blood_inventory, many=True)
+    blood_inventory = BloodInventory.objects.values_list(*BloodInventoryValuesSerializer.columns())
+    serializer = BloodInventoryValuesSerializer(blood_inventory)
     json_data = serializer.data
     return Response(json_data, status=status.HTTP_200_OK)
 
@@ -204,6 +312,40 @@ def update_bloodinventory(request, id):  # Function to update units available to
         return Response({'message': 'Only admin can update Blood Inventory'}, status=status.HTTP_403_FORBIDDEN)
 
 
+@read_only
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def summary(request):  # Function to get units available and pending / fulfilled requests per blood type
+    if request.user.is_staff:
+        serializer = BloodTypeSummaryValuesSerializer(summary_rows())
+        return Response({'blood_types': serializer.data}, status=status.HTTP_200_OK)
+    else:
+        return Response({'message': 'Summary can only be viewed by admin'}, status=status.HTTP_403_FORBIDDEN)
+
+
+@read_only
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def changes(request):  # Function to get the inventory, donor and request rows changed after a cursor (?since=&limit=)
+    if request.user.is_staff:
+        try:
+            since = int(request.GET.get('since', 0))
+            limit = int(request.GET.get('limit', DEFAULT_CHANGES_LIMIT))
+        except ValueError:
+            return Response({'error': 'since and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0:
+            return Response({'error': 'since must not be negative'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            change_list, next_since, has_more = read_changes(since, min(max(limit, 1), MAX_CHANGES_LIMIT))
+        except CursorExpired:
+            return Response({'error': 'Cursor is older than the change log keeps deletions, sync again from since=0'},
+                            status=status.HTTP_410_GONE)
+        return Response({'changes': change_list, 'next': next_since, 'has_more': has_more}, status=status.HTTP_200_OK)
+    else:
+        return Response({'message': 'Changes can only be viewed by admin'}, status=status.HTTP_403_FORBIDDEN)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def request_blood(request):  # Function for Requesting Blood
@@ -220,23 +362,45 @@ def request_blood(request):  # Function for Requesting Blood
         return Response({"message": "Blood request can be initiated by users only"}, status=status.HTTP_403_FORBIDDEN)
 
 
+@read_only
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def view_all_bloodrequest(request):
     if request.user.is_staff:
         page = request.GET.get('page', 1)
         query = request.GET.get('q', '')
-        request_list = BloodRequest.objects.all()
-
-        if query:
-            request_list = request_list.filter(status__icontains=query)  # Included search functionality
+        request_list = BloodRequest.objects.order_by('id')
 
-        total_requests = request_list.count()
+        if query:  # Included search functionality
+            try:
+                request_list = filter_blood_requests(request_list, query)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if is_cursor_request(request):  # Opt-in keyset pagination, no OFFSET scan and no COUNT unless asked for
+            try:
+                columns = BloodRequestValuesSerializer.columns()
+                keyset_page = KeysetPaginator(request_list.values_list(*columns), ('id',), get_page_size(request),
+                                              columns).get_page(request.GET.get('cursor'))
+            except InvalidCursor:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = BloodRequestValuesSerializer(keyset_page.object_list)
+            json_data = {
+                'blood_requests': serializer.data,
+                'next': keyset_page.next_cursor,
+                'previous': keyset_page.previous_cursor,
+            }
+            if wants_count(request):
+                json_data['total_request'] = request_list.count()
+            return Response(json_data, status=status.HTTP_200_OK)
 
         blood_request_paginator = Paginator(request_list, 5)  # Pagination included for list of blood request
         paginated_blood_requests = blood_request_paginator.get_page(page)
+        total_requests = blood_request_paginator.count
 
-        serializer = BloodRequestSerializer(paginated_blood_requests, many=True)
+        serializer = BloodRequestValuesSerializer(paginated_blood_requests.object_list.values_list(
+            *BloodRequestValuesSerializer.columns()))
         json_data = {
             'blood_requests': serializer.data,
             'total_request': total_requests,
@@ -258,17 +422,148 @@ def approve_request(request, id):
         if not request.data:
             return Response({"message": "No data provided"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not request.data['status']:
+        if not request.data.get('status'):
             return Response({"message": "Request cancelled"}, status=status.HTTP_200_OK)
 
-        request.data['status'] = 'Fulfilled'  # Status of request changing from Pending to Fulfilled if Status is True
+        # Queued mode: a worker approves it later (see approvals.py), the client follows the job's Location
+        if wants_queued_approval(request):
+            if blood_request.status != BloodRequest.PENDING:
+                return Response({"message": "Request is already fulfilled"}, status=status.HTTP_409_CONFLICT)
+            job = enqueue_approval(blood_request, request.user)
+            return Response({"message": "Request queued for approval", "job": job.id}, status=status.HTTP_202_ACCEPTED,
+                            headers={'Location': reverse('approval_job', kwargs={'id': job.id})})
+
+        # Status of request changing from Pending to Fulfilled if Status is True, units are taken out of inventory
+        try:
+            fulfill_request(blood_request)
+        except RequestNotPending:
+            return Response({"message": "Request is already fulfilled"}, status=status.HTTP_409_CONFLICT)
+        except InsufficientStock:
+            blood_type_name = blood_type_registry.get_name(blood_request.blood_type_id)
+            return Response({"message": f"Not enough units of {blood_type_name} in inventory"},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({"message": " Request successfully approved"}, status=status.HTTP_200_OK)
+    else:
+        return Response({"message": "Blood Request can only be approved by admin"},
+                        status=status.HTTP_403_FORBIDDEN)
 
-        serializer = BloodRequestSerializer(instance=blood_request, data=request.data, partial=True)
 
-        if serializer.is_valid():
-            serializer.save()
-            return Response({"message": " Request successfully approved"}, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+@read_only
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def approval_job(request, id):  # Function to get the status and outcome of a queued approval
+    if request.user.is_staff:
+        job = get_object_or_404(ApprovalJob, pk=id)
+        return Response(ApprovalJobSerializer(job).data, status=status.HTTP_200_OK)
     else:
-        return Response({"message": "Blood Request can only be approved by admin"},
+        return Response({"message": "Approval jobs can only be viewed by admin"}, status=status.HTTP_403_FORBIDDEN)
+
+
+@read_only
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def compatible_donors(request, id):  # Function to list the donors who can give blood for a blood request today
+    if request.user.is_staff:
+        blood_request = get_object_or_404(BloodRequest, pk=id)
+        blood_type_name = blood_type_registry.get_name(blood_request.blood_type_id)
+
+        serializer = DonorValuesSerializer(eligible_donors(blood_type_name, get_page_size(request)))
+        json_data = {
+            'blood_request': blood_request.id,
+            'blood_type': blood_type_name,
+            'compatible_blood_types': list(COMPATIBLE_DONOR_TYPES[blood_type_name]),
+            'last_donated_before': eligible_since(),
+            'donors': serializer.data,
+        }
+        return Response(json_data, status=status.HTTP_200_OK)
+    else:
+        return Response({"message": "Compatible donors can only be viewed by admin"}, status=status.HTTP_403_FORBIDDEN)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def allocate_requests(request):  # Function to fulfill every pending request the inventory can cover, oldest first
+    if request.user.is_staff:
+        try:
+            allocations = allocate_pending_requests()
+        except AllocationConflict:
+            return Response({"message": "Inventory kept changing during allocation, try again"},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({"message": "Pending requests allocated", **allocation_report(allocations)},
+                        status=status.HTTP_200_OK)
+    else:
+        return Response({"message": "Blood Requests can only be allocated by admin"},
                         status=status.HTTP_403_FORBIDDEN)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch(request):  # Function to run a list of write operations in one transaction, all of them or none
+    try:
+        operations = read_operations(request.data)
+    except InvalidBatch as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    results, failed = run_batch(request, operations)
+    if failed is not None:  # Everything before it was rolled back too
+        return Response({'committed': False, 'failed': failed, 'results': results}, status=status.HTTP_409_CONFLICT)
+    return Response({'committed': True, 'results': results}, status=status.HTTP_200_OK)
+
+
+@read_only
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_donors(request):  # Function to download all donors as CSV or NDJSON (?output=csv|ndjson)
+    if request.user.is_staff:
+        output = request.GET.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response({'error': 'output must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+
+        donors_list = BloodDonor.objects.order_by('id')
+        query = request.GET.get('q', '')
+        if query:  # Same search as getall_donors/
+            donors_list = filter_donors(donors_list, query)
+
+        return export_response(donors_list, ['id', 'donor_name', 'blood_type__name', 'units_donated', 'last_donated'],
+                               'donors', output)
+    else:
+        return Response({"message": "Donors can only be exported by admin"}, status=status.HTTP_403_FORBIDDEN)
+
+
+@read_only
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_blood_requests(request):  # Function to download all blood requests as CSV or NDJSON (?output=csv|ndjson)
+    if request.user.is_staff:
+        output = request.GET.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response({'error': 'output must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+
+        request_list = BloodRequest.objects.order_by('id')
+        query = request.GET.get('q', '')
+        if query:  # Same search as get_all_blood_request/
+            try:
+                request_list = filter_blood_requests(request_list, query)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return export_response(request_list, ['id', 'user', 'blood_type__name', 'units_requested', 'status'],
+                               'blood_requests', output)
+    else:
+        return Response({"message": "Blood requests can only be exported by admin"}, status=status.HTTP_403_FORBIDDEN)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def view_timings(request):  # Function to get the rolling timing aggregates of every view served by this process
+    if request.user.is_staff:
+        return Response({'views': view_stats.snapshot()}, status=status.HTTP_200_OK)
+    else:
+        return Response({"message": "View timings can only be viewed by admin"}, status=status.HTTP_403_FORBIDDEN)
+
+
+@require_GET
+def metrics(request):  # Function to serve Prometheus metrics, a plain view since scrapers don't send a JWT
+    if not metrics_enabled():
+        raise Http404
+    return HttpResponse(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
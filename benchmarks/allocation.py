@@ -0,0 +1,50 @@
+"""
+Time of one allocate_pending_requests pass over tens of thousands of pending requests.
+
+Seeds --requests pending requests spread over all blood types, with roughly --coverage of the requested units in
+stock, on a file based SQLite database, then times the allocation (one transaction, including the commit).
+"""
+
+import argparse
+import random
+import time
+
+from common import create_database
+
+from django.contrib.auth.models import User
+
+from api.inventory import allocate_pending_requests, allocation_report
+from api.models import BloodInventory, BloodRequest, BloodType
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=50_000)
+    parser.add_argument('--coverage', type=float, default=0.7)
+    args = parser.parse_args()
+
+    destroy = create_database(file_based=True)
+    try:
+        rng = random.Random(0)
+        user = User.objects.create(username='bench')
+        blood_types = [BloodType.objects.create(name=name) for name, _ in BloodType.BLOOD_TYPE_CHOICES]
+        requests = [BloodRequest(user=user, blood_type=rng.choice(blood_types), units_requested=rng.randint(1, 4))
+                    for _ in range(args.requests)]
+        BloodRequest.objects.bulk_create(requests, batch_size=5000)
+        for blood_type in blood_types:
+            requested = sum(r.units_requested for r in requests if r.blood_type_id == blood_type.id)
+            BloodInventory.objects.create(blood_type=blood_type, quantity=int(requested * args.coverage))
+
+        start = time.perf_counter()
+        report = allocation_report(allocate_pending_requests())
+        elapsed = time.perf_counter() - start
+
+        print(f"allocated {args.requests} pending requests in {elapsed * 1000:.0f} ms: "
+              f"{report['fulfilled_requests']} fulfilled, {report['pending_requests']} still pending")
+        assert not BloodInventory.objects.filter(quantity__lt=0).exists()
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
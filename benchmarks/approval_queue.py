@@ -0,0 +1,104 @@
+"""
+Approval queue: --requests approvals sent by --clients threads through approve_request/<id>, synchronously and in
+queued mode (`Prefer: respond-async`) while `process_approvals` workers run the jobs.
+
+Prints the HTTP latency of each mode, approvals per second (for the queued mode, until the last job is done) and
+checks every unit is accounted for:
+    units left in inventory + units of fulfilled requests == starting stock
+The stock covers only part of the requests, so both modes also answer "not enough units".
+"""
+
+import argparse
+import threading
+import time
+
+from common import create_database, percentile
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.approvals import APPROVAL_BATCH_SIZE, WORKER_POLL_INTERVAL, ApprovalWorker
+from api.models import ApprovalJob, BloodInventory, BloodRequest, BloodType
+
+
+def send_approvals(args, token, requests, headers):  # Returns (latencies in seconds, wall time)
+    latencies = []
+    lock = threading.Lock()
+
+    def work(index):
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}', **headers)
+        try:
+            for blood_request in requests[index::args.clients]:
+                start = time.perf_counter()
+                client.post(f'/approve_request/{blood_request.id}', {'status': True}, content_type='application/json')
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+        finally:
+            connection.close()  # Every thread has its own connection
+
+    threads = [threading.Thread(target=work, args=(index,)) for index in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def check_stock(args, blood_type):
+    quantity = BloodInventory.objects.get(blood_type=blood_type).quantity
+    fulfilled = BloodRequest.objects.filter(blood_type=blood_type, status=BloodRequest.FULFILLED) \
+        .aggregate(units=Sum('units_requested'))['units'] or 0
+    return 'OK' if quantity + fulfilled == args.stock else 'LOST UPDATES'
+
+
+def print_run(label, args, latencies, elapsed, blood_type):
+    print(f"{label:<8} HTTP p50 {percentile(latencies, 0.5) * 1000:7.2f} ms   p95 "
+          f"{percentile(latencies, 0.95) * 1000:7.2f} ms   p99 {percentile(latencies, 0.99) * 1000:7.2f} ms   "
+          f"{args.requests / elapsed:6.0f} approvals/s   stock {check_stock(args, blood_type)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--stock', type=int, default=3000)
+    parser.add_argument('--threads', type=int, default=2, help="process_approvals worker threads")
+    parser.add_argument('--batch-size', type=int, default=APPROVAL_BATCH_SIZE)
+    parser.add_argument('--poll-interval', type=float, default=WORKER_POLL_INTERVAL)
+    args = parser.parse_args()
+
+    destroy = create_database(file_based=True)
+    try:
+        admin = User.objects.create(username='bench-admin', is_staff=True)
+        token = str(RefreshToken.for_user(admin).access_token)
+
+        for label, headers in (('sync', {}), ('queued', {'HTTP_PREFER': 'respond-async'})):
+            blood_type = BloodType.objects.create(name='O+' if label == 'sync' else 'A+')
+            BloodInventory.objects.create(blood_type=blood_type, quantity=args.stock)
+            requests = BloodRequest.objects.bulk_create(
+                BloodRequest(user=admin, blood_type=blood_type, units_requested=2) for _ in range(args.requests))
+
+            if label == 'sync':
+                latencies, elapsed = send_approvals(args, token, requests, headers)
+            else:
+                worker = ApprovalWorker(args.threads, args.batch_size, args.poll_interval)
+                worker_thread = threading.Thread(target=worker.run)
+                start = time.perf_counter()
+                worker_thread.start()
+                latencies, _ = send_approvals(args, token, requests, headers)
+                while ApprovalJob.objects.exclude(status=ApprovalJob.DONE).exists():
+                    time.sleep(0.01)
+                elapsed = time.perf_counter() - start
+                worker.stop()
+                worker_thread.join()
+            print_run(label, args, latencies, elapsed, blood_type)
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
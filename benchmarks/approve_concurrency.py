@@ -0,0 +1,120 @@
+"""
+Concurrent approvals: checks for lost inventory updates and measures approvals per second.
+
+Several threads approve pending requests for the same blood type through approve_request/<id> at the same
+time, with less stock than is requested in total. Afterwards every unit must be accounted for:
+    units left in inventory + units of fulfilled requests == starting stock
+and no request may be fulfilled once stock ran out.
+
+For comparison the previous flow (read the inventory row, then write back quantity - units as
+update_units/<id> does) is run with the same threads and the number of lost updates is printed.
+"""
+
+import argparse
+import threading
+import time
+
+from common import create_database
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import BloodInventory, BloodRequest, BloodType
+
+
+def run_threads(threads, work):
+    barrier = threading.Barrier(threads)
+
+    def target(index):
+        barrier.wait()
+        try:
+            work(index)
+        finally:
+            connection.close()  # Every thread has its own connection
+
+    workers = [threading.Thread(target=target, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def approve_concurrently(args, admin, blood_type):
+    requests = BloodRequest.objects.bulk_create(
+        BloodRequest(user=admin, blood_type=blood_type, units_requested=2) for _ in range(args.requests))
+    token = str(RefreshToken.for_user(admin).access_token)
+    statuses = {}
+
+    def work(index):
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        for blood_request in requests[index::args.threads]:
+            response = client.post(f'/approve_request/{blood_request.id}', {'status': True},
+                                   content_type='application/json')
+            statuses[blood_request.id] = response.status_code
+
+    elapsed = run_threads(args.threads, work)
+
+    quantity = BloodInventory.objects.get(blood_type=blood_type).quantity
+    fulfilled = BloodRequest.objects.filter(status=BloodRequest.FULFILLED).aggregate(units=Sum('units_requested'))
+    fulfilled_units = fulfilled['units'] or 0
+    approved = sum(1 for code in statuses.values() if code == 200)
+    conflicts = sum(1 for code in statuses.values() if code == 409)
+
+    print(f"conditional decrement: {approved} approved, {conflicts} conflicts, "
+          f"{len(statuses) - approved - conflicts} other in {elapsed:.2f} s "
+          f"({len(statuses) / elapsed:.0f} approvals/s)")
+    print(f"  stock {args.stock} = {quantity} left + {fulfilled_units} fulfilled: "
+          f"{'OK' if quantity + fulfilled_units == args.stock else 'LOST UPDATES'}")
+
+
+def read_modify_write_concurrently(args, blood_type):
+    # The old flow: GET the inventory, then PUT the decremented quantity back through update_units/<id>
+    inventory_id = BloodInventory.objects.get(blood_type=blood_type).id
+    BloodInventory.objects.filter(pk=inventory_id).update(quantity=args.stock)
+    taken = [0] * args.threads
+    locked = [0] * args.threads
+
+    def work(index):
+        for _ in range(args.requests // args.threads):
+            try:
+                quantity = BloodInventory.objects.get(pk=inventory_id).quantity
+                if quantity < 2:
+                    return
+                BloodInventory.objects.filter(pk=inventory_id).update(quantity=quantity - 2)
+            except OperationalError:  # "database is locked"
+                locked[index] += 1
+                continue
+            taken[index] += 2
+
+    elapsed = run_threads(args.threads, work)
+    quantity = BloodInventory.objects.get(pk=inventory_id).quantity
+    print(f"read-modify-write:     {sum(taken)} units handed out from a stock of {args.stock} in {elapsed:.2f} s, "
+          f"{quantity} left, {quantity + sum(taken) - args.stock} units lost, {sum(locked)} 'database is locked' errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--stock', type=int, default=3000)
+    args = parser.parse_args()
+
+    destroy = create_database(file_based=True)
+    try:
+        admin = User.objects.create(username='bench-admin', is_staff=True)
+        blood_type = BloodType.objects.create(name='O+')
+        BloodInventory.objects.create(blood_type=blood_type, quantity=args.stock)
+
+        approve_concurrently(args, admin, blood_type)
+        read_modify_write_concurrently(args, blood_type)
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Concurrency and tail latency of the read endpoints under WSGI and ASGI serving.
+
+Each scenario keeps --concurrency requests in flight until --requests have completed:
+    wsgi              the sync views through the WSGI handler, one thread per in flight request (like a threaded
+                      WSGI server)
+    asgi, sync views  the same views through the ASGI handler on one event loop; Django runs each of them in a
+                      thread through sync_to_async
+    asgi, async views the async/ versions through the ASGI handler on one event loop
+
+The ASGI scenarios drive bloodbank's ASGI application in process with django.test.AsyncClient, which is how uvicorn
+calls it minus the socket handling; the WSGI scenario uses django.test.Client the same way.
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from common import create_database, percentile
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import AsyncClient, Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import BloodDonor, BloodInventory, BloodRequest, BloodType
+
+PATHS = ['get_bloodinventory', 'getall_donors/?page=3', 'get_all_blood_request/?q=pending']
+
+
+def seed():
+    blood_types = [BloodType.objects.create(name=name) for name, _ in BloodType.BLOOD_TYPE_CHOICES]
+    admin = User.objects.create(username='bench-admin', is_staff=True)
+    for i, blood_type in enumerate(blood_types):
+        BloodInventory.objects.create(blood_type=blood_type, quantity=i * 3)
+    BloodDonor.objects.bulk_create(
+        BloodDonor(donor_name=f"d{i}", blood_type=blood_types[i % 8], units_donated=1,
+                   last_donated=date(2024, 1, 1) + timedelta(days=i % 300)) for i in range(5000))
+    BloodRequest.objects.bulk_create(
+        BloodRequest(user=admin, blood_type=blood_types[i % 8], units_requested=1,
+                     status=BloodRequest.PENDING if i % 4 else BloodRequest.FULFILLED) for i in range(5000))
+    return admin
+
+
+def run_wsgi(token, concurrency, total, prefix):
+    local = threading.local()
+
+    def request(index):
+        if not hasattr(local, 'client'):
+            local.client = Client(headers={'Authorization': f'Bearer {token}'})
+        start = time.perf_counter()
+        response = local.client.get(f'/{prefix}{PATHS[index % len(PATHS)]}')
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        start = time.perf_counter()
+        samples = list(pool.map(request, range(total)))
+        elapsed = time.perf_counter() - start
+    return samples, elapsed
+
+
+async def run_asgi(token, concurrency, total, prefix):
+    client = AsyncClient()
+    headers = {'Authorization': f'Bearer {token}'}  # AsyncClient only puts per request headers into the ASGI scope
+    samples = []
+    indexes = iter(range(total))
+
+    async def worker():
+        for index in indexes:
+            start = time.perf_counter()
+            response = await client.get(f'/{prefix}{PATHS[index % len(PATHS)]}', headers=headers)
+            assert response.status_code == 200, response.status_code
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def report(label, concurrency, samples, elapsed):
+    print(f"{label:<18} c={concurrency:<3} {len(samples) / elapsed:8.0f} req/s   "
+          f"p50 {percentile(samples, 0.5) * 1000:7.2f} ms   p95 {percentile(samples, 0.95) * 1000:7.2f} ms   "
+          f"p99 {percentile(samples, 0.99) * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=1500)
+    args = parser.parse_args()
+
+    destroy = create_database(file_based=True)
+    try:
+        token = str(RefreshToken.for_user(seed()).access_token)
+        connection.close()  # Every thread (and sync_to_async's thread) opens its own connection
+
+        for concurrency in args.concurrency:
+            report('wsgi', concurrency, *run_wsgi(token, concurrency, args.requests, ''))
+            report('asgi, sync views', concurrency, *asyncio.run(run_asgi(token, concurrency, args.requests, '')))
+            report('asgi, async views', concurrency,
+                   *asyncio.run(run_asgi(token, concurrency, args.requests, 'async/')))
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
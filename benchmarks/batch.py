@@ -0,0 +1,98 @@
+"""
+Batch endpoint: one shift's sync sent as separate requests against the same operations sent as one `batch` request.
+
+A shift is --operations writes: a new donor, update_units calls and approvals of pending requests. Each shift is
+timed end to end through the test client, on a file database so every commit pays its fsync. Also printed: the
+commits per shift (writes in autocommit mode plus committed atomic blocks). --shifts shifts are run each way, each on
+its own rows.
+"""
+
+import argparse
+import json
+import time
+from unittest import mock
+
+from common import create_database, report
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import BloodInventory, BloodRequest, BloodType
+
+
+def shift_operations(args, name, admin, inventory):
+    approvals = args.operations // 4
+    requests = BloodRequest.objects.bulk_create(
+        BloodRequest(user=admin, blood_type=inventory.blood_type, units_requested=1) for _ in range(approvals))
+    operations = [{'method': 'POST', 'path': '/add_donor',
+                   'body': {'donor_name': name, 'blood_type': 'O+', 'units_donated': 1}}]
+    operations += [{'method': 'PUT', 'path': f'/update_units/{inventory.id}',
+                    'body': {'blood_type': 'O+', 'quantity': 100000 + i}}
+                   for i in range(args.operations - 1 - approvals)]
+    operations += [{'method': 'POST', 'path': f'/approve_request/{blood_request.id}', 'body': {'status': True}}
+                   for blood_request in requests]
+    return operations
+
+
+class CommitCounter:
+    def __init__(self):
+        self.commits = 0
+
+    def count_autocommit(self, execute, sql, params, many, context):  # execute_wrapper
+        if not context['connection'].in_atomic_block and sql.startswith(('INSERT', 'UPDATE', 'DELETE')):
+            self.commits += 1
+        return execute(sql, params, many, context)
+
+    def count_commit(self, commit):
+        def counted():
+            self.commits += 1
+            return commit()
+        return counted
+
+
+def timed_shifts(args, label, shifts, send):
+    counter = CommitCounter()
+    samples = []
+    with connection.execute_wrapper(counter.count_autocommit), \
+            mock.patch.object(connection, '_commit', counter.count_commit(connection._commit)):
+        for operations in shifts:
+            start = time.perf_counter()
+            send(operations)
+            samples.append(time.perf_counter() - start)
+    report(f"{label}, {args.operations} operations", samples)
+    print(f"  {counter.commits / len(shifts):.0f} commits per shift")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--operations', type=int, default=40)
+    parser.add_argument('--shifts', type=int, default=50)
+    args = parser.parse_args()
+
+    destroy = create_database(file_based=True)
+    try:
+        admin = User.objects.create(username='bench-admin', is_staff=True)
+        inventory = BloodInventory.objects.create(blood_type=BloodType.objects.create(name='O+'), quantity=100000)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(admin).access_token}')
+
+        def separately(operations):
+            for operation in operations:
+                response = client.generic(operation['method'], operation['path'], json.dumps(operation['body']),
+                                          content_type='application/json')
+                assert response.status_code < 400, response.content
+
+        def batched(operations):
+            response = client.post('/batch', {'operations': operations}, content_type='application/json')
+            assert response.status_code == 200, response.content
+
+        for label, prefix, send in (('separate requests', 'single', separately), ('one batch', 'batch', batched)):
+            shifts = [shift_operations(args, f'{prefix}-{shift}', admin, inventory) for shift in range(args.shifts)]
+            timed_shifts(args, label, shifts, send)
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Change feed: syncing the donors changed since a cursor through read_changes against re-reading the whole donor table,
+at millions of donors.
+
+Loads --donors synthetic donors (see api/synthetic.py), updates --changes of them, then times reading those changes
+from the feed (pages of MAX_CHANGES_LIMIT) and reading every donor with the donor list's values_list() query. Also
+prints what the change log costs on writes (--insert-rows donors inserted with and without its triggers) and the
+time compact_changes takes to expire the entries of --changes deleted donors.
+"""
+
+import argparse
+import random
+from datetime import timedelta
+
+from common import create_database, measure, report
+
+from django.db import connection
+
+from api.changes import MAX_CHANGES_LIMIT, compact_changes, read_changes
+from api.models import BloodDonor, BloodType, ChangeLogEntry
+from api.serializers import DonorValuesSerializer
+from api.synthetic import generate_donors, insert_donors
+
+SEARCH_TRIGGERS = ['api_blooddonor_fts_insert', 'api_blooddonor_fts_delete', 'api_blooddonor_fts_update']
+CHANGE_TRIGGERS = ['api_changelogentry_donor_insert', 'api_changelogentry_donor_update',
+                   'api_changelogentry_donor_delete']
+
+
+def sync(since):  # Every change after `since`, a page at a time
+    changes, has_more = [], True
+    while has_more:
+        page, since, has_more = read_changes(since, MAX_CHANGES_LIMIT)
+        changes += page
+    return changes
+
+
+def read_all_donors():
+    return DonorValuesSerializer(BloodDonor.objects.order_by('id').values_list(*DonorValuesSerializer.columns())).data
+
+
+def timed_insert(rng, count, prefix, blood_type_ids):
+    rows = list(generate_donors(rng, count, prefix, blood_type_ids))
+    return measure(lambda: insert_donors(rows), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--donors', type=int, default=1000000)
+    parser.add_argument('--changes', type=int, default=1000)
+    parser.add_argument('--insert-rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        with connection.cursor() as cursor:  # This benchmark doesn't search, the donors load faster without them
+            for trigger in SEARCH_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {trigger}')
+        blood_type_ids = {name: BloodType.objects.create(name=name).id for name, _ in BloodType.BLOOD_TYPE_CHOICES}
+        rng = random.Random(0)
+        insert_donors(generate_donors(rng, args.donors, 'gen', blood_type_ids))
+        print(f"{args.donors} donors loaded")
+
+        cursor = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first()
+        changed = rng.sample(range(1, args.donors + 1), args.changes)
+        BloodDonor.objects.filter(id__in=changed).update(units_donated=99)
+        report(f"change feed, {len(sync(cursor))} changes", measure(lambda: sync(cursor), args.repeat))
+        report(f"whole donor table, {len(read_all_donors())} donors",
+               measure(read_all_donors, max(1, args.repeat // 5)))
+
+        BloodDonor.objects.filter(id__in=changed)._raw_delete(connection.alias)
+        ChangeLogEntry.objects.filter(deleted=True).update(changed_at=ChangeLogEntry.objects.earliest(
+            'changed_at').changed_at - timedelta(days=365))
+        compaction = measure(compact_changes, 1)
+        print(f"compact_changes: {args.changes} deleted donor entries removed in {compaction[0] * 1000:.1f} ms")
+
+        with_triggers = timed_insert(rng, args.insert_rows, 'with', blood_type_ids)
+        with connection.cursor() as cursor:
+            for trigger in CHANGE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {trigger}')
+        without_triggers = timed_insert(rng, args.insert_rows, 'without', blood_type_ids)
+        print(f"inserting {args.insert_rows} donors: {with_triggers[0]:.2f} s with the change log triggers, "
+              f"{without_triggers[0]:.2f} s without")
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Shared setup for the benchmark scripts in this directory.
+
+Benchmarks are run from the project folder, e.g.:
+    python benchmarks/list_indexes.py --donors 200000
+
+Every benchmark works on a throwaway database created the same way as the test database (in memory, or a
+temporary file when threads need to share it), so db.sqlite3 is never touched.
+"""
+
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bloodbank.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+setup_test_environment(debug=False)  # Lets the test Client talk to the views, DEBUG off so queries are not logged
+logging.getLogger('django.request').setLevel(logging.ERROR)  # 4xx responses are expected, don't print them
+
+
+def create_database(file_based=False):
+    # Returns a callable that destroys the database again
+    if file_based:
+        directory = tempfile.mkdtemp(prefix='bloodbank-bench-')
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    return lambda: connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(function, repeat):  # Runs `function` `repeat` times and returns the durations in seconds
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def report(label, samples):
+    print(f"{label:<48} p50 {percentile(samples, 0.5) * 1000:9.3f} ms   "
+          f"p95 {percentile(samples, 0.95) * 1000:9.3f} ms   mean {statistics.fmean(samples) * 1000:9.3f} ms")
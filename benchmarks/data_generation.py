@@ -0,0 +1,44 @@
+"""
+Load time of `manage.py generate_data` on a throwaway file based SQLite database.
+
+Runs the command with --users, --donors and --requests (1M donors by default) and prints its rows per second, then
+the shape of the generated data: blood type shares, pending share and the spread of last_donated.
+"""
+
+import argparse
+import time
+
+from common import create_database
+
+from django.core.management import call_command
+from django.db.models import Count, Max, Min
+
+from api.models import BloodDonor, BloodRequest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--donors', type=int, default=1_000_000)
+    parser.add_argument('--requests', type=int, default=200_000)
+    args = parser.parse_args()
+
+    destroy = create_database(file_based=True)
+    try:
+        start = time.perf_counter()
+        call_command('generate_data', users=args.users, donors=args.donors, requests=args.requests)
+        print(f"total {time.perf_counter() - start:.1f} s")
+
+        for row in BloodDonor.objects.values('blood_type__name').annotate(count=Count('id')).order_by('-count'):
+            print(f"  {row['blood_type__name']:<4} {row['count'] / args.donors:6.1%} of donors")
+        dates = BloodDonor.objects.aggregate(oldest=Min('last_donated'), newest=Max('last_donated'))
+        print(f"  last_donated from {dates['oldest']} to {dates['newest']}, "
+              f"{BloodDonor.objects.filter(last_donated=None).count() / args.donors:.1%} never donated")
+        pending = BloodRequest.objects.filter(status=BloodRequest.PENDING).count()
+        print(f"  {pending / max(args.requests, 1):.1%} of blood requests pending")
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Bulk donor import throughput, compared with one add_donor call per donor.
+
+1. import_donors with a CSV upload of --rows donors (100k by default).
+2. The same number of rows fed straight into import_donor_rows from a generator, with tracemalloc's peak to show
+   that memory stays flat while the upload is read line by line.
+3. add_donor called --single-rows times, extrapolated to --rows.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from common import create_database
+
+from django.contrib.auth.models import User
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.imports import import_donor_rows, read_rows
+from api.models import BloodDonor, BloodType
+
+BLOOD_TYPES = [name for name, _ in BloodType.BLOOD_TYPE_CHOICES]
+
+
+def csv_lines(rows, prefix):
+    yield b"donor_name,blood_type,units_donated,last_donated\n"
+    for i in range(rows):
+        yield f"{prefix}{i},{BLOOD_TYPES[i % len(BLOOD_TYPES)]},{i % 3 + 1},2024-{i % 12 + 1:02d}-15\n".encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--single-rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        for name in BLOOD_TYPES:
+            BloodType.objects.create(name=name)
+        admin = User.objects.create(username='bench-admin', is_staff=True)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(admin).access_token}')
+
+        body = b"".join(csv_lines(args.rows, 'http'))
+        start = time.perf_counter()
+        response = client.post('/import_donors', body, content_type='text/csv')
+        elapsed = time.perf_counter() - start
+        print(f"import_donors (CSV upload):   {response.json()['imported']} rows in {elapsed:.2f} s "
+              f"({args.rows / elapsed:,.0f} rows/s)")
+
+        tracemalloc.start()  # Slows the import down a lot, so this pass is not timed
+        result = import_donor_rows(read_rows(csv_lines(args.rows, 'stream'), 'text/csv'))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"import_donor_rows (streamed): {result.imported} rows, peak memory {peak / 2 ** 20:.1f} MiB "
+              f"for a {len(body) / 2 ** 20:.1f} MiB upload")
+
+        start = time.perf_counter()
+        for i in range(args.single_rows):
+            client.post('/add_donor', {'donor_name': f'single{i}', 'blood_type': BLOOD_TYPES[i % len(BLOOD_TYPES)],
+                                       'units_donated': 1}, content_type='application/json')
+        elapsed = time.perf_counter() - start
+        print(f"add_donor (one call per row): {args.single_rows} rows in {elapsed:.2f} s "
+              f"({args.single_rows / elapsed:,.0f} rows/s, ~{args.rows / args.single_rows * elapsed:.0f} s "
+              f"for {args.rows} rows)")
+        assert BloodDonor.objects.count() == args.rows * 2 + args.single_rows
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Donor search: the FTS5 index behind search_donors against a LIKE '%x%' scan, at millions of donors.
+
+Loads --donors synthetic donors (named gen-donor-<n>, see api/synthetic.py), then times a page of 20 results for a
+few queries through search_donors and through donor_name__icontains with the same blood type filter. Also prints what
+the index costs on writes: the time to insert --insert-rows more donors with and without the sync triggers.
+"""
+
+import argparse
+import random
+
+from common import create_database, measure, report
+
+from django.db import connection
+
+from api.blood_types import blood_type_registry
+from api.models import BloodDonor, BloodType
+from api.search import match_expression, search_donors
+from api.serializers import DonorValuesSerializer
+from api.synthetic import generate_donors, insert_donors
+
+PAGE_SIZE = 20
+QUERIES = [  # (search_donors query, the same search as a LIKE pattern, blood types)
+    ('donor 123456', 'donor-123456', ()),  # Narrow: a handful of names, besides a word every donor shares
+    ('donor 12', 'donor-12', ()),  # Broad prefix: thousands of names
+    ('gen', 'gen', ()),  # Matches every donor
+    ('donor 99', 'donor-99', ('AB-',)),  # Broad prefix, rare blood type
+    ('nobody', 'nobody', ()),  # No match
+]
+TRIGGERS = ['api_blooddonor_fts_insert', 'api_blooddonor_fts_delete', 'api_blooddonor_fts_update']
+
+
+def like_search(query, blood_type_ids):
+    donors = BloodDonor.objects.filter(donor_name__icontains=query)
+    if blood_type_ids:
+        donors = donors.filter(blood_type_id__in=blood_type_ids)
+    return list(donors.order_by('id').values_list(*DonorValuesSerializer.columns())[:PAGE_SIZE])
+
+
+def timed_insert(rng, count, start, blood_type_ids):
+    rows = [(f'extra-{start + i}', blood_type_id, units, last_donated)
+            for i, (_, blood_type_id, units, last_donated) in enumerate(generate_donors(rng, count, 'x',
+                                                                                        blood_type_ids))]
+    return measure(lambda: insert_donors(rows), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--donors', type=int, default=2000000)
+    parser.add_argument('--insert-rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        blood_type_ids = {name: BloodType.objects.create(name=name).id for name, _ in BloodType.BLOOD_TYPE_CHOICES}
+        rng = random.Random(0)
+        insert_donors(generate_donors(rng, args.donors, 'gen', blood_type_ids))
+        print(f"{args.donors} donors loaded")
+
+        for query, pattern, blood_types in QUERIES:
+            ids = [blood_type_registry.get_id(name) for name in blood_types]
+            expression = match_expression(query)
+            found = len(search_donors(expression, ids, PAGE_SIZE)[0])
+            label = f"'{query}'" + (f" blood_type={','.join(blood_types)}" if blood_types else '')
+            report(f"FTS5   {label} ({found} rows)",
+                   measure(lambda: search_donors(expression, ids, PAGE_SIZE), args.repeat))
+            report(f"LIKE   {label} ({len(like_search(pattern, ids))} rows)",
+                   measure(lambda: like_search(pattern, ids), max(1, args.repeat // 10)))
+
+        with_triggers = timed_insert(rng, args.insert_rows, 0, blood_type_ids)
+        with connection.cursor() as cursor:
+            for trigger in TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {trigger}')
+        without_triggers = timed_insert(rng, args.insert_rows, args.insert_rows, blood_type_ids)
+        print(f"inserting {args.insert_rows} donors: {with_triggers[0]:.2f} s with the sync triggers, "
+              f"{without_triggers[0]:.2f} s without")
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Memory and throughput of export_donors for growing table sizes.
+
+For every size in --sizes the donor table is filled up to that many rows and the whole CSV export is read through
+the test client while tracemalloc records the peak. The peak should stay the same whatever the table size.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from common import create_database
+
+from django.contrib.auth.models import User
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import BloodDonor, BloodType
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50_000, 200_000, 500_000])
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        blood_types = [BloodType.objects.create(name=name) for name, _ in BloodType.BLOOD_TYPE_CHOICES]
+        admin = User.objects.create(username='bench-admin', is_staff=True)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(admin).access_token}')
+        b"".join(client.get('/export_donors').streaming_content)  # Warm up imports, so they don't count as peak
+
+        for size in sorted(args.sizes):
+            existing = BloodDonor.objects.count()
+            BloodDonor.objects.bulk_create(
+                (BloodDonor(donor_name=f"d{i}", blood_type=blood_types[i % len(blood_types)], units_donated=1)
+                 for i in range(existing, size)), batch_size=5000)
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            response = client.get('/export_donors')
+            size_bytes = sum(len(chunk) for chunk in response.streaming_content)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{size:>9} donors: {size_bytes / 2 ** 20:6.1f} MiB of CSV in {elapsed:6.2f} s, "
+                  f"peak memory {peak / 2 ** 20:.1f} MiB")
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Inventory stream: --clients SSE clients on async/inventory_stream, driven straight through bloodbank/asgi.py's
+application in one event loop, while a writer changes a quantity every --write-interval seconds.
+
+Prints the delay from each committed write to each client receiving its `inventory` event, the inventory reads made
+for all clients together against what --clients terminals polling get_bloodinventory every 5 s would make, and that a
+client that reads slowly neither delays the others nor queues up events. Ends by disconnecting every client and
+checking they were all unsubscribed.
+"""
+
+import argparse
+import asyncio
+import time
+
+from common import create_database, percentile
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import streams
+from api.models import BloodInventory, BloodType
+from api.streams import inventory_broadcaster
+from bloodbank.asgi import application
+
+TERMINAL_POLL_INTERVAL = 5.0
+SLOW_CLIENT_DELAY = 2.0  # Seconds the slow client takes to read each message
+
+
+class Client:
+    def __init__(self, token, delay=0.0):
+        self.token = token
+        self.delay = delay
+        self.events = []  # (receive time, body)
+        self.disconnect = asyncio.Event()
+        self.requested = False
+
+    async def receive(self):  # The (empty) request body, then a disconnect once told to
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.body' and message.get('body'):
+            self.events.append((time.perf_counter(), message['body']))
+            await asyncio.sleep(self.delay)
+
+    async def run(self):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': '/async/inventory_stream', 'raw_path': b'/async/inventory_stream', 'query_string': b'',
+            'headers': [(b'authorization', f'Bearer {self.token}'.encode()), (b'host', b'testserver')],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+        await application(scope, self.receive, self.send)
+
+
+def quantity_in(body, name):  # Quantity of `name` in an inventory event, None for other messages
+    text = body.decode()
+    if not text.startswith('event: inventory'):
+        return None
+    marker = f'"blood_type": "{name}", "quantity": '
+    return int(text.split(marker)[1].split('}')[0]) if marker in text else None
+
+
+async def run(args, token, inventory_id, reads):
+    clients = [Client(token) for _ in range(args.clients)] + [Client(token, SLOW_CLIENT_DELAY)]
+    tasks = [asyncio.create_task(client.run()) for client in clients]
+    while len(inventory_broadcaster.subscribers) < len(clients):
+        await asyncio.sleep(0.05)
+    print(f"{len(clients)} clients subscribed")
+
+    writes = []  # (quantity, commit time)
+    reads_before = len(reads)
+    start = time.perf_counter()
+    for quantity in range(1, args.writes + 1):
+        await asyncio.sleep(args.write_interval)
+        await sync_to_async(BloodInventory.objects.filter(pk=inventory_id).update)(quantity=quantity)
+        writes.append((quantity, time.perf_counter()))
+    await asyncio.sleep(2 * args.poll_interval)
+    elapsed = time.perf_counter() - start
+    stream_reads = len(reads) - reads_before
+
+    delays, missed = [], 0
+    for client in clients[:-1]:
+        received = {}
+        for received_at, body in client.events:
+            quantity = quantity_in(body, 'A+')
+            if quantity is not None:
+                received.setdefault(quantity, received_at)
+        for quantity, committed_at in writes:
+            if quantity in received:
+                delays.append(received[quantity] - committed_at)
+            else:
+                missed += 1
+    print(f"write to event delay: p50 {percentile(delays, 0.5) * 1000:.0f} ms, "
+          f"p95 {percentile(delays, 0.95) * 1000:.0f} ms, max {max(delays) * 1000:.0f} ms "
+          f"over {len(delays)} deliveries, {missed} superseded before the next read (coalesced)")
+    print(f"inventory reads: {stream_reads} for all clients in {elapsed:.1f} s, polling terminals would make "
+          f"{args.clients * elapsed / TERMINAL_POLL_INTERVAL:.0f}")
+    pending = max(len(subscriber.pending) for subscriber in inventory_broadcaster.subscribers)
+    print(f"slow client: {len(clients[-1].events)} messages read, at most {pending} blood types pending for any client")
+
+    for client in clients:
+        client.disconnect.set()
+    await asyncio.gather(*tasks)
+    print(f"subscribers after disconnecting: {len(inventory_broadcaster.subscribers)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--writes', type=int, default=20)
+    parser.add_argument('--write-interval', type=float, default=0.5)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    destroy = create_database(file_based=True)
+    try:
+        user = User.objects.create(username='bench-ward')
+        token = str(AccessToken.for_user(user))
+        inventory = BloodInventory.objects.create(blood_type=BloodType.objects.create(name='A+'), quantity=0)
+        for name in ('B+', 'O-'):
+            BloodInventory.objects.create(blood_type=BloodType.objects.create(name=name), quantity=10)
+
+        reads = []
+        read_levels = streams.read_levels
+
+        async def counted_read_levels():
+            reads.append(time.perf_counter())
+            return await read_levels()
+
+        streams.read_levels = counted_read_levels
+        with override_settings(INVENTORY_STREAM_POLL_INTERVAL=args.poll_interval):
+            asyncio.run(run(args, token, inventory.id, reads))
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
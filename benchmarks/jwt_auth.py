@@ -0,0 +1,61 @@
+"""
+Cost of authenticating a request with simplejwt's JWTAuthentication and with CachedJWTAuthentication.
+
+Sends the same authenticated GET get_bloodinventory request --requests times with each authentication class and
+reports the latency and the auth_user queries per request. The views bind their authentication classes when they are
+decorated, so the benchmark swaps the class on every routed view.
+"""
+
+import argparse
+
+from common import create_database, measure, report
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.authentication import CachedJWTAuthentication, user_cache
+from api.models import BloodInventory, BloodType
+from bloodbank.urls import urlpatterns
+
+
+def use_authentication(authentication_class):
+    for pattern in urlpatterns:
+        view_class = getattr(pattern.callback, 'cls', None)
+        if view_class is not None:
+            view_class.authentication_classes = [authentication_class]
+    user_cache.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        for name, _ in BloodType.BLOOD_TYPE_CHOICES:
+            BloodInventory.objects.create(blood_type=BloodType.objects.create(name=name), quantity=10)
+        admin = User.objects.create(username='bench-admin', is_staff=True)
+        client = Client(headers={'Authorization': f'Bearer {RefreshToken.for_user(admin).access_token}'})
+
+        def request():
+            assert client.get('/get_bloodinventory').status_code == 200
+
+        for authentication_class in (JWTAuthentication, CachedJWTAuthentication):
+            use_authentication(authentication_class)
+            request()  # Warm up
+            with CaptureQueriesContext(connection) as queries:
+                samples = measure(request, args.requests)
+            user_queries = sum('FROM "auth_user"' in query['sql'] for query in queries.captured_queries)
+            report(authentication_class.__name__, samples)
+            print(f"{'':<48} {user_queries / args.requests:.2f} auth_user queries per request")
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
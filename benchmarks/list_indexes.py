@@ -0,0 +1,84 @@
+"""
+Latency of the admin list queries with and without the indexes added in migration 0007.
+
+Seeds donors and blood requests, times the queries behind getall_donors/ and get_all_blood_request/ with the
+indexes in place, then drops the indexes (and goes back to the old `status__icontains` filter) and times
+them again.
+"""
+
+import argparse
+import random
+from datetime import date, timedelta
+
+from common import create_database, measure, report
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from api.models import BloodDonor, BloodRequest, BloodType
+
+
+def seed(donors, requests):
+    rng = random.Random(0)
+    blood_types = [BloodType.objects.create(name=name) for name, _ in BloodType.BLOOD_TYPE_CHOICES]
+    user = User.objects.create(username='bench')
+    start = date(2020, 1, 1)
+
+    BloodDonor.objects.bulk_create(
+        (BloodDonor(donor_name=f"d{i}", blood_type=rng.choice(blood_types), units_donated=1,
+                    last_donated=start + timedelta(days=rng.randrange(1800))) for i in range(donors)),
+        batch_size=5000)
+    BloodRequest.objects.bulk_create(
+        (BloodRequest(user=user, blood_type=rng.choice(blood_types), units_requested=rng.randint(1, 4),
+                      status=BloodRequest.PENDING if rng.random() < 0.1 else BloodRequest.FULFILLED)
+         for _ in range(requests)),
+        batch_size=5000)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return blood_types
+
+
+def run(label, queries, repeat):
+    for name, query in queries:
+        report(f"{label}: {name}", measure(lambda: list(query()), repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--donors', type=int, default=200_000)
+    parser.add_argument('--requests', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        blood_types = seed(args.donors, args.requests)
+        page = slice(5000, 5005)  # A deep page, like ?page=1001
+
+        after = [
+            ('donors ordered', lambda: BloodDonor.objects.order_by('-last_donated')[page]),
+            ('donors of one blood type', lambda: BloodDonor.objects.filter(
+                blood_type_id__in=[blood_types[0].id]).order_by('-last_donated')[page]),
+            ('pending requests', lambda: BloodRequest.objects.filter(
+                status=BloodRequest.PENDING).order_by('id')[page]),
+        ]
+        run('after ', after, args.repeat)
+
+        with connection.schema_editor() as schema_editor:
+            for model in (BloodDonor, BloodRequest):
+                for index in model._meta.indexes:
+                    schema_editor.remove_index(model, index)
+
+        before = [
+            ('donors ordered', lambda: BloodDonor.objects.order_by('-last_donated')[page]),
+            ('donors of one blood type', lambda: BloodDonor.objects.filter(
+                blood_type__name__icontains=blood_types[0].name).order_by('-last_donated')[page]),
+            ('pending requests', lambda: BloodRequest.objects.filter(status__icontains='pending')[page]),
+        ]
+        run('before', before, args.repeat)
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
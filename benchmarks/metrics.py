@@ -0,0 +1,70 @@
+"""
+Cost of recording request metrics (api.metrics) from many threads, and of a /metrics scrape.
+
+Compares RequestMetrics, where every thread counts into its own shard, with the same counters behind one shared
+lock, for 1 to --threads threads each recording --observations requests. Then times render_metrics over the
+recorded data.
+"""
+
+import argparse
+import threading
+import time
+
+from common import create_database, measure, report
+
+from api.metrics import RequestMetrics, render_metrics, request_metrics
+
+VIEWS = ['get_all_donors', 'get_blood_inventory', 'view_all_bloodrequest', 'approve_request']
+
+
+class LockedRequestMetrics(RequestMetrics):  # The same counters, one lock around every update
+    def __init__(self):
+        super().__init__()
+        self._update_lock = threading.Lock()
+
+    def observe(self, *args):
+        with self._update_lock:
+            super().observe(*args)
+
+    def _shard(self):  # One shard for everyone, collected like the retired shard of ended threads
+        return self._retired
+
+
+def run(metrics, threads, observations):
+    def record():
+        for i in range(observations):
+            metrics.observe(VIEWS[i % len(VIEWS)], 'GET', 200, 0.003, 2)
+
+    workers = [threading.Thread(target=record) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * observations / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--observations', type=int, default=100_000)
+    args = parser.parse_args()
+
+    threads = 1
+    while threads <= args.threads:
+        sharded = run(RequestMetrics(), threads, args.observations)
+        locked = run(LockedRequestMetrics(), threads, args.observations)
+        print(f"{threads:>2} threads: per-thread shards {sharded:12,.0f} observations/s   "
+              f"one lock {locked:12,.0f} observations/s")
+        threads *= 2
+
+    destroy = create_database()
+    try:
+        run(request_metrics, args.threads, args.observations)
+        report('render_metrics', measure(render_metrics, 200))
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Per-row cost of the list serializers: model instances through DonorSerializer / BloodRequestSerializer, against
+values_list() tuples through DonorValuesSerializer / BloodRequestValuesSerializer.
+
+Both paths are timed end to end (query, row construction, serialization) and for the serialization step alone, over
+the same rows. The rendered JSON of both paths is compared byte for byte.
+"""
+
+import argparse
+
+from common import create_database, measure, percentile
+
+from django.contrib.auth.models import User
+from rest_framework.renderers import JSONRenderer
+
+from api.models import BloodDonor, BloodRequest, BloodType
+from api.serializers import BloodRequestSerializer, BloodRequestValuesSerializer, DonorSerializer, \
+    DonorValuesSerializer
+
+
+def report_per_row(label, samples, rows):
+    print(f"{label:<52} {percentile(samples, 0.5) * 1e6 / rows:7.2f} us/row   "
+          f"({percentile(samples, 0.5) * 1000:8.2f} ms for {rows} rows)")
+
+
+def compare(label, queryset, serializer_class, values_serializer_class, repeat):
+    columns = values_serializer_class.columns()
+    instances = list(queryset.all())  # all() every time, so no run reuses the result cache of another
+    rows = list(queryset.values_list(*columns))
+
+    same = (JSONRenderer().render(serializer_class(instances, many=True).data) ==
+            JSONRenderer().render(values_serializer_class(rows).data))
+    print(f"{label}: rendered JSON {'identical' if same else 'DIFFERENT'}")
+
+    report_per_row(f"  {serializer_class.__name__}, query + serialize",
+                   measure(lambda: serializer_class(list(queryset.all()), many=True).data, repeat), len(rows))
+    report_per_row(f"  {values_serializer_class.__name__}, query + serialize",
+                   measure(lambda: values_serializer_class(list(queryset.values_list(*columns))).data, repeat),
+                   len(rows))
+    report_per_row(f"  {serializer_class.__name__}, serialize only",
+                   measure(lambda: serializer_class(instances, many=True).data, repeat), len(rows))
+    report_per_row(f"  {values_serializer_class.__name__}, serialize only",
+                   measure(lambda: values_serializer_class(rows).data, repeat), len(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        user = User.objects.create(username='bench-user')
+        blood_types = [BloodType.objects.create(name=name) for name, _ in BloodType.BLOOD_TYPE_CHOICES]
+        BloodDonor.objects.bulk_create(
+            BloodDonor(donor_name=f'bench-{i}', blood_type=blood_types[i % len(blood_types)], units_donated=i % 4,
+                       last_donated=None if i % 10 == 0 else f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}')
+            for i in range(args.rows))
+        BloodRequest.objects.bulk_create(
+            BloodRequest(user=user, blood_type=blood_types[i % len(blood_types)], units_requested=i % 4 + 1,
+                         status=BloodRequest.PENDING if i % 3 else BloodRequest.FULFILLED)
+            for i in range(args.rows))
+
+        compare('donors', BloodDonor.objects.select_related('blood_type').order_by('id'), DonorSerializer,
+                DonorValuesSerializer, args.repeat)
+        compare('blood requests', BloodRequest.objects.select_related('blood_type').order_by('id'),
+                BloodRequestSerializer, BloodRequestValuesSerializer, args.repeat)
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Overhead of the Server-Timing instrumentation (api.timing) on the read endpoints.
+
+Sends the same requests with the instrumentation on (as configured in settings) and off (without
+ServerTimingMiddleware and without the database execute wrapper), alternating between the two so both see the same
+machine state. The serializer and renderer hooks stay in place for both: outside a request they only look up a
+context variable.
+"""
+
+import argparse
+from datetime import date, timedelta
+
+from common import create_database, measure, report
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import BloodDonor, BloodInventory, BloodType
+from api.timing import time_queries
+
+PATHS = ['/getall_donors/?page=3', '/get_bloodinventory', '/async/getall_donors/?page=3']
+
+
+def seed():
+    blood_types = [BloodType.objects.create(name=name) for name, _ in BloodType.BLOOD_TYPE_CHOICES]
+    for blood_type in blood_types:
+        BloodInventory.objects.create(blood_type=blood_type, quantity=10)
+    BloodDonor.objects.bulk_create(
+        BloodDonor(donor_name=f"d{i}", blood_type=blood_types[i % 8], units_donated=1,
+                   last_donated=date(2024, 1, 1) + timedelta(days=i % 300)) for i in range(5000))
+    return User.objects.create(username='bench-admin', is_staff=True)
+
+
+def sample(client, path, timer_installed):
+    if timer_installed:
+        connection.execute_wrappers.append(time_queries)
+    try:
+        return measure(lambda: client.get(path), 1)[0]
+    finally:
+        if timer_installed:
+            connection.execute_wrappers.remove(time_queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        admin = seed()
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(admin)}'}
+        connection.execute_wrappers.remove(time_queries)  # Installed per sample below
+
+        on = Client(headers=headers)
+        off = Client(headers=headers)
+        middleware = [name for name in settings.MIDDLEWARE if name != 'api.timing.ServerTimingMiddleware']
+        with override_settings(MIDDLEWARE=middleware):
+            off.get(PATHS[0])  # The client's handler loads the middleware on its first request
+        assert 'Server-Timing' not in off.get(PATHS[0]) and 'Server-Timing' in on.get(PATHS[0])
+
+        for path in PATHS:
+            samples = {True: [], False: []}
+            for _ in range(args.repeat):
+                samples[True].append(sample(on, path, True))
+                samples[False].append(sample(off, path, False))
+            report(f"on : {path}", samples[True])
+            report(f"off: {path}", samples[False])
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Mixed reads and writes from many threads, with the development and the production database profile.
+
+Every thread sends admin requests through the test client for a fixed time: mostly list reads (getall_donors,
+get_bloodinventory, get_all_blood_request) and some writes (request_blood and approve_request, which updates two
+tables in one transaction). Each profile runs in its own process because BLOODBANK_DATABASE_PROFILE is read when the
+settings load, on a file database so the threads share it. Printed per profile: requests per second, read and write
+latency, and requests that failed with "database is locked".
+
+    python benchmarks/sqlite_profile.py --threads 8 --seconds 10
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+
+def run_profile(args):
+    from common import create_database, percentile
+
+    from django.contrib.auth.models import User
+    from django.db import OperationalError, connection, connections
+    from django.test import Client
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from api.database import READ_DATABASE
+    from api.models import BloodDonor, BloodInventory, BloodRequest, BloodType
+
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)  # Locked requests are counted, not printed
+
+    destroy = create_database(file_based=True)
+    if READ_DATABASE in connections.settings:
+        connections[READ_DATABASE].creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        admin = User.objects.create(username='bench-admin', is_staff=True)
+        regular = User.objects.create(username='bench-regular', is_staff=False)
+        blood_types = [BloodType.objects.create(name=name) for name, _ in BloodType.BLOOD_TYPE_CHOICES]
+        for blood_type in blood_types:
+            BloodInventory.objects.create(blood_type=blood_type, quantity=10 ** 6)
+        rng = random.Random(0)
+        BloodDonor.objects.bulk_create(
+            (BloodDonor(donor_name=f'bench-{i}', blood_type=rng.choice(blood_types), units_donated=1)
+             for i in range(args.donors)), batch_size=5000)
+        pending = BloodRequest.objects.bulk_create(
+            (BloodRequest(user=regular, blood_type=rng.choice(blood_types), units_requested=1)
+             for _ in range(args.requests)), batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        connection.close()
+
+        tokens = {user: str(AccessToken.for_user(user)) for user in (admin, regular)}
+        to_approve = itertools.count()
+        reads = ('/getall_donors/?page=3', '/get_bloodinventory', '/get_all_blood_request/?q=pending')
+        samples = {'read': [], 'write': []}
+        locked = []
+        deadline = time.perf_counter() + args.seconds
+        barrier = threading.Barrier(args.threads)
+
+        def work(index):
+            rng = random.Random(index)
+            clients = {user: Client(headers={'Authorization': f'Bearer {token}'}) for user, token in tokens.items()}
+            barrier.wait()
+            try:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        if rng.random() >= args.write_share:
+                            kind = 'read'
+                            clients[admin].get(rng.choice(reads))
+                        elif rng.random() < 0.5:
+                            kind = 'write'
+                            clients[regular].post('/request_blood', {'blood_type': 'A+', 'units_requested': 1},
+                                                  content_type='application/json')
+                        else:
+                            kind = 'write'
+                            blood_request = pending[next(to_approve) % len(pending)]
+                            clients[admin].post(f'/approve_request/{blood_request.id}', {'status': True},
+                                                content_type='application/json')
+                    except OperationalError:  # "database is locked"
+                        locked.append(kind)
+                        continue
+                    samples[kind].append(time.perf_counter() - start)
+            finally:
+                for alias in connections:
+                    connections[alias].close()  # Every thread has its own connections
+
+        workers = [threading.Thread(target=work, args=(index,)) for index in range(args.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        completed = len(samples['read']) + len(samples['write'])
+        print(f"{os.environ['BLOODBANK_DATABASE_PROFILE']} profile (journal_mode={journal_mode}): "
+              f"{completed / args.seconds:.0f} requests/s, "
+              f"{locked.count('read')} reads and {locked.count('write')} writes failed with 'database is locked'")
+        for kind in ('read', 'write'):
+            if samples[kind]:
+                print(f"  {kind:<6} {len(samples[kind]):6d} requests   p50 {percentile(samples[kind], 0.5) * 1000:8.2f} ms"
+                      f"   p99 {percentile(samples[kind], 0.99) * 1000:8.2f} ms"
+                      f"   max {max(samples[kind]) * 1000:8.2f} ms")
+    finally:
+        destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--donors', type=int, default=50000)
+    parser.add_argument('--requests', type=int, default=20000, help='pending blood requests for approve_request')
+    parser.add_argument('--write-share', type=float, default=0.2)
+    parser.add_argument('--profile', choices=('development', 'production'), help='run one profile in this process')
+    args = parser.parse_args()
+
+    if args.profile:
+        os.environ['BLOODBANK_DATABASE_PROFILE'] = args.profile
+        run_profile(args)
+        return
+    for profile in ('development', 'production'):
+        subprocess.run([sys.executable, *sys.argv, '--profile', profile], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Blood type summary: reading the per blood type totals from BloodTypeSummary against computing them with COUNT / SUM
+over the blood requests, at millions of requests.
+
+Loads --requests synthetic blood requests (see api/synthetic.py) and a stocked inventory, checks the trigger maintained
+summary matches the recomputed totals, then times both reads and a full `repair_summary` rebuild. Also prints what the
+summary costs on writes: the time to insert --insert-rows more requests with and without the triggers.
+"""
+
+import argparse
+import random
+
+from common import create_database, measure, report
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from api.models import BloodInventory, BloodType
+from api.summary import rebuild_summary, source_totals, summary_rows
+from api.synthetic import generate_blood_requests, insert_blood_requests
+
+TRIGGERS = ['api_bloodtypesummary_request_insert', 'api_bloodtypesummary_request_update',
+            'api_bloodtypesummary_request_delete']
+
+
+def timed_insert(rng, count, user_ids, blood_type_ids):
+    rows = list(generate_blood_requests(rng, count, user_ids, blood_type_ids))
+    return measure(lambda: insert_blood_requests(rows), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000000)
+    parser.add_argument('--insert-rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        blood_type_ids = {name: BloodType.objects.create(name=name).id for name, _ in BloodType.BLOOD_TYPE_CHOICES}
+        BloodInventory.objects.bulk_create([BloodInventory(blood_type_id=blood_type_id, quantity=1000)
+                                            for blood_type_id in blood_type_ids.values()])
+        user_ids = [User.objects.create(username=f'bench-user-{i}').id for i in range(100)]
+        rng = random.Random(0)
+        insert_blood_requests(generate_blood_requests(rng, args.requests, user_ids, blood_type_ids))
+        print(f"{args.requests} blood requests loaded")
+
+        same = rebuild_summary() == {}
+        report(f"summary table ({'matches' if same else 'DIFFERS from'} the requests)",
+               measure(summary_rows, args.repeat))
+        report("COUNT / SUM over the requests", measure(source_totals, max(1, args.repeat // 10)))
+        report("repair_summary rebuild", measure(rebuild_summary, max(1, args.repeat // 10)))
+
+        with_triggers = timed_insert(rng, args.insert_rows, user_ids, blood_type_ids)
+        with connection.cursor() as cursor:
+            for trigger in TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {trigger}')
+        without_triggers = timed_insert(rng, args.insert_rows, user_ids, blood_type_ids)
+        print(f"inserting {args.insert_rows} blood requests: {with_triggers[0]:.2f} s with the summary triggers, "
+              f"{without_triggers[0]:.2f} s without")
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Blacklist checks and compaction of the token tables.
+
+Seeds --tokens outstanding tokens, --blacklisted of them blacklisted and --expired of them already expired, then
+times verifying a token that isn't blacklisted with simplejwt's RefreshToken (one join query) and with
+CachedRefreshToken (answered by the in-memory filter), and finally deleting the expired tokens with
+flush_expired_tokens.
+"""
+
+import argparse
+import time
+from datetime import timedelta
+
+from common import create_database, measure, report
+
+from django.contrib.auth.models import User
+from django.db import connection
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from api.tokens import CachedRefreshToken, blacklist_filter, flush_expired_tokens
+
+
+def seed(tokens, blacklisted, expired):
+    user = User.objects.create(username='bench')
+    now = aware_utcnow()
+    OutstandingToken.objects.bulk_create(
+        (OutstandingToken(user=user, jti=f"jti-{i}", token='',
+                          expires_at=now - timedelta(days=1) if i < expired else now + timedelta(days=7))
+         for i in range(tokens)),
+        batch_size=5000)
+    BlacklistedToken.objects.bulk_create(
+        (BlacklistedToken(token_id=pk) for pk in
+         OutstandingToken.objects.order_by('-id').values_list('id', flat=True)[:blacklisted].iterator()),
+        batch_size=5000)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tokens', type=int, default=500_000)
+    parser.add_argument('--blacklisted', type=int, default=250_000)
+    parser.add_argument('--expired', type=int, default=400_000)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        user = seed(args.tokens, args.blacklisted, args.expired)
+        simplejwt_token = str(RefreshToken.for_user(user))
+        cached_token = str(CachedRefreshToken.for_user(user))
+
+        start = time.perf_counter()
+        blacklist_filter.contains('')
+        print(f"filter loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        report('verify, simplejwt blacklist query', measure(lambda: RefreshToken(simplejwt_token), args.repeat))
+        report('verify, blacklist filter', measure(lambda: CachedRefreshToken(cached_token), args.repeat))
+
+        start = time.perf_counter()
+        deleted = flush_expired_tokens()
+        print(f"flush_expired_tokens deleted {deleted} tokens in {time.perf_counter() - start:.2f} s, "
+              f"{OutstandingToken.objects.count()} outstanding / {BlacklistedToken.objects.count()} blacklisted left")
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
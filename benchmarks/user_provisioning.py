@@ -0,0 +1,59 @@
+"""
+Users per second created through user_register, one call per user, and through provision_users.
+
+provision_users runs once hashing in the calling process (--workers 1) and once with a pool of --workers processes
+(the number of CPUs by default). Passwords are hashed with the project's PASSWORD_HASHERS, so the numbers include
+the real PBKDF2 cost.
+"""
+
+import argparse
+import time
+
+from common import create_database
+
+from django.contrib.auth.models import User
+from django.test import Client
+
+from api.provisioning import default_workers, provision_users
+
+
+def rows(prefix, count):
+    return ((i + 1, {'username': f'{prefix}{i}', 'email': f'{prefix}{i}@example.com', 'password': f'secret-{i}'})
+            for i in range(count))
+
+
+def report(label, count, seconds):
+    print(f"{label:<40} {count} users in {seconds:7.2f} s   {count / seconds:8.2f} users/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=default_workers())
+    args = parser.parse_args()
+
+    destroy = create_database()
+    try:
+        client = Client()
+        start = time.perf_counter()
+        for _, row in rows('register', args.users):
+            response = client.post('/user_register', {**row, 'confirmPassword': row['password']},
+                                   content_type='application/json')
+            assert response.status_code == 201, response.content
+        report('user_register, one call per user', args.users, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        result = provision_users(rows('inline', args.users), workers=1)
+        report('provision_users, --workers 1', result.imported, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        result = provision_users(rows('pool', args.users), workers=args.workers)
+        report(f'provision_users, --workers {args.workers}', result.imported, time.perf_counter() - start)
+
+        assert User.objects.count() == args.users * 3
+    finally:
+        destroy()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import atexit
+import os
+import shutil
+import sys
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -46,7 +51,11 @@ INSTALLED_APPS = [
 # JWT Authentication
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.timing.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
 }
 
@@ -57,7 +66,28 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# Seconds between deletions of expired tokens by a background thread in every process, None to leave it to
+# `manage.py compact_tokens` (e.g. from cron)
+TOKEN_COMPACTION_INTERVAL = None
+
+# How long the change feed keeps the entries of deleted rows before `manage.py compact_changes` removes them. Clients
+# that last synced before that must sync again from the start
+CHANGE_LOG_RETENTION = timedelta(days=30)
+
+# When True approve_request queues approvals for `manage.py process_approvals` and answers 202 Accepted with a job id.
+# Clients can also ask for it per request with a `Prefer: respond-async` header
+APPROVAL_QUEUE = False
+
+# Seconds between the inventory reads behind async/inventory_stream (one read per process, shared by every client), and
+# without changes, between the heartbeats that find out dead connections
+INVENTORY_STREAM_POLL_INTERVAL = 1.0
+STREAM_HEARTBEAT_INTERVAL = 15
+
+# Prometheus metrics served at /metrics; when False nothing is recorded and /metrics answers 404
+METRICS_ENABLED = True
+
 MIDDLEWARE = [
+    'api.timing.ServerTimingMiddleware',  # First, so the total covers every other middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,6 +127,49 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+DATABASE_ROUTERS = ['api.database.ReadRouter']
+
+# BLOODBANK_DATABASE_PROFILE=production turns on the profile for concurrent use (see api/database.py): WAL journaling,
+# a busy timeout, write transactions that take the write lock when they begin, and a second 'read' connection to the
+# same file for the list views
+DATABASE_PROFILE = os.environ.get('BLOODBANK_DATABASE_PROFILE', 'development')
+SQLITE_PRAGMAS = {}  # Run on every new SQLite connection
+
+if DATABASE_PROFILE == 'production':
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+    DATABASES['read'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'busy_timeout': 20000,  # Milliseconds
+        'synchronous': 'NORMAL',  # Safe in WAL mode, a power loss can only lose the last commits
+        'cache_size': -65536,  # KiB per connection
+        'temp_store': 'MEMORY',
+    }
+
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Must be shared by every server process: the blood type registry, the token blacklist filter and the user cache keep
+# their data per process and learn about changes made by other workers from generation tokens stored here. Django's
+# default LocMemCache is private to each process, so another worker's changes would never be seen. The file based
+# cache is shared by every process on this host; with workers on several hosts use memcached or redis instead
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('BLOODBANK_CACHE_DIR', BASE_DIR / '.cache'),
+    }
+}
+
+# `manage.py test` gets a cache of its own, removed when it exits, so a test run never rewrites the generation tokens
+# of a server running from the same folder. Processes started by the tests are pointed at it with BLOODBANK_CACHE_DIR
+if sys.argv[1:2] == ['test']:
+    CACHES['default']['LOCATION'] = tempfile.mkdtemp(prefix='bloodbank-test-cache-')
+    atexit.register(shutil.rmtree, CACHES['default']['LOCATION'], ignore_errors=True)
 
 
 # Password validation
@@ -16,7 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from api import views
+from api import async_views, views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -24,25 +24,48 @@ urlpatterns = [
     path('user_register', views.user_register, name='user_register'),
     path('user_login', views.user_login, name='user_login'),
     path('user_logout', views.user_logout, name='user_logout'),
+    path('provision_users', views.provision_users, name='provision_users'),
 
     # Url for adding blood type to database
     path('add_bloodtype', views.add_blood_type, name='add_blood_type'),
 
     # Urls for Adding, Updating, Deleting, Fetching from BloodDonor
     path('add_donor', views.add_donor, name='add_donor'),
+    path('import_donors', views.import_donors, name='import_donors'),
     path('update_donor/<int:id>', views.update_donor, name='update_donor'),
     path('delete_donor/<int:id>', views.delete_donor, name='delete_donor'),
     path('getall_donors/', views.get_all_donors, name='get_all_donors'),
+    path('search_donors', views.search_donors, name='search_donors'),
+    path('export_donors', views.export_donors, name='export_donors'),
 
     # Urls for Adding, Updating, Fetching from BloodInventory
     path('get_bloodinventory', views.get_blood_inventory, name='get_blood_inventory'),
     path('add_to_bloodinventory', views.add_to_bloodinventory, name='add_to_bloodinventory'),
     path('update_units/<int:id>', views.update_bloodinventory, name='update_bloodinventory'),
+    path('summary', views.summary, name='summary'),
+    path('changes', views.changes, name='changes'),
 
     # Url for Requesting Blood fro regular users
     path('request_blood', views.request_blood, name='request_blood'),
 
     # Urls for Fetching and Approving Blood Requestslogout
     path('get_all_blood_request/', views.view_all_bloodrequest, name='view_all_bloodrequest'),
-    path('approve_request/<int:id>', views.approve_request, name='approve_request')
+    path('approve_request/<int:id>', views.approve_request, name='approve_request'),
+    path('approval_jobs/<int:id>', views.approval_job, name='approval_job'),
+    path('compatible_donors/<int:id>', views.compatible_donors, name='compatible_donors'),
+    path('allocate_requests', views.allocate_requests, name='allocate_requests'),
+    path('export_blood_requests', views.export_blood_requests, name='export_blood_requests'),
+
+    # Url for running several of the write endpoints above in one request and one transaction
+    path('batch', views.batch, name='batch'),
+
+    # Urls for the rolling per-view timings collected by api.timing.ServerTimingMiddleware, and Prometheus metrics
+    path('view_timings', views.view_timings, name='view_timings'),
+    path('metrics', views.metrics, name='metrics'),
+
+    # Native async versions of the read endpoints, for serving through bloodbank/asgi.py
+    path('async/get_bloodinventory', async_views.get_blood_inventory, name='get_blood_inventory_async'),
+    path('async/getall_donors/', async_views.get_all_donors, name='get_all_donors_async'),
+    path('async/get_all_blood_request/', async_views.view_all_bloodrequest, name='view_all_bloodrequest_async'),
+    path('async/inventory_stream', async_views.inventory_stream, name='inventory_stream'),
 ]